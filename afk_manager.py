@@ -18,42 +18,95 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
-from consts import AFK_COUNT
+from consts import AFK_COUNT, AFK_TICK
+from utils import irc_lower
 from gi.repository import GObject
 
 
 class AFKManager(GObject.GObject):
 
+    # A timer wheel: every nickname waits on the slot of the tick when it
+    # goes AFK, and a single timeout moves over the slots
+
     __gsignals__ = {
-        "user-afk": (GObject.SIGNAL_RUN_FIRST, None, [str]),  # Nickname
-        "user-back": (GObject.SIGNAL_RUN_FIRST, None, [str]),  # Nickname
+        "user-afk": (GObject.SIGNAL_RUN_FIRST, None, [object]),  # Nicknames list
+        "user-back": (GObject.SIGNAL_RUN_FIRST, None, [object]),  # Nicknames list
     }
 
     def __init__(self):
         GObject.GObject.__init__(self)
 
-        self.timeout_ids = { }  # Nickname: id
+        self.tick = 0
+        self.deadlines = { }  # irc_lower(nickname): tick when it goes AFK, None if AFK
+        self.slots = [set() for x in range(AFK_COUNT // AFK_TICK)]
+        self.back = [ ]  # Nicknames to emit on "user-back"
 
-    def stop_counting(self, nickname):
-        if nickname in self.timeout_ids.keys() and self.timeout_ids[nickname] != None:
-            GObject.source_remove(self.timeout_ids[nickname])
+        self._tick_id = None
+        self._back_id = None
 
     def start_counting(self, nickname, restart=True):
-        if not nickname in self.timeout_ids.keys() or restart:
-            if nickname in self.timeout_ids.keys():
-                self.emit("user-back", nickname)
+        nickname = irc_lower(nickname)
+        deadline = self.deadlines.get(nickname, -1)
+        if deadline != -1 and not restart:
+            return
+
+        if deadline is None:
+            self.back.append(nickname)
+            if self._back_id is None:
+                self._back_id = GObject.idle_add(self._back_cb)
+
+        elif deadline != -1:
+            self.slots[deadline % len(self.slots)].discard(nickname)
+
+        deadline = self.tick + len(self.slots)
+        self.deadlines[nickname] = deadline
+        self.slots[deadline % len(self.slots)].add(nickname)
 
-            self.stop_counting(nickname)
-            id = GObject.timeout_add(AFK_COUNT, self._afk_cb, nickname)
-            self.timeout_ids[nickname] = id
+        if self._tick_id is None:
+            self._tick_id = GObject.timeout_add(AFK_TICK, self._tick_cb)
 
     def remove_nickname(self, nickname):
-        if nickname in self.timeout_ids.keys():
-            self.stop_counting(nickname)
-            self.timeout_ids.pop(nickname)
+        nickname = irc_lower(nickname)
+        deadline = self.deadlines.pop(nickname, None)
+        if deadline is not None:
+            self.slots[deadline % len(self.slots)].discard(nickname)
+
+    def _tick_cb(self):
+        self.tick += 1
+
+        slot = self.slots[self.tick % len(self.slots)]
+        if slot:
+            nicknames = list(slot)
+            slot.clear()
+
+            for nickname in nicknames:
+                self.deadlines[nickname] = None
 
-    def _afk_cb(self, nickname):
-        self.emit("user-afk", nickname)
-        self.timeout_ids[nickname] = None
+            self.emit("user-afk", nicknames)
+
+        if not any(self.slots):
+            # Nobody to wait for, start_counting starts the ticks again
+            self._tick_id = None
+            return False
+
+        return True
+
+    def _back_cb(self):
+        nicknames = self.back
+        self.back = [ ]
+        self._back_id = None
+
+        self.emit("user-back", nicknames)
 
         return False
+
+    def stop(self):
+        for source_id in (self._tick_id, self._back_id):
+            if source_id is not None:
+                GObject.source_remove(source_id)
+
+        self._tick_id = None
+        self._back_id = None
+        self.deadlines = { }
+        self.slots = [set() for x in range(len(self.slots))]
+        self.back = [ ]
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+# Lines per second through IRCClient.lineReceived, with the handlers found
+# on the dispatch table bound to the client and with the getattr lookup
+# it replaced.
+#
+#   python benchmarks/dispatch.py [--lines N]
+
+from __future__ import print_function
+
+import gc
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from twisted.test.proto_helpers import StringTransport
+from twisted.words.protocols import irc
+
+TRAFFIC = [
+    ":nick%d!user@host PRIVMSG #channel :hello there, how are you?",
+    ":nick%d!user@host JOIN #channel",
+    ":nick%d!user@host QUIT :Ping timeout",
+    ":server 352 me #channel user host server nick%d H :0 Real Name",
+    ":server 353 me = #channel :@nick%d +other third",
+    ":server 372 me :- message of the day %d",
+    ":nick%d!user@host NOTICE me :notice",
+    ":server 999 me %d :unknown numeric",
+]
+
+
+class Client(irc.IRCClient):
+    # Handlers that do nothing, so only parsing and dispatch are measured
+    performLogin = 0
+
+    def irc_unknown(self, prefix, command, params):
+        pass
+
+    def privmsg(self, user, channel, message):
+        pass
+
+    def noticed(self, user, channel, message):
+        pass
+
+
+class GetattrClient(Client):
+    # The dispatch before the tables
+
+    def lineReceived(self, line):
+        line = irc.lowDequote(line)
+        prefix, command, params = irc.parsemsg(line)
+        if command in irc.numeric_to_symbolic:
+            command = irc.numeric_to_symbolic[command]
+        self.handleCommand(command, prefix, params)
+
+    def handleCommand(self, command, prefix, params):
+        method = getattr(self, "irc_%s" % command, None)
+        if method is not None:
+            method(prefix, params)
+        else:
+            self.irc_unknown(prefix, command, params)
+
+
+def measure(classes, lines, batch=2000, repeat=5):
+    # Lines per second of each client class. Every batch of lines counts
+    # its fastest run, the clients take turns, and the collector is off
+    # like in timeit, so a busy machine moves the results less
+    clients = []
+    for cls in classes:
+        client = cls()
+        client.makeConnection(StringTransport())
+        clients.append(client)
+
+    totals = [0.0] * len(clients)
+    gc.collect()
+    gc.disable()
+    try:
+        for first in range(0, len(lines), batch):
+            chunk = lines[first:first + batch]
+            best = [None] * len(clients)
+            for run in range(repeat):
+                for index, client in enumerate(clients):
+                    start = time.time()
+                    for line in chunk:
+                        client.lineReceived(line)
+
+                    elapsed = time.time() - start
+                    if best[index] is None or elapsed < best[index]:
+                        best[index] = elapsed
+
+            totals = [total + elapsed for total, elapsed in zip(totals, best)]
+
+    finally:
+        gc.enable()
+
+    return [len(lines) / total for total in totals]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IRCClient dispatch benchmark")
+    parser.add_argument("--lines", type=int, default=200000)
+    options = parser.parse_args()
+
+    lines = [TRAFFIC[number % len(TRAFFIC)] % number for number in range(options.lines)]
+
+    table, lookup = measure([Client, GetattrClient], lines)
+
+    print("dispatch table %10.0f lines/s" % table)
+    print("getattr        %10.0f lines/s" % lookup)
+    print("speedup        %10.2fx" % (table / lookup))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+# LineReceiver.dataReceived with reads of growing size. The time per line
+# should stay flat: the old receive path (split on a bytes buffer, kept here
+# to compare) copied the rest of the read for every line.
+#
+#   python benchmarks/line_receiver.py [--line-length N] [--total MB]
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from twisted.protocols import basic
+
+SIZES = [4096, 16384, 65536, 262144, 1048576]
+
+
+class Counter(basic.LineReceiver):
+    delimiter = b'\n'
+    MAX_LENGTH = 1 << 30
+    lines = 0
+
+    def lineReceived(self, line):
+        self.lines += 1
+
+
+class SplittingCounter(Counter):
+    # The receive path before the bytearray buffer
+
+    _oldBuffer = b''
+
+    def dataReceived(self, data):
+        if self._busyReceiving:
+            self._oldBuffer += data
+            return
+
+        try:
+            self._busyReceiving = True
+            self._oldBuffer += data
+            while self._oldBuffer and not self.paused:
+                if self.line_mode:
+                    try:
+                        line, self._oldBuffer = self._oldBuffer.split(
+                            self.delimiter, 1)
+                    except ValueError:
+                        if len(self._oldBuffer) > self.MAX_LENGTH:
+                            line, self._oldBuffer = self._oldBuffer, b''
+                            return self.lineLengthExceeded(line)
+                        return
+                    else:
+                        lineLength = len(line)
+                        if lineLength > self.MAX_LENGTH:
+                            exceeded = line + self.delimiter + self._oldBuffer
+                            self._oldBuffer = b''
+                            return self.lineLengthExceeded(exceeded)
+                        why = self.lineReceived(line)
+                        if (why or self.transport and
+                            self.transport.disconnecting):
+                            return why
+                else:
+                    data = self._oldBuffer
+                    self._oldBuffer = b''
+                    why = self.rawDataReceived(data)
+                    if why:
+                        return why
+        finally:
+            self._busyReceiving = False
+
+
+def measure(cls, data, size, total):
+    # Returns nanoseconds per line
+    reads = [data[start:start + size] for start in range(0, len(data), size)]
+    protocol = cls()
+    rounds = max(1, total // len(data))
+
+    start = time.time()
+    for x in range(rounds):
+        for read in reads:
+            protocol.dataReceived(read)
+
+    return (time.time() - start) * 1e9 / protocol.lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LineReceiver scaling benchmark")
+    parser.add_argument("--line-length", type=int, default=100)
+    parser.add_argument("--total", type=int, default=16, help="megabytes received on each run")
+    options = parser.parse_args()
+
+    line = b'x' * (options.line_length - 1) + b'\n'
+    data = line * (SIZES[-1] // len(line))
+    total = options.total * 1048576
+
+    print("%10s %8s %14s %14s" % ("read", "lines", "bytearray ns", "split ns"))
+    for size in SIZES:
+        new = measure(Counter, data, size, total)
+        old = measure(SplittingCounter, data, size, total)
+        print("%10d %8d %14.0f %14.0f" % (size, size // len(line), new, old))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+# An IRC server on 127.0.0.1 full of synthetic users, to soak test Polari
+# without a real network. It's twisted.words.service (IRCFactory, IRCUser,
+# InMemoryWordsRealm) with a few changes: anyone can log in without a
+# password, JOIN takes several channels, and the synthetic users have no
+# sockets, only the real clients get their traffic.
+#
+#   python benchmarks/load_server.py --port 6667 --users 5000 --rate 200
+#
+# Or from a trial test, on its reactor (see test_load_server.py):
+#
+#   server = LoadServer({ "#load": 2000 }, rate=100, churn=10)
+#   port = server.start()
+#   ... connect a client.Client to 127.0.0.1:port ...
+#   server.netsplit(0.5)
+#   server.stop()
+
+from __future__ import print_function
+
+import os
+import sys
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from zope.interface import implementer
+
+from twisted.cred import checkers, credentials, portal
+from twisted.internet import defer, task
+from twisted.python import log
+from twisted.words import iwords
+from twisted.words.protocols import irc
+from twisted.words.service import Group, InMemoryWordsRealm, IRCFactory, IRCUser
+
+TICK = 0.1  # Seconds between bursts of synthetic traffic
+SPLIT_TIME = 5  # Seconds until the users of a netsplit come back
+
+WORDS = ("the quick brown fox jumps over the lazy dog sugar activity journal "
+         "neighborhood collaboration python twisted gtk polari").split()
+
+
+@implementer(checkers.ICredentialsChecker)
+class AnyoneChecker(object):
+    # Every nickname logs in, with or without a password
+    credentialInterfaces = (credentials.IUsernamePassword,)
+
+    def requestAvatarId(self, credentials):
+        return defer.succeed(credentials.username)
+
+
+@implementer(iwords.IChatClient)
+class SyntheticUser(object):
+    # A member of the groups without a connection, what the others do
+    # doesn't matter to it
+
+    def __init__(self, name):
+        self.name = name
+
+    def receive(self, sender, recipient, message):
+        pass
+
+    def groupMetaUpdate(self, group, meta):
+        pass
+
+    def userJoined(self, group, user):
+        pass
+
+    def userLeft(self, group, user, reason=None):
+        pass
+
+
+class LoadIRCUser(IRCUser):
+
+    def connectionMade(self):
+        IRCUser.connectionMade(self)
+        self.factory.clients.add(self)
+
+    def connectionLost(self, reason):
+        self.factory.clients.discard(self)
+        IRCUser.connectionLost(self, reason)
+
+    def irc_NICK(self, prefix, params):
+        if self.password is None:
+            self.password = ""  # Logs in without asking NickServ
+
+        IRCUser.irc_NICK(self, prefix, params)
+
+    def irc_CAP(self, prefix, params):
+        # Like the servers without IRCv3 capabilities, clients register anyway
+        self.sendMessage(irc.ERR_UNKNOWNCOMMAND, "CAP", ":Unknown command", to="*")
+
+    def irc_JOIN(self, prefix, params):
+        # Clients join several channels on each line
+        for channel in params[0].split(","):
+            IRCUser.irc_JOIN(self, prefix, [channel] + params[1:])
+
+
+class LoadFactory(IRCFactory):
+    protocol = LoadIRCUser
+
+    def __init__(self, realm, portal):
+        IRCFactory.__init__(self, realm, portal)
+        self.clients = set()  # Connected LoadIRCUsers
+
+
+class LoadServer(object):
+
+    def __init__(self, channels=None, rate=50, churn=5, netsplit_interval=None,
+                 netsplit_fraction=0.5, reactor=None, seed=0, name="loadtest"):
+        # channels: {channel: synthetic users}, rate: messages per second,
+        # churn: joins and parts per second, netsplit_interval: seconds
+        if reactor is None:
+            from twisted.internet import reactor
+
+        self.reactor = reactor
+        self.channels = channels or { "#load": 1000 }
+        self.rate = rate
+        self.churn = churn
+        self.netsplit_interval = netsplit_interval
+        self.netsplit_fraction = netsplit_fraction
+        self.random = random.Random(seed)
+
+        self.realm = InMemoryWordsRealm(name)
+        self.realm.createGroupOnRequest = True
+        self.factory = LoadFactory(self.realm, portal.Portal(self.realm, [AnyoneChecker()]))
+
+        self.users = { }  # Group name: list of synthetic users in it
+        self.parted = { }  # Group name: list of synthetic users out of it
+        self.split = [ ]  # (group, user), quit on the last netsplit
+        self.next_user = 0
+        self.pending = 0.0  # Messages and churn owed by the last ticks
+        self.listening_port = None
+        self.loops = [ ]
+        self.calls = [ ]
+
+        self.sent = 0  # Lines for the real clients, all of them
+
+        for channel, count in self.channels.items():
+            self.add_users(count, channel)
+
+    def start(self, port=0):
+        # Returns the port, port=0 takes a free one
+        self.listening_port = self.reactor.listenTCP(port, self.factory, interface="127.0.0.1")
+
+        self.start_loop(self._tick, TICK)
+        if self.netsplit_interval is not None:
+            self.start_loop(self.netsplit, self.netsplit_interval, self.netsplit_fraction)
+
+        return self.listening_port.getHost().port
+
+    def stop(self):
+        for loop in self.loops:
+            if loop.running:
+                loop.stop()
+
+        for call in self.calls:
+            if call.active():
+                call.cancel()
+
+        self.loops = [ ]
+        self.calls = [ ]
+
+        for client in list(self.factory.clients):
+            client.transport.loseConnection()
+
+        if self.listening_port is not None:
+            port = self.listening_port
+            self.listening_port = None
+            return port.stopListening()
+
+        return defer.succeed(None)
+
+    def start_loop(self, callback, interval, *args):
+        loop = task.LoopingCall(self._run_safely, callback, *args)
+        loop.clock = self.reactor
+        loop.start(interval, now=False)
+        self.loops.append(loop)
+
+    def _run_safely(self, callback, *args):
+        # A broken tick is logged, the loop keeps going
+        try:
+            callback(*args)
+
+        except Exception:
+            log.err(None, "Error on %r" % callback)
+
+    def get_group(self, channel):
+        # Also for the groups the realm created when a client joined them
+        name = channel.lstrip("#").lower()
+        if name not in self.realm.groups:
+            self.realm.groups[name] = Group(name)
+
+        self.users.setdefault(name, [ ])
+        self.parted.setdefault(name, [ ])
+
+        return self.realm.groups[name]
+
+    def get_groups(self):
+        # The groups with synthetic users, see get_group
+        return [self.realm.groups[name] for name in self.users if name in self.realm.groups]
+
+    def get_clients(self, group):
+        return [user for user in group.users.values() if isinstance(user, LoadIRCUser)]
+
+    def add_users(self, count, channel):
+        # Returns the names of the new synthetic users
+        group = self.get_group(channel)
+        names = [ ]
+
+        for x in range(count):
+            user = SyntheticUser(u"user%d" % self.next_user)
+            self.next_user += 1
+            self.join(group, user)
+            names.append(user.name)
+
+        return names
+
+    def join(self, group, user):
+        # Like Group.add, but only the real clients are told
+        group.users[user.name] = user
+        self.users[group.name].append(user)
+
+        for client in self.get_clients(group):
+            client.userJoined(group, user)
+            self.sent += 1
+
+    def part(self, group, user, reason=None):
+        group.users.pop(user.name, None)
+        self.users[group.name].remove(user)
+
+        for client in self.get_clients(group):
+            client.userLeft(group, user, reason)
+            self.sent += 1
+
+    def say(self, group, user, text):
+        for client in self.get_clients(group):
+            client.receive(user, group, { "text": text })
+            self.sent += 1
+
+    def netsplit(self, fraction=0.5):
+        # Some of the users quit at once, and come back after SPLIT_TIME
+        quits = { }  # User: real clients that saw them
+        for group in self.get_groups():
+            users = self.users[group.name]
+            clients = self.get_clients(group)
+
+            for user in self.random.sample(users, int(len(users) * fraction)):
+                group.users.pop(user.name)
+                users.remove(user)
+                self.split.append((group, user))
+                quits.setdefault(user, set()).update(clients)
+
+        for user, clients in quits.items():
+            line = u":%s!%s@%s QUIT :*.net *.split" % (user.name, user.name, self.realm.name)
+            for client in clients:
+                client.sendLine(line)  # IRC.sendLine encodes it
+                self.sent += 1
+
+        self.calls.append(self.reactor.callLater(SPLIT_TIME, self.rejoin))
+
+    def rejoin(self):
+        split = self.split
+        self.split = [ ]
+
+        for group, user in split:
+            self.join(group, user)
+
+    def _tick(self):
+        groups = [group for group in self.get_groups() if self.users[group.name] != [ ]]
+        if groups == [ ]:
+            return
+
+        self.pending += (self.rate + self.churn) * TICK
+        events = int(self.pending)
+        self.pending -= events
+
+        for x in range(events):
+            group = self.random.choice(groups)
+            users = self.users[group.name]  # The churn may have emptied it
+
+            if users != [ ] and self.random.random() * (self.rate + self.churn) < self.rate:
+                text = u" ".join(self.random.choice(WORDS) for word in range(self.random.randint(3, 15)))
+                self.say(group, self.random.choice(users), text)
+
+            elif self.parted[group.name] != [ ] and (users == [ ] or self.random.random() < 0.5):
+                user = self.parted[group.name].pop()
+                self.join(group, user)
+
+            elif users != [ ]:
+                user = self.random.choice(users)
+                self.part(group, user, u"churn")
+                self.parted[group.name].append(user)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IRC load server on 127.0.0.1")
+    parser.add_argument("--port", type=int, default=6667)
+    parser.add_argument("--users", type=int, default=1000, help="synthetic users on each channel")
+    parser.add_argument("--channel", action="append", help="channel to fill, can be repeated")
+    parser.add_argument("--rate", type=float, default=50, help="messages per second")
+    parser.add_argument("--churn", type=float, default=5, help="joins and parts per second")
+    parser.add_argument("--netsplit", type=float, help="seconds between netsplits")
+    options = parser.parse_args()
+
+    from twisted.internet import reactor
+
+    channels = dict((channel, options.users) for channel in options.channel or ["#load"])
+    server = LoadServer(channels, options.rate, options.churn, options.netsplit, reactor=reactor)
+    port = server.start(options.port)
+
+    log.startLogging(sys.stdout)
+    log.msg("Listening on 127.0.0.1:%d, channels: %s" % (port, ", ".join(sorted(channels))))
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
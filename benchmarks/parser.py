@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+# Microseconds per line to parse server traffic with irc.parseMessage, and
+# with the lowDequote and parsemsg pair IRCClient used before. Tagged lines
+# are only measured with parseMessage, parsemsg doesn't know about tags.
+#
+#   python benchmarks/parser.py [--lines N] [--file raw_lines.txt]
+
+from __future__ import print_function
+
+import gc
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from twisted.words.protocols import irc
+
+TRAFFIC = [
+    ":nick%d!user@host.example.com PRIVMSG #channel :hello there, how are you?",
+    ":nick%d!user@host.example.com JOIN #channel",
+    ":nick%d!user@host.example.com QUIT :Ping timeout: 240 seconds",
+    ":irc.example.com 352 me #channel user host irc.example.com nick%d H :0 Real Name",
+    ":irc.example.com 353 me = #channel :@nick%d +other third fourth fifth",
+    ":irc.example.com 372 me :- message of the day %d",
+    ":nick%d!user@host.example.com MODE #channel +o other",
+    "PING :irc.example.com%d",
+]
+
+TAGS = "@time=2026-01-01T00:00:%02d.000Z;account=nick;msgid=abc\\sdef "
+
+
+def parse_old(line):
+    return irc.parsemsg(irc.lowDequote(line))
+
+
+def parse_new(line):
+    if irc.M_QUOTE in line:
+        line = irc.lowDequote(line)
+
+    return irc.parseMessage(line)
+
+
+def measure(parses, lines, batch=2000, repeat=5):
+    # Microseconds per line of each parse function. Every batch of lines
+    # counts its fastest run, the functions take turns, and the collector
+    # is off like in timeit, so a busy machine moves the results less
+    totals = [0.0] * len(parses)
+    gc.collect()
+    gc.disable()
+    try:
+        for first in range(0, len(lines), batch):
+            chunk = lines[first:first + batch]
+            best = [None] * len(parses)
+            for run in range(repeat):
+                for index, parse in enumerate(parses):
+                    start = time.time()
+                    for line in chunk:
+                        parse(line)
+
+                    elapsed = time.time() - start
+                    if best[index] is None or elapsed < best[index]:
+                        best[index] = elapsed
+
+            totals = [total + elapsed for total, elapsed in zip(totals, best)]
+
+    finally:
+        gc.enable()
+
+    return [total * 1000000 / len(lines) for total in totals]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IRC message parser benchmark")
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--file", help="Raw IRC lines to parse instead of the built in traffic")
+    options = parser.parse_args()
+
+    if options.file is not None:
+        with open(options.file) as raw:
+            lines = [line.rstrip("\r\n") for line in raw if line.strip()]
+
+    else:
+        lines = [TRAFFIC[number % len(TRAFFIC)] % number for number in range(options.lines)]
+
+    tagged = [TAGS % (number % 60) + line for number, line in enumerate(lines)
+              if not line.startswith("@")]
+
+    untagged = [line for line in lines if not line.startswith("@")]
+
+    old, new = measure([parse_old, parse_new], untagged)
+    new_tagged, = measure([parse_new], tagged)
+
+    print("parsemsg             %6.3f us/line" % old)
+    print("parseMessage         %6.3f us/line" % new)
+    print("parseMessage, tagged %6.3f us/line" % new_tagged)
+    print("speedup              %6.2fx" % (old / new))
+
+
+if __name__ == "__main__":
+    main()
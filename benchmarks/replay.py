@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+# How many IRC lines per second Polari can take. The traffic goes through
+# Client.dataReceived, from a StringTransport, and up to a PolariCanvas on
+# an offscreen window, while the main loop keeps running.
+#
+#   python benchmarks/replay.py [--scenario NAME] [--lines N] [--chunk N]
+#   python benchmarks/replay.py --file traffic.txt
+#
+# The scenarios are synthetic: joins, flood, netsplit, who, or all of them.
+# A file has raw lines as the server sent them, one per line.
+#
+# For each one it prints the lines per second, the 99th percentile of the
+# main loop stalls (how late a 10 ms timeout runs) and how much the memory
+# grew per 100k lines. It needs a display, xvfb-run works.
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import gc
+import time
+import random
+import shutil
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Logs and scrollback go to a temporal directory
+ACTIVITY_ROOT = tempfile.mkdtemp(prefix="polari-replay-")
+os.makedirs(os.path.join(ACTIVITY_ROOT, "tmp"))
+os.environ["SUGAR_ACTIVITY_ROOT"] = ACTIVITY_ROOT
+
+import gi
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk
+from gi.repository import GObject
+
+from polari_canvas import PolariCanvas
+
+NETWORK = "irc.example.net"
+NICKNAME = "polari"
+CHANNEL = "#bench"
+HEARTBEAT = 10  # Milliseconds
+
+WORDS = ("the quick brown fox jumps over the lazy dog sugar activity journal "
+         "neighborhood collaboration python twisted gtk polari").split()
+
+
+def user(number):
+    return "user%d!~user%d@host%d.example.net" % (number, number, number % 97)
+
+
+def message(rand):
+    text = " ".join(rand.choice(WORDS) for word in range(rand.randint(3, 20)))
+
+    # Some of them need the highlighter and the formatting
+    if rand.random() < 0.05:
+        text = "%s: %s" % (NICKNAME, text)
+
+    if rand.random() < 0.05:
+        text += " http://example.net/%d" % rand.randint(0, 1000)
+
+    if rand.random() < 0.05:
+        text = "\x02\x034,1%s\x0f" % text
+
+    return text
+
+
+def joins(count, rand):
+    return [":%s JOIN %s" % (user(number), CHANNEL) for number in range(count)]
+
+
+def flood(count, rand):
+    return [":%s PRIVMSG %s :%s" % (user(rand.randint(0, 499)), CHANNEL, message(rand))
+            for line in range(count)]
+
+
+def netsplit(count, rand):
+    # Half of the channel quits and comes back, again and again
+    lines = []
+    while len(lines) < count:
+        users = range(0, 2000, 2)
+        lines += [":%s QUIT :*.net *.split" % user(number) for number in users]
+        lines += [":%s JOIN %s" % (user(number), CHANNEL) for number in users]
+
+    return lines[:count]
+
+
+def who(count, rand):
+    # WHO replies of a channel with 5000 users, as many times as needed
+    lines = []
+    while len(lines) < count:
+        for number in range(5000):
+            flags = rand.choice(["H", "H", "H", "G", "H@", "H+"])
+            lines.append(":srv 352 %s %s ~user%d host%d.example.net srv user%d %s :0 User %d" %
+                         (NICKNAME, CHANNEL, number, number, number, flags, number))
+
+        lines.append(":srv 315 %s %s :End of /WHO list." % (NICKNAME, CHANNEL))
+
+    return lines[:count]
+
+
+SCENARIOS = [
+    ("joins", joins),
+    ("flood", flood),
+    ("netsplit", netsplit),
+    ("who", who),
+]
+
+
+def get_rss():
+    # Bytes, of now (not the peak like getrusage)
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def percentile(values, percent):
+    if values == []:
+        return 0
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def replay(lines, chunk, channels):
+    from twisted.internet import task
+    from twisted.test.proto_helpers import StringTransport
+
+    window = Gtk.OffscreenWindow()
+    window.set_default_size(800, 600)
+    polari = PolariCanvas()
+    window.add(polari)
+
+    polari.add_network(NETWORK, 6667, NICKNAME, connect=False)
+    for channel in channels:
+        polari.new_channel(NETWORK, channel)
+
+    window.show_all()
+
+    factory = polari.connections.get_factory(NETWORK)
+    factory.clock = task.Clock()  # Nothing runs the reactor here
+    client = factory.buildProtocol(None)
+    client.clock = factory.clock
+    client.makeConnection(StringTransport())
+    client.dataReceived(":srv 001 %s :Welcome\r\n" % NICKNAME)
+    for channel in channels:
+        client.dataReceived(":%s!~me@host JOIN %s\r\n" % (NICKNAME, channel))
+        client.dataReceived(":srv 366 %s %s :End of /NAMES list.\r\n" % (NICKNAME, channel))
+
+    data = ["".join(line + "\r\n" for line in lines[start:start + chunk])
+            for start in range(0, len(lines), chunk)]
+
+    state = { "last": None, "stalls": [], "data": iter(data), "end": None }
+
+    def _heartbeat():
+        now = time.time()
+        if state["last"] is not None:
+            state["stalls"].append(max(0, (now - state["last"]) * 1000 - HEARTBEAT))
+
+        state["last"] = now
+        return True
+
+    def _feed():
+        data = next(state["data"], None)
+        if data is not None:
+            client.dataReceived(data)
+            return True
+
+        # Until the last lines are drawn
+        if polari.chat_box._flush_id is not None:
+            return True
+
+        state["end"] = time.time()
+        Gtk.main_quit()
+        return False
+
+    # Settle the first frames before starting
+    while Gtk.events_pending():
+        Gtk.main_iteration()
+
+    gc.collect()
+    rss = get_rss()
+    start = time.time()
+
+    heartbeat_id = GObject.timeout_add(HEARTBEAT, _heartbeat)
+    GObject.idle_add(_feed)
+    Gtk.main()
+    GObject.source_remove(heartbeat_id)
+
+    gc.collect()
+    growth = get_rss() - rss
+    elapsed = state["end"] - start
+
+    polari.close_logs()
+    window.destroy()
+
+    return len(lines) / elapsed, percentile(state["stalls"], 99), growth * 100000.0 / len(lines)
+
+
+def read_traffic(path):
+    # Returns the lines and the channels where they happen
+    with open(path) as file:
+        lines = [line.rstrip("\r\n") for line in file if line.strip() != ""]
+
+    channels = set()
+    for line in lines:
+        for channel in re.findall(r" (#[^ ,:]+)", line):
+            channels.add(channel)
+
+    return lines, sorted(channels)
+
+
+def main():
+    import argparse
+
+    names = [name for name, generator in SCENARIOS]
+    parser = argparse.ArgumentParser(description="Polari traffic replay benchmark")
+    parser.add_argument("--scenario", choices=names + ["all"], default="all")
+    parser.add_argument("--file", help="raw IRC lines to replay instead")
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--chunk", type=int, default=100, help="lines on each read")
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+
+    if options.file is not None:
+        lines, channels = read_traffic(options.file)
+        runs = [(os.path.basename(options.file), lines, channels)]
+
+    else:
+        rand = random.Random(options.seed)
+        runs = [(name, generator(options.lines, rand), [CHANNEL]) for name, generator in SCENARIOS
+                if options.scenario in (name, "all")]
+
+    print("%-12s %10s %10s %16s" % ("scenario", "lines/s", "p99 stall", "memory/100k"))
+    try:
+        for name, lines, channels in runs:
+            rate, stall, growth = replay(lines, options.chunk, channels)
+            print("%-12s %10.0f %8.1fms %14.1fMB" % (name, rate, stall, growth / 1048576.0))
+
+    finally:
+        shutil.rmtree(ACTIVITY_ROOT, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+# Time to first frame of the Polari canvas, and which modules it costs.
+#
+#   python benchmarks/startup.py [--runs N]
+#       Starts the canvas N times, each one on a new process, and prints
+#       the median time of each startup step.
+#
+#   python benchmarks/startup.py --importtime
+#       Prints every module imported until the first frame, like
+#       python3 -X importtime does (Polari runs on Python 2).
+#
+# It needs a display, like the activity does.
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Modules that the login screen shouldn't need
+LAZY_MODULES = [
+    "twisted.words.protocols.irc",
+    "twisted.internet.reactor",
+    "client",
+]
+
+
+class ImportTimer(object):
+
+    # Wraps __import__, and times each module the first time it's imported.
+    # Modules imported while importing other one count on both.
+
+    def __init__(self):
+        self.stack = []
+        self.imports = []  # (level, self us, cumulative us, name), in order
+        self.original = None
+
+    def install(self):
+        import __builtin__
+        self.original = __builtin__.__import__
+        __builtin__.__import__ = self.__import
+
+    def __import(self, name, *args, **kwargs):
+        modules = set(sys.modules)
+        self.stack.append(0)
+        start = time.time()
+
+        try:
+            return self.original(name, *args, **kwargs)
+
+        finally:
+            cumulative = int((time.time() - start) * 1000000)
+            children = self.stack.pop()
+
+            if self.stack != []:
+                self.stack[-1] += cumulative
+
+            new = [module for module in sys.modules if module not in modules and sys.modules[module] is not None]
+            if new != []:
+                self.imports.append((len(self.stack), cumulative - children, cumulative, name))
+
+    def report(self):
+        print("import time: self [us] | cumulative | imported package")
+        for level, own, cumulative, name in self.imports:
+            print("import time: %9d | %10d | %s%s" % (own, cumulative, "  " * level, name))
+
+
+def run_once(importtime):
+    # On its own process, everything is imported here
+    sys.path.insert(0, ROOT)
+
+    # Logs and scrollback go to a temporal directory
+    root = tempfile.mkdtemp(prefix="polari-startup-")
+    os.makedirs(os.path.join(root, "tmp"))
+    os.environ["SUGAR_ACTIVITY_ROOT"] = root
+
+    timer = ImportTimer()
+    if importtime:
+        timer.install()
+
+    times = { }
+    start = time.time()
+
+    import gi
+    gi.require_version("Gtk", "3.0")
+    from gi.repository import Gtk
+    from gi.repository import GObject
+
+    times["gtk"] = time.time() - start
+
+    from polari_canvas import PolariCanvas
+    times["import"] = time.time() - start
+
+    window = Gtk.Window()
+    polari = PolariCanvas()
+    window.add(polari)
+    window.show_all()
+    times["canvas"] = time.time() - start
+
+    def _draw(widget, context):
+        if "first-frame" not in times:
+            times["first-frame"] = time.time() - start
+            GObject.idle_add(Gtk.main_quit)
+
+        return False
+
+    window.connect_after("draw", _draw)
+    Gtk.main()
+
+    lazy = [module for module in LAZY_MODULES if module in sys.modules]
+
+    # What the first network costs now
+    network_start = time.time()
+    polari.add_network("irc.example.net", 6667, "startup", connect=False)
+    times["first-network"] = time.time() - network_start
+
+    polari.close_logs()
+    shutil.rmtree(root, ignore_errors=True)
+
+    if importtime:
+        timer.report()
+
+    else:
+        print(json.dumps({ "times": times, "loaded": lazy }))
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Polari startup benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child or options.importtime:
+        run_once(options.importtime)
+        return
+
+    results = []
+    for run in range(options.runs):
+        output = subprocess.check_output([sys.executable, __file__, "--child"])
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    # first-network is timed on its own, the other steps since the start
+    print("%d runs, median milliseconds" % options.runs)
+    for step in ["gtk", "import", "canvas", "first-frame", "first-network"]:
+        print("  %-14s %8.1f" % (step, median([result["times"][step] for result in results]) * 1000))
+
+    loaded = results[0]["loaded"]
+    if loaded != []:
+        print("Loaded before the first frame: %s" % ", ".join(loaded))
+
+
+if __name__ == "__main__":
+    main()
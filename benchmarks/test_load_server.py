@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# LoadServer with a real IRCClient on the loopback, on a channel it was
+# configured with and on one the client creates by joining it.
+#
+#   trial benchmarks/test_load_server.py
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from twisted.internet import defer, endpoints, reactor, task
+from twisted.trial import unittest
+from twisted.words.protocols import irc
+
+from load_server import LoadServer
+
+TIMEOUT = 10  # Seconds to wait for the traffic
+
+
+class RecordingClient(irc.IRCClient):
+    # Remembers the traffic it gets, by kind and channel
+
+    nickname = "tester"
+    heartbeatInterval = None
+
+    def __init__(self):
+        self.joined_channels = set()
+        self.events = set()  # (kind, channel), channel is None for QUIT
+        self.lost = defer.Deferred()
+
+    def signedOn(self):
+        self.sendLine("JOIN #load,#other")
+
+    def joined(self, channel):
+        self.joined_channels.add(channel)
+
+    def privmsg(self, user, channel, message):
+        self.events.add(("PRIVMSG", channel))
+
+    def userJoined(self, nickname, channel):
+        self.events.add(("JOIN", channel))
+
+    def userLeft(self, nickname, channel):
+        self.events.add(("PART", channel))
+
+    def userQuit(self, nickname, message):
+        self.events.add(("QUIT", None))
+
+    def connectionLost(self, reason):
+        irc.IRCClient.connectionLost(self, reason)
+        self.lost.callback(None)
+
+
+class LoadServerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LoadServer({ "#load": 50 }, rate=200, churn=50,
+                                 netsplit_interval=0.5, reactor=reactor)
+        port = self.server.start()
+        self.addCleanup(self.server.stop)
+
+        endpoint = endpoints.TCP4ClientEndpoint(reactor, "127.0.0.1", port)
+        d = endpoints.connectProtocol(endpoint, RecordingClient())
+        d.addCallback(self._connected)
+        return d
+
+    def _connected(self, client):
+        self.client = client
+        self.addCleanup(self._disconnect)
+
+    def _disconnect(self):
+        self.client.transport.loseConnection()
+        return self.client.lost
+
+    def wait_for(self, condition):
+        # Fires when condition() is true, fails after TIMEOUT
+        start = reactor.seconds()
+
+        def check():
+            if condition():
+                loop.stop()
+
+            elif reactor.seconds() - start > TIMEOUT:
+                raise AssertionError("Timed out, events: %r" % sorted(self.client.events))
+
+        loop = task.LoopingCall(check)
+        return loop.start(0.05)
+
+    @defer.inlineCallbacks
+    def test_traffic(self):
+        # Both channels get messages, joins and parts, and the netsplits
+        # send QUIT lines
+        yield self.wait_for(lambda: self.client.joined_channels == set(["#load", "#other"]))
+        self.server.add_users(10, "#other")
+
+        expected = set([("PRIVMSG", "#load"), ("JOIN", "#load"), ("PART", "#load"),
+                        ("PRIVMSG", "#other"), ("JOIN", "#other"), ("PART", "#other"),
+                        ("QUIT", None)])
+        yield self.wait_for(lambda: expected <= self.client.events)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+from collections import deque
+from itertools import islice
+
+from consts import SCROLLBACK_LINES, SCROLLBACK_TRIM, UserType
+from completion import NickCompleter
+import formatting
+from highlighter import Highlighter
+from nick_index import NickIndex
+from scrollback import ScrollbackArchive
+
+
+class Network(object):
+    # What ChatBox knows about a network besides its channels
+
+    def __init__(self, name):
+        self.name = name
+        self.nick = None
+        self.nick_index = NickIndex()
+        self.highlighter = Highlighter()
+        self.send_queue = (0, 0)  # Lines waiting to be sent, seconds to send them
+
+
+class Channel(object):
+    # Everything ChatBox knows about a channel (or a query). The widgets
+    # are only built while the user needs them, see ChatBox.show_channel
+
+    def __init__(self, network, name):
+        self.network = network
+        self.name = name
+        self.key = (network, name)
+        self.topic = None
+        self.last_nick = None
+        self.nicks = { }  # nickname: usertype
+        self.afk = set()
+        self.completer = NickCompleter()
+        self.lines = deque()  # (text, tags) on the view
+        self.pending = [ ]  # (text, tags) not drawn yet
+        self.archive = ScrollbackArchive()
+
+        self.view = None
+        self.buffer = None
+        self.buffer_tags = set()  # Formatting tags created on the buffer
+        self.nicks_listbox = None
+        self.topic_label = None
+        self.hide_id = None  # Timeout to destroy the widgets
+
+    def has_widgets(self):
+        return self.view is not None
+
+    def set_widgets(self, view, nicks_listbox, topic_label):
+        self.view = view
+        self.buffer = view.get_buffer()
+        self.buffer_tags = set()
+        self.nicks_listbox = nicks_listbox
+        self.topic_label = topic_label
+
+        self.draw(self.lines, 0)
+
+        self.nicks_listbox.set_list(self.nicks.items())
+        for nickname in self.afk:
+            self.nicks_listbox.set_afk(nickname, True)
+
+        if self.topic is not None:
+            self.topic_label.set_topic(self.topic)
+
+    def destroy_widgets(self):
+        if not self.has_widgets():
+            return
+
+        self.view.destroy()
+        self.nicks_listbox.destroy()
+        self.topic_label.destroy()
+
+        self.view = None
+        self.buffer = None
+        self.nicks_listbox = None
+        self.topic_label = None
+
+    def close(self):
+        self.destroy_widgets()
+        self.archive.close()
+
+    def add_text(self, text, tags):
+        # tags: list of (start, end, tag name), relative to text
+        self.pending.append((text, tags))
+
+    def flush(self):
+        if self.pending == []:
+            return
+
+        lines = self.pending
+        self.pending = []
+        self.lines.extend(lines)
+
+        if self.has_widgets():
+            self.draw(lines, self.buffer.get_char_count())
+
+        self.trim()
+
+    def draw(self, lines, offset):
+        # All the lines go to the buffer with a single insert
+        texts = []
+        tags = []
+        length = offset
+        for text, text_tags in lines:
+            texts.append(text)
+            tags += [(length + start, length + end, tag) for start, end, tag in text_tags]
+            length += len(text)
+
+        if texts == []:
+            return
+
+        self.buffer.insert(self.buffer.get_iter_at_offset(offset), u"".join(texts))
+
+        for start, end, tag in tags:
+            if tag.startswith("fmt-") and tag not in self.buffer_tags:
+                formatting.create_tag(self.buffer, tag)
+                self.buffer_tags.add(tag)
+
+            self.buffer.apply_tag_by_name(tag,
+                                          self.buffer.get_iter_at_offset(start),
+                                          self.buffer.get_iter_at_offset(end))
+
+    def trim(self):
+        # Trim in batches, so it doesn't happen on every message
+        if len(self.lines) <= SCROLLBACK_LINES + SCROLLBACK_TRIM:
+            return
+
+        count = len(self.lines) - SCROLLBACK_LINES
+        if self.has_widgets():
+            # Lines the user is reading, paged back in or not, stay until
+            # the view is scrolled past them
+            length = sum(len(text) for text, tags in islice(self.lines, count))
+            top, y = self.view.get_line_at_y(self.view.get_visible_rect().y)
+            if top.get_offset() < length:
+                return
+
+            first_line = self.buffer.create_mark(None, top, True)
+            self.buffer.delete(self.buffer.get_start_iter(),
+                               self.buffer.get_iter_at_offset(length))
+
+            # Keep showing the same line, the view would move up otherwise
+            self.view.scroll_to_mark(first_line, 0, True, 0, 0)
+            self.buffer.delete_mark(first_line)
+
+        self.archive.push([self.lines.popleft() for x in range(count)])
+
+    def load_scrollback(self):
+        lines = self.archive.pop(SCROLLBACK_TRIM)
+        if lines == []:
+            return
+
+        self.lines.extendleft(reversed(lines))
+
+        first_line = self.buffer.create_mark(None, self.buffer.get_start_iter(), False)
+        self.draw(lines, 0)
+
+        # Keep showing the same line, instead of the loaded ones
+        self.view.scroll_to_mark(first_line, 0, True, 0, 0)
+        self.buffer.delete_mark(first_line)
+
+    def get_recent_lines(self, count):
+        # The last count lines, drawn or not, as (text, tags)
+        lines = list(self.lines) + self.pending
+        return lines[-count:]
+
+    def restore_lines(self, lines):
+        # Lines saved on the Journal go before everything else
+        self.pending[:0] = [(text, [tuple(tag) for tag in tags]) for text, tags in lines]
+
+    def set_topic(self, topic):
+        self.topic = topic
+
+        if self.has_widgets():
+            self.topic_label.set_topic(topic)
+
+    def set_nicknames(self, nicknames):
+        # nicknames: list of (nickname, usertype)
+        self.nicks = { }
+        self.add_nicknames(nicknames, clear=True)
+        self.afk &= set(self.nicks)
+        self.completer.set_nicknames(self.nicks)
+
+        if self.has_widgets():
+            for nickname in self.afk:
+                self.nicks_listbox.set_afk(nickname, True)
+
+    def add_nicknames(self, nicknames, clear=False):
+        for nickname, usertype in nicknames:
+            self.nicks[nickname] = usertype
+
+        if not clear:
+            self.completer.add_nicknames([nickname for nickname, usertype in nicknames])
+
+        if self.has_widgets():
+            if clear:
+                self.nicks_listbox.set_list(nicknames)
+
+            else:
+                self.nicks_listbox.add_nicknames(nicknames)
+
+    def add_nickname(self, nickname, usertype=UserType.NORMAL):
+        self.nicks[nickname] = usertype
+        self.completer.add_nickname(nickname)
+
+        if self.has_widgets():
+            self.nicks_listbox.add_nickname(nickname, usertype)
+
+    def remove_nickname(self, nickname):
+        if nickname not in self.nicks:
+            return
+
+        self.nicks.pop(nickname)
+        self.afk.discard(nickname)
+        self.completer.remove_nickname(nickname)
+
+        if self.has_widgets():
+            self.nicks_listbox.remove_nickname(nickname)
+
+    def rename_nickname(self, old_nick, new_nick):
+        if old_nick not in self.nicks:
+            return
+
+        usertype = self.nicks.pop(old_nick)
+        self.nicks[new_nick] = usertype
+        self.afk.discard(old_nick)
+        self.completer.rename_nickname(old_nick, new_nick)
+
+        if self.has_widgets():
+            self.nicks_listbox.remove_nickname(old_nick)
+            self.nicks_listbox.add_nickname(new_nick, usertype)
+
+    def set_user_type(self, nickname, usertype):
+        if nickname not in self.nicks:
+            return
+
+        self.nicks[nickname] = usertype
+
+        if self.has_widgets():
+            self.nicks_listbox.set_user_type(nickname, usertype)
+
+    def set_afk(self, nickname, afk):
+        if nickname not in self.nicks:
+            return
+
+        if afk:
+            self.afk.add(nickname)
+
+        else:
+            self.afk.discard(nickname)
+
+        if self.has_widgets():
+            self.nicks_listbox.set_afk(nickname, afk)
@@ -18,164 +18,267 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
+
+from collections import OrderedDict
+
 from consts import Color, SUGAR, STATUS_CHANNEL
 
 import gi
 gi.require_version("Gtk", "3.0")
 
 from gi.repository import Gtk
+from gi.repository import Gdk
 from gi.repository import Pango
 from gi.repository import GObject
 
 
-class ChannelItem(Gtk.EventBox):
+# Model columns
+NETWORK = 0
+CHANNEL = 1
+LABEL = 2
+SPINNING = 3
+PULSE = 4
+UNREAD = 5
+MENTIONS = 6
+CLOSABLE = 7
+
+SPINNER_INTERVAL = 80  # Miliseconds between spinner frames
+
+
+class ChannelsListBox(Gtk.ScrolledWindow):
+
+    # A row for every channel, the TreeView only draws the visible ones
+    # and a change only redraws its row
 
     __gsignals__ = {
-        "selected": (GObject.SIGNAL_RUN_FIRST, None, []),
-        "removed": (GObject.SIGNAL_RUN_FIRST, None, []),
+        "channel-selected": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Network, Channel
+        "channel-removed": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Network, Channel
     }
 
-    def __init__(self, channel, show=None, close_button=False):
-        Gtk.EventBox.__init__(self)
-
-        self.selected = False
-        self.channel = channel
-        self.use_close_button = close_button
+    def __init__(self):
+        Gtk.ScrolledWindow.__init__(self)
 
-        self.set_size_request(1, 30)
-        self.modify_bg(Gtk.StateType.NORMAL, Color.WHITE)
-        self.connect("button-press-event", self._press)
+        self.rows = { }  # (network, channel): TreeIter, ListStore iters persist
+        self.networks = OrderedDict()  # network: number of rows, in the order of the list
+        self.spinning = set()  # (network, channel)
+        self.selected = None  # (network, channel)
 
-        self.hbox = Gtk.HBox()
-        self.add(self.hbox)
+        self._pulse_id = None
 
-        self.label = Gtk.Label(show if show else channel)
-        self.label.modify_font(Pango.FontDescription("15"))
-        self.label.set_margin_left(10)
-        self.hbox.pack_start(self.label, False, False, 0)
+        self.set_size_request(250, -1)
 
-        self.spinner = Gtk.Spinner()
-        self.hbox.pack_end(self.spinner, False, False, 0)
+        if SUGAR:
+            self.modify_bg(Gtk.StateType.NORMAL, Color.WHITE)
 
-        self.button = Gtk.Button.new_from_icon_name(Gtk.STOCK_REMOVE, Gtk.IconSize.BUTTON)
-        self.button.connect("clicked", lambda w: self.emit("removed"))
+        self.model = Gtk.ListStore(str, str, str, bool, int, int, int, bool)
 
-        self.start_spinner()
+        self.view = Gtk.TreeView()
+        self.view.set_model(self.model)
+        self.view.set_headers_visible(False)
+        self.view.add_events(Gdk.EventMask.BUTTON_PRESS_MASK)
+        self.view.connect("button-press-event", self._button_press)
+        self.view.get_selection().connect("changed", self._selection_changed)
+        self.add(self.view)
 
-    def _press(self, widget, event):
-        if event.button == 1:
-            if not self.selected:
-                self.emit("selected")
-                self.selected = True
+        column = Gtk.TreeViewColumn("")
+        column.set_expand(True)
 
-    def set_selected(self, is_selected):
-        self.selected = is_selected
-        self.update()
+        renderer = Gtk.CellRendererText()
+        renderer.set_property("font", "15")
+        renderer.set_property("ellipsize", Pango.EllipsizeMode.END)
+        renderer.set_fixed_size(-1, 30)
+        renderer.set_padding(10, 0)
+        column.pack_start(renderer, True)
+        column.set_cell_data_func(renderer, self.__get_label)
 
-    def get_channel(self):
-        return self.label.get_label()
+        renderer = Gtk.CellRendererText()
+        column.pack_start(renderer, False)
+        column.set_cell_data_func(renderer, self.__get_counter)
 
-    def update(self):
-        if self.selected:
-            self.modify_bg(Gtk.StateType.NORMAL, Color.BLUE)
+        self.view.append_column(column)
 
-        else:
-            if SUGAR:
-                self.modify_bg(Gtk.StateType.NORMAL, Color.WHITE)
+        # The spinner and the close button share the last column
+        self.close_column = Gtk.TreeViewColumn("")
 
-            else:
-                self.modify_bg(Gtk.StateType.NORMAL, None)
+        renderer = Gtk.CellRendererSpinner()
+        self.close_column.pack_start(renderer, False)
+        self.close_column.add_attribute(renderer, "active", SPINNING)
+        self.close_column.add_attribute(renderer, "visible", SPINNING)
+        self.close_column.add_attribute(renderer, "pulse", PULSE)
 
-    def start_spinner(self):
-        if self.button.get_parent() == self.hbox:
-            self.hbox.remove(self.button)
+        renderer = Gtk.CellRendererPixbuf()
+        renderer.set_property("icon-name", "list-remove")
+        self.close_column.pack_start(renderer, False)
+        self.close_column.set_cell_data_func(renderer, self.__get_close_button)
 
-        if self.spinner.get_parent() == None:
-            self.hbox.pack_end(self.spinner, False, False, 0)
+        self.view.append_column(self.close_column)
 
-        self.spinner.start()
         self.show_all()
 
-    def stop_spinner(self):
-        self.spinner.stop()
-        if self.spinner.get_parent() == self.hbox:
-            self.hbox.remove(self.spinner)
+    def __get_label(self, col, cell, model, iter, user_data):
+        cell.set_property("text", model.get_value(iter, LABEL))
 
-        if self.button.get_parent() == None and self.use_close_button:
-            self.hbox.pack_end(self.button, False, False, 0)
+        unread = model.get_value(iter, UNREAD) > 0
+        cell.set_property("weight", Pango.Weight.BOLD if unread else Pango.Weight.NORMAL)
 
-        self.show_all()
+    def __get_counter(self, col, cell, model, iter, user_data):
+        unread = model.get_value(iter, UNREAD)
+        mentions = model.get_value(iter, MENTIONS)
 
+        cell.set_property("text", str(unread) if unread > 0 else "")
+        cell.set_property("foreground", Color.MENTION_TAG if mentions > 0 else None)
 
-class ChannelsListBox(Gtk.ScrolledWindow):
+    def __get_close_button(self, col, cell, model, iter, user_data):
+        cell.set_property("visible", model.get_value(iter, CLOSABLE) and
+                                     not model.get_value(iter, SPINNING))
 
-    __gsignals__ = {
-        "channel-selected": (GObject.SIGNAL_RUN_FIRST, None, [str]),
-        "channel-removed": (GObject.SIGNAL_RUN_FIRST, None, [str]),
-    }
+    def add_network(self, network):
+        # The status tab of a network, closing it closes the network
+        self.add_channel(network, STATUS_CHANNEL, show=network)
 
-    def __init__(self):
-        Gtk.ScrolledWindow.__init__(self)
+    def remove_network(self, network):
+        if network not in self.networks:
+            return
 
-        self.items = []
-        self.vbox = Gtk.VBox()
+        for key in [key for key in self.rows if key[0] == network]:
+            self.spinning.discard(key)
+            self.model.remove(self.rows.pop(key))
 
-        self.set_size_request(250, -1)
+        self.networks.pop(network)
 
-        if SUGAR:
-            self.modify_bg(Gtk.StateType.NORMAL, Color.WHITE)
+        if self.selected is not None and self.selected[0] == network:
+            self.selected = None
+            if len(self.model) > 0:
+                self.select_iter(self.model[len(self.model) - 1].iter)
 
-        self.add(self.vbox)
-        self.add_status_tab()
-        self.show_all()
+    def add_channel(self, network, channel, show=None, close_button=True):
+        key = (network, channel)
+        if key in self.rows:
+            return
 
-    def add_status_tab(self):
-        self.add_channel(STATUS_CHANNEL, show="Status", close_button=False)
+        # The channels of a network go together, after its status tab
+        position = 0
+        for name, count in self.networks.items():
+            position += count
+            if name == network:
+                break
 
-    def add_channel(self, channel, show=None, close_button=True):
-        item = ChannelItem(channel, show=show, close_button=close_button)
-        item.connect("selected", self.select_item)
-        item.connect("removed", self.remove_item)
-        self.vbox.pack_start(item, False, False, 0)
+        self.networks[network] = self.networks.get(network, 0) + 1
 
-        self.items.append(item)
-        self.select_item(item)
-        self.show_all()
+        self.rows[key] = self.model.insert(position, [network, channel, show or channel,
+                                                      True, 0, 0, 0, close_button])
+        self.start_spinner(key)
+        self.select_iter(self.rows[key])
 
-    def remove_item(self, item):
-        selected = item.selected
-        idx = self.items.index(item)
-        self.items.remove(item)
-        self.vbox.remove(item)
+    def remove_channel(self, network, channel):
+        key = (network, channel)
+        if key not in self.rows:
+            return
 
-        self.emit("channel-removed", item.channel)
-        item.destroy()
+        iter = self.rows.pop(key)
+        position = self.model.get_path(iter).get_indices()[0]
 
-        if idx > 0:
-            idx -= 1
+        self.spinning.discard(key)
+        self.networks[network] -= 1
+        self.model.remove(iter)
 
-        if self.items and selected:
-            self.select_item(self.items[idx])
+        if key == self.selected:
+            self.selected = None
+            if len(self.model) > 0:
+                self.select_iter(self.model[max(position - 1, 0)].iter)
 
-    def select_item(self, item):
-        for i in self.items:
-            i.set_selected(i == item)
+    def remove_item(self, network, channel):
+        # The user closed it
+        self.remove_channel(network, channel)
+        self.emit("channel-removed", network, channel)
 
-        self.emit("channel-selected", item.channel)
+    def select_iter(self, iter):
+        self.view.get_selection().select_iter(iter)
 
-    def select_item_from_string(self, channel):
-        for item in self.items:
-            if item.channel == channel:
-                self.select_item(item)
-                break
+    def select_item_from_string(self, network, channel):
+        if (network, channel) in self.rows:
+            self.select_iter(self.rows[(network, channel)])
 
-    def change_spinner(self, channel, active):
-        for item in self.items:
-            if item.channel == channel:
-                if active:
-                    item.start_spinner()
+    def _selection_changed(self, selection):
+        model, iter = selection.get_selected()
+        if iter is None:
+            return
 
-                else:
-                    item.stop_spinner()
+        key = (model.get_value(iter, NETWORK), model.get_value(iter, CHANNEL))
+        if key == self.selected:
+            return
 
-                break
+        self.selected = key
+        self.model.set(iter, UNREAD, 0, MENTIONS, 0)
+        self.emit("channel-selected", key[0], key[1])
+
+    def _button_press(self, view, event):
+        if event.button != 1:
+            return False
+
+        position = view.get_path_at_pos(int(event.x), int(event.y))
+        if position is None or position[1] != self.close_column:
+            return False
+
+        iter = self.model.get_iter(position[0])
+        if self.model.get_value(iter, CLOSABLE) and not self.model.get_value(iter, SPINNING):
+            self.remove_item(self.model.get_value(iter, NETWORK), self.model.get_value(iter, CHANNEL))
+            return True
+
+        return False
+
+    def add_unread(self, network, channel, mentioned=False):
+        key = (network, channel)
+        if key not in self.rows or key == self.selected:
+            return
+
+        iter = self.rows[key]
+        unread = self.model.get_value(iter, UNREAD) + 1
+        mentions = self.model.get_value(iter, MENTIONS) + int(mentioned)
+        self.model.set(iter, UNREAD, unread, MENTIONS, mentions)
+
+    def get_unread(self, network, channel):
+        # Returns (unread messages, mentions)
+        iter = self.rows[(network, channel)]
+        return (self.model.get_value(iter, UNREAD), self.model.get_value(iter, MENTIONS))
+
+    def set_unread(self, network, channel, unread, mentions):
+        key = (network, channel)
+        if key in self.rows and key != self.selected:
+            self.model.set(self.rows[key], UNREAD, unread, MENTIONS, mentions)
+
+    def change_spinner(self, network, channel, active):
+        if active:
+            self.start_spinner((network, channel))
+
+        else:
+            self.stop_spinner((network, channel))
+
+    def start_spinner(self, key):
+        if key not in self.rows:
+            return
+
+        self.spinning.add(key)
+        self.model.set_value(self.rows[key], SPINNING, True)
+
+        if self._pulse_id is None:
+            self._pulse_id = GObject.timeout_add(SPINNER_INTERVAL, self._pulse_cb)
+
+    def stop_spinner(self, key):
+        if key not in self.spinning:
+            return
+
+        self.spinning.discard(key)
+        self.model.set_value(self.rows[key], SPINNING, False)
+
+    def _pulse_cb(self):
+        # Only the rows with a spinner change
+        for key in self.spinning:
+            iter = self.rows[key]
+            self.model.set_value(iter, PULSE, self.model.get_value(iter, PULSE) + 1)
+
+        if self.spinning == set():
+            self._pulse_id = None
+            return False
+
+        return True
@@ -20,10 +20,15 @@
 
 from gettext import gettext as _
 
+from collections import OrderedDict
+
 from consts import CONNECTION_ERROR, NICKNAME_USED, SUGAR, CHAT_FONT, Color, \
-                   Key, STATUS_CHANNEL
+                   Key, STATUS_CHANNEL, RENDER_INTERVAL, HIDDEN_FLUSH_LINES, \
+                   CHANNEL_WIDGETS_TIMEOUT, UserType
 
-from utils import get_urls, beep, remove_usertypes
+from utils import beep, to_unicode
+import formatting
+from channel import Channel, Network
 from nicknames_listbox import NicknamesListBox
 from topic_label import TopicLabel
 
@@ -40,27 +45,25 @@ class ChatBox(Gtk.VBox):
 
     __gsignals__ = {
         "stop-widget": (GObject.SIGNAL_RUN_FIRST, None, [str]),  # Channel
-        "send-message": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Channel, message
-        "command": (GObject.SIGNAL_RUN_FIRST, None, [str, str, str]),   # Channel, command, parameters
-        "change-nickname": (GObject.SIGNAL_RUN_FIRST, None, [str]),  # New nickname
-        "query": (GObject.SIGNAL_RUN_FIRST, None, [str]),  # Nickname
-        "change-topic": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Channel, Topic
+        "send-message": (GObject.SIGNAL_RUN_FIRST, None, [str, str, str]),  # Network, Channel, message
+        "command": (GObject.SIGNAL_RUN_FIRST, None, [str, str, str, str]),   # Network, Channel, command, parameters
+        "change-nickname": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Network, New nickname
+        "query": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Network, Nickname
+        "change-topic": (GObject.SIGNAL_RUN_FIRST, None, [str, str, str]),  # Network, Channel, Topic
+        "new-message": (GObject.SIGNAL_RUN_FIRST, None, [str, str, bool]),  # Network, Channel, Mentioned
     }
 
     def __init__(self):
         Gtk.VBox.__init__(self)
 
-        self.nick = None
-        self.current_channel = None
-        self.channels = [ ]
-        self.last_nick = { }  # channel: str
-        self.nicks = { }  # channel: list
-        self.views = { }  # channel: GtkTextView
-        self.buffers = { }  # channel: GtkTextBuffer
-        self.nicks_listboxs = { }  # channel: NicknamesListBox
-        self.topic_labels = { }  # channel: TopicLabel
+        self.current_channel = None  # (network, channel name)
+        self.networks = { }  # network: Network
+        self.channels = OrderedDict()  # (network, channel name): Channel
+        self.keywords = []
 
         self._last_tag = "message2"
+        self._flush_id = None
+        self._completion = None  # [channel key, (text before, after the word), candidates, index, completed text]
 
         self.set_size_request(400, -1)
         self.set_margin_left(10)
@@ -79,6 +82,7 @@ class ChatBox(Gtk.VBox):
         vbox.pack_start(hbox, True, True, 5)
 
         self.scroll = Gtk.ScrolledWindow()
+        self.scroll.get_vadjustment().connect("value-changed", self._scroll_changed)
         hbox.pack_start(self.scroll, True, True, 0)
 
         self.nicks_box = Gtk.VBox()
@@ -103,57 +107,107 @@ class ChatBox(Gtk.VBox):
         hbox.pack_start(self.entry, True, True, 0)
 
         self.set_entries_theme()
-        self.add_status_tab()
-        self.switch_channel(STATUS_CHANNEL)
 
     def __key_press_cb(self, widget, event):
-        if event.keyval == Key.TAB and self.entry.has_focus():
+        if event.keyval == Key.TAB and self.entry.has_focus() and \
+           self.current_channel is not None:
+            self.complete_nickname()
+            return True
+
+        self._completion = None
+        return False
+
+    def complete_nickname(self):
+        # Pressing Tab again goes to the next candidate
+        text = to_unicode(self.entry.get_text())
+        completion = self._completion
+
+        if completion is None or completion[0] != self.current_channel or completion[4] != text:
             pos = self.entry.props.cursor_position
-            text = self.entry.get_text()[:pos].split(" ")[-1]
+            word = text[:pos].split(" ")[-1]
+            start = pos - len(word)
 
-            for nick in self.nicks[self.current_channel]:
-                if nick.startswith(text):
-                    # TODO: Autocomplete
-                    pass
+            channel = self.channels[self.current_channel]
+            candidates = channel.completer.complete(word.encode("utf-8"))
+            if candidates == []:
+                self._completion = None
+                return
 
-            return True
+            # The text around the word, the candidates go between them
+            completion = [self.current_channel, (text[:start], text[pos:]), candidates, -1, None]
 
-        return False
+        completion[3] = (completion[3] + 1) % len(completion[2])
+        before, after = completion[1]
+        nickname = to_unicode(completion[2][completion[3]])
+        nickname += u": " if before == u"" else u" "
+
+        completion[4] = before + nickname + after.lstrip(u" ")
+        self._completion = completion
+
+        self.entry.set_text(completion[4])
+        self.entry.set_position(len(before + nickname))
 
     def _change_nickname(self, widget):
-        self.emit("change-nickname", self.nicker.get_text())
+        if self.current_channel is not None:
+            self.emit("change-nickname", self.current_channel[0], self.nicker.get_text())
+
         self.nicker.set_text("")
 
-    def add_status_tab(self):
-        self.add_channel(STATUS_CHANNEL)
-
-    def add_channel(self, channel):
-        if channel not in self.channels:
-            self.channels.append(channel)
-            self.views[channel] = self.make_textview_for_channel(channel)
-            self.buffers[channel] = self.views[channel].get_buffer()
-            self.last_nick[channel] = None
-            self.nicks[channel] = []
-            self.nicks_listboxs[channel] = NicknamesListBox()
-            self.nicks_listboxs[channel].connect("query", self._query)
-
-            self.topic_labels[channel] = TopicLabel()
-            self.topic_labels[channel].connect("change-topic", self._change_topic)
-
-            self.create_tags(channel)
-
-    def remove_channel(self, channel):
-        if channel in self.channels:
-            idx = self.channels.index(channel)
-            self.channels.remove(channel)
-            self.views.pop(channel)
-            self.buffers.pop(channel)
-            self.nicks.pop(channel)
-            self.nicks_listboxs.pop(channel)
-            self.topic_labels.pop(channel)
-
-    def switch_channel(self, channel):
-        if channel == self.current_channel:
+    def add_network(self, network, nick):
+        # Every network has its own status tab and nicknames
+        if network in self.networks:
+            return
+
+        self.networks[network] = Network(network)
+        self.networks[network].highlighter.set_keywords(self.keywords)
+        self.set_nickname(network, nick)
+        self.add_channel(network, STATUS_CHANNEL)
+
+    def remove_network(self, network):
+        for channel in self.get_channels(network):
+            self.remove_channel(network, channel)
+
+        self.networks.pop(network, None)
+
+    def add_channel(self, network, channel):
+        if (network, channel) not in self.channels:
+            self.channels[(network, channel)] = Channel(network, channel)
+
+    def remove_channel(self, network, channel):
+        if (network, channel) in self.channels:
+            channel = self.channels.pop((network, channel))
+            self.networks[network].nick_index.remove_channel(channel.name, channel.nicks)
+
+            if channel.hide_id is not None:
+                GObject.source_remove(channel.hide_id)
+
+            if channel.key == self.current_channel:
+                self.current_channel = None
+
+            channel.close()
+
+    def has_channel(self, network, channel):
+        return (network, channel) in self.channels
+
+    def get_channels(self, network):
+        return [name for net, name in self.channels if net == network]
+
+    def get_channel(self, network, channel):
+        if not (network, channel) in self.channels and (network, channel[1:]) in self.channels:
+            channel = channel[1:]  # twisted adds a hash to nicknames too
+
+        return self.channels[(network, channel)]
+
+    def get_current_channel(self, network):
+        # The channel the user is looking at, or the status tab if it's
+        # on other network
+        if self.current_channel is not None and self.current_channel[0] == network:
+            return self.current_channel[1]
+
+        return STATUS_CHANNEL
+
+    def switch_channel(self, network, channel):
+        if (network, channel) == self.current_channel:
             return
 
         if self.topic_box.get_children() != []:
@@ -165,15 +219,53 @@ class ChatBox(Gtk.VBox):
         if self.nicks_box.get_children() != []:
             self.nicks_box.remove(self.nicks_box.get_children()[0])
 
-        self.current_channel = channel
-        self.scroll.add(self.views[self.current_channel])
+        if self.current_channel in self.channels:
+            self.hide_channel(self.channels[self.current_channel])
+
+        self.current_channel = (network, channel)
+        channel = self.channels[self.current_channel]
+        self.show_channel(channel)
+        self.scroll.add(channel.view)
+        self.nicker.set_placeholder_text(self.networks[network].nick or "")
+        self.update_entry_placeholder()
 
-        if channel.startswith("#"):  # Is a channel, not a nickname
-            self.nicks_box.pack_start(self.nicks_listboxs[channel], True, True, 0)
-            self.topic_box.pack_start(self.topic_labels[self.current_channel], True, True, 0)
+        if channel.name.startswith("#"):  # Is a channel, not a nickname
+            self.nicks_box.pack_start(channel.nicks_listbox, True, True, 0)
+            self.topic_box.pack_start(channel.topic_label, True, True, 0)
 
         self.show_all()
 
+    def show_channel(self, channel):
+        if channel.hide_id is not None:
+            GObject.source_remove(channel.hide_id)
+            channel.hide_id = None
+
+        if not channel.has_widgets():
+            view = self.make_textview_for_channel(channel.name)
+            self.create_tags(view.get_buffer())
+
+            nicks_listbox = NicknamesListBox()
+            nicks_listbox.connect("query", self._query, channel)
+
+            topic_label = TopicLabel()
+            topic_label.connect("change-topic", self._change_topic, channel)
+
+            channel.set_widgets(view, nicks_listbox, topic_label)
+
+        channel.flush()
+
+    def hide_channel(self, channel):
+        # The widgets are destroyed if the user doesn't come back soon
+        channel.hide_id = GObject.timeout_add_seconds(CHANNEL_WIDGETS_TIMEOUT,
+                                                      self._destroy_widgets_cb,
+                                                      channel)
+
+    def _destroy_widgets_cb(self, channel):
+        channel.hide_id = None
+        channel.destroy_widgets()
+
+        return False
+
     def make_textview_for_channel(self, channel):
         view = Gtk.TextView()
         view.set_editable(False)
@@ -183,77 +275,175 @@ class ChatBox(Gtk.VBox):
 
         return view
 
-    def set_nickname(self, nick):
-        self.nick = nick
-        self.nicker.set_placeholder_text(self.nick)
+    def set_nickname(self, network, nick):
+        network = self.networks[network]
+        network.nick = to_unicode(nick)
+        network.highlighter.set_nickname(network.nick)
+
+        if self.current_channel is not None and self.current_channel[0] == network.name:
+            self.nicker.set_placeholder_text(network.nick)
+
+    def set_send_queue(self, network, lines, seconds):
+        self.networks[network].send_queue = (lines, seconds)
+
+        if self.current_channel is not None and self.current_channel[0] == network:
+            self.update_entry_placeholder()
+
+    def update_entry_placeholder(self):
+        lines, seconds = self.networks[self.current_channel[0]].send_queue
+
+        if lines == 0:
+            self.entry.set_placeholder_text(_("Speak"))
+
+        else:
+            self.entry.set_placeholder_text(_("Sending {lines} lines, about {seconds} seconds").format(lines=lines, seconds=int(seconds + 0.5)))
+
+    def get_nickname(self, network):
+        return self.networks[network].nick
 
     def send_message(self, widget):
+        if self.current_channel is None:
+            return
+
+        network, channel = self.current_channel
         message = self.entry.get_text()
 
         if not message.startswith("/"):
-            self.emit("send-message", self.current_channel, message)
-            self.add_message_to_view(self.current_channel, self.nick, message, force=True)
+            self.emit("send-message", network, channel, message)
+            self.add_message_to_view(network, channel, self.get_nickname(network), message, force=True)
 
         else:
             command = message.split(" ")[0]
             parameters = message[len(command):].strip()
-            self.emit("command", self.current_channel, command, parameters)
+            self.emit("command", network, channel, command, parameters)
 
         self.entry.set_text("")
 
-    def add_text_with_tag(self, channel, text, tag):
-        if not channel in self.channels and channel[1:] in self.channels:
-            channel = channel[1:]
+    def add_text_with_tag(self, network, channel, text, tag):
+        text = to_unicode(text)
+        self.add_text_with_tags(network, channel, text, [(0, len(text), tag)])
 
-        end = self.buffers[channel].get_end_iter()
-        self.buffers[channel].insert_with_tags_by_name(end, text, tag)
+    def add_text_with_tags(self, network, channel, text, tags):
+        # tags: list of (start, end, tag name), relative to text
+        channel = self.get_channel(network, channel)
+        channel.add_text(text, tags)
 
-    def add_system_message(self, channel, message):
-        self.last_nick[channel] = "<SYSTEM>"
-        self.add_text_with_tag(channel, message + "\n", "sys-msg")
+        # Hidden channels are drawn when the user switches to them, unless
+        # too many messages are waiting
+        if channel.key != self.current_channel and \
+           len(channel.pending) < HIDDEN_FLUSH_LINES:
+            return
 
-    def add_message_to_view(self, channel, user, message, force=False):
-        if user != self.nick or force:
-            if user == self.last_nick[channel]:
-                user = " "  * (len(user) + 2)
+        if self._flush_id is None:
+            self._flush_id = GObject.timeout_add(RENDER_INTERVAL, self._flush_cb)
+
+    def _flush_cb(self):
+        self._flush_id = None
+
+        for channel in self.channels.values():
+            if channel.key == self.current_channel or \
+               len(channel.pending) >= HIDDEN_FLUSH_LINES:
+                channel.flush()
+
+        return False
+
+    def _scroll_changed(self, adjustment):
+        if self.current_channel is not None and \
+           adjustment.get_value() == adjustment.get_lower() and \
+           adjustment.get_upper() > adjustment.get_page_size():
+            self.channels[self.current_channel].load_scrollback()
+
+    def add_system_message(self, network, channel, message):
+        text, tags = self.format_system_message(self.get_channel(network, channel), message)
+        self.add_text_with_tags(network, channel, text, tags)
+
+    def format_system_message(self, channel, message):
+        channel.last_nick = "<SYSTEM>"
+
+        message, spans = formatting.decode(to_unicode(message))
+        text = message + u"\n"
+        return text, [(0, len(text), "sys-msg")] + spans
+
+    def add_message_to_view(self, network, channel, user, message, force=False):
+        channel = self.get_channel(network, channel)
+        network = self.networks[network]
+
+        text, tags, mentioned = self.format_message(network, channel, user, message, force)
+        self.add_text_with_tags(network.name, channel.name, text, tags)
+
+        if not force:
+            self.emit("new-message", network.name, channel.name, mentioned)
+
+        if mentioned:
+            beep()
+
+    def add_history(self, network, channel, messages):
+        # Messages missed while disconnected, messages: list of
+        # (time, nickname, message, action). They go to the view as one
+        # block, with a single new-message and beep for all of them
+        channel = self.get_channel(network, channel)
+        network = self.networks[network]
+        mentioned = False
+
+        text, tags = self.format_system_message(channel, _("== Missed messages:"))
+        channel.add_text(text, tags)
+
+        for when, nickname, message, action in messages:
+            if action:
+                text, tags = self.format_system_message(channel, _(" * {nickname} {message}").format(nickname=nickname, message=message))
 
             else:
-                self.last_nick[channel] = user
-                user += ": "
+                text, tags, mention = self.format_message(network, channel, nickname, message)
+                mentioned = mentioned or mention
 
-        self.add_text_with_tag(channel, user, "nick")
+            channel.add_text(text, tags)
 
-        end = self.buffers[channel].get_end_iter()
-        offset = end.get_offset()
+        if channel.key == self.current_channel or \
+           len(channel.pending) >= HIDDEN_FLUSH_LINES:
+            channel.flush()
 
-        tag = "message1" if self._last_tag == "message2" else "message2"
-        self._last_tag = tag
-        self.add_text_with_tag(channel, message + "\n", tag)
-        end = self.buffers[channel].get_iter_at_offset(offset)
+        self.emit("new-message", network.name, channel.name, mentioned)
+
+        if mentioned:
+            beep()
 
-        if self.last_nick[channel] != self.nick:
-            self.search_and_mark(channel, self.nick, end, "mention")
+    def format_message(self, network, channel, user, message, force=False):
+        # Returns the text of the message, its tags and if it mentions us
+        if not force:
+            channel.completer.spoke(user)
 
-        offset = end.get_offset()
+        user = to_unicode(user)
+        message = to_unicode(message)
 
-        for url in get_urls(message):
-            end = self.buffers[channel].get_iter_at_offset(offset)
-            self.search_and_mark(channel, url, end, "url")
+        if user != network.nick or force:
+            if user == channel.last_nick:
+                user = " "  * (len(user) + 2)
 
-    def search_and_mark(self, channel, text, start, tag):
-        end = self.buffers[channel].get_end_iter()
-        match = start.forward_search(text, 0, end)
+            else:
+                channel.last_nick = user
+                user += ": "
+
+        tag = "message1" if self._last_tag == "message2" else "message2"
+        self._last_tag = tag
 
-        if match != None:
-            match_start, match_end = match
-            self.buffers[channel].apply_tag_by_name(tag, match_start, match_end)
-            self.search_and_mark(channel, text, match_end, tag)
+        message, spans = formatting.decode(message)
+        text = user + message + "\n"
+        start = len(user)
+        tags = [(0, start, "nick"), (start, len(text), tag)]
+        tags += [(start + begin, start + end, name) for begin, end, name in spans]
 
-            if tag == "mention":
-                beep()
+        marks, mentioned = network.highlighter.get_tags(text, start,
+                                                        mentions=channel.last_nick != network.nick)
+        return text, tags + marks, mentioned
 
-    def message_recived(self, channel, nick, message):
-        self.add_message_to_view(channel, nick, message)
+    def set_highlight_keywords(self, keywords):
+        self.keywords = [to_unicode(keyword) for keyword in keywords]
+
+        for network in self.networks.values():
+            network.highlighter.set_keywords(self.keywords)
+
+    def message_recived(self, network, channel, nick, message):
+        self.add_message_to_view(network, channel, nick, message)
 
     def set_entries_theme(self):
         theme_entry = "GtkEntry {border-radius:0px 30px 30px 0px;}"
@@ -272,8 +462,7 @@ class ChatBox(Gtk.VBox):
         style_context.add_provider(css_provider_nicker,
                                    Gtk.STYLE_PROVIDER_PRIORITY_USER)
 
-    def create_tags(self, channel):
-        buffer = self.buffers[channel]
+    def create_tags(self, buffer):
         message1 = buffer.create_tag("message1", foreground=Color.MESSAGE_BG_TAG1)
         message2 = buffer.create_tag("message2", foreground=Color.MESSAGE_BG_TAG2)
         buffer.create_tag("nick", foreground=Color.NICK_TAG)
@@ -289,40 +478,79 @@ class ChatBox(Gtk.VBox):
     def get_entry(self):
         return self.entry
 
-    def set_nicknames(self, channel, nicknames):
-        if channel in self.channels:  # twisted factory add a hash to nicks too
-            self.nicks_listboxs[channel].set_list(nicknames)
-            self.nicks[channel] = remove_usertypes(nicknames)
-
-    def add_nickname(self, channel, nickname):
-        self.nicks[channel].append(nickname)
-        self.nicks_listboxs[channel].add_nickname(nickname)
-
-    def remove_nickname(self, channel, nickname):
-        self.nicks[channel].remove(nickname)
-        self.nicks_listboxs[channel].remove_nickname(nickname)
-
-    def set_topic(self, channel, topic):
-        if channel in self.channels:
-            self.topic_labels[channel].set_topic(topic)
-
-    def remove_nickname_from_all_channels(self, nickname):
-        for channel in self.nicks.keys():
-            if nickname in self.nicks[channel]:
-                self.remove_nickname(channel, nickname)
-
-    def _query(self, widget, nickname):
-        if nickname != self.nick:
-            self.emit("query", nickname)
-
-    def _change_topic(self, widget, topic):
-        self.emit("change-topic", self.current_channel, topic)
-
-    def set_user_afk(self, nickname, afk):
-        for channel in self.nicks.keys():
-            if nickname in self.nicks[channel]:
-                self.nicks_listboxs[channel].set_afk(nickname, afk)
-
-    def set_user_mode(self, channel, usertype, nickname):
-        if channel in self.channels:  # Nicknames aren't channels (/query nickname)
-            self.nicks_listboxs[channel].set_user_type(nickname, usertype)
+    def set_nicknames(self, network, channel, nicknames):
+        if (network, channel) in self.channels:  # twisted factory add a hash to nicks too
+            channel = self.channels[(network, channel)]
+            nick_index = self.networks[network].nick_index
+            nick_index.remove_channel(channel.name, channel.nicks)
+            channel.set_nicknames(nicknames)
+            nick_index.add_channel(channel.name, channel.nicks)
+
+    def add_nicknames(self, network, channel, nicknames):
+        if (network, channel) in self.channels:
+            self.channels[(network, channel)].add_nicknames(nicknames)
+            self.networks[network].nick_index.add_channel(channel, [nickname for nickname, usertype in nicknames])
+
+    def add_nickname(self, network, channel, nickname, usertype=UserType.NORMAL):
+        self.channels[(network, channel)].add_nickname(nickname, usertype)
+        self.networks[network].nick_index.add(channel, nickname)
+
+    def remove_nickname(self, network, channel, nickname):
+        nick_index = self.networks[network].nick_index
+        self.channels[(network, channel)].remove_nickname(nick_index.get_nickname(channel, nickname))
+        nick_index.remove(channel, nickname)
+
+    def get_nickname_channels(self, network, nickname):
+        # Returns {channel: nickname as written in that channel}
+        return self.networks[network].nick_index.get_channels(nickname)
+
+    def rename_nickname(self, network, old_nick, new_nick):
+        nick_index = self.networks[network].nick_index
+
+        for channel, nickname in self.get_nickname_channels(network, old_nick).items():
+            self.channels[(network, channel)].rename_nickname(nickname, new_nick)
+            nick_index.remove(channel, nickname)
+            nick_index.add(channel, new_nick)
+
+    def get_channel_snapshot(self, network, channel, lines):
+        channel = self.channels[(network, channel)]
+        return {
+            "name": to_unicode(channel.name),
+            "topic": to_unicode(channel.topic),
+            "nicks": [(to_unicode(nick), usertype) for nick, usertype in channel.nicks.items()],
+            "lines": channel.get_recent_lines(lines),
+        }
+
+    def restore_channel_snapshot(self, network, snapshot):
+        # The server updates all of this when the channel is joined again
+        self.add_channel(network, snapshot["name"])
+        self.set_nicknames(network, snapshot["name"], [tuple(nick) for nick in snapshot["nicks"]])
+
+        channel = self.channels[(network, snapshot["name"])]
+        channel.restore_lines(snapshot["lines"])
+        channel.set_topic(snapshot["topic"])
+
+    def set_topic(self, network, channel, topic):
+        if (network, channel) in self.channels:
+            self.channels[(network, channel)].set_topic(formatting.strip(to_unicode(topic)))
+
+    def remove_nickname_from_all_channels(self, network, nickname):
+        for channel in self.get_nickname_channels(network, nickname):
+            self.remove_nickname(network, channel, nickname)
+
+    def _query(self, widget, nickname, channel):
+        if nickname != self.get_nickname(channel.network):
+            self.emit("query", channel.network, nickname)
+
+    def _change_topic(self, widget, topic, channel):
+        self.emit("change-topic", channel.network, channel.name, topic)
+
+    def set_users_afk(self, network, nicknames, afk):
+        for nickname in nicknames:
+            for channel, listed in self.get_nickname_channels(network, nickname).items():
+                self.channels[(network, channel)].set_afk(listed, afk)
+
+    def set_user_mode(self, network, channel, usertype, nickname):
+        if (network, channel) in self.channels:  # Nicknames aren't channels (/query nickname)
+            nickname = self.networks[network].nick_index.get_nickname(channel, nickname)
+            self.channels[(network, channel)].set_user_type(nickname, usertype)
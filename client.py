@@ -20,9 +20,16 @@
 
 import random
 
+from collections import OrderedDict
+
 from gettext import gettext as _
 
-from consts import ALL_CHANNELS, CURRENT_CHANNEL, UserType
+from consts import ALL_CHANNELS, CURRENT_CHANNEL, UserType, WHO_CHUNK_SIZE, \
+                   RECONNECT_MAX_DELAY, RECONNECT_MAX_RETRIES, RECONNECT_COOLDOWN, \
+                   JOIN_LINE_LENGTH, NAMES_RESYNC_DELAY, FLOOD_BUDGET, FLOOD_PENALTY, \
+                   CAPABILITIES, HISTORY_LINES
+from utils import irc_lower
+from events import EventBus
 
 from twisted.internet.error import ReactorAlreadyInstalledError
 
@@ -38,7 +45,27 @@ from twisted.internet import protocol
 from twisted.internet import ssl
 from twisted.internet import defer
 
-from gi.repository import GObject
+
+EVENTS = [
+    "signed-on",
+    "joined",  # Channel
+    "system-message",  # Channel, Message
+    "user-message",  # Channel, Nickname, Message
+    "nickname-changed",  # Nickname
+    "user-nickname-changed",  # Old nickname, New nickname
+    "user-joined",  # Channel, Nickname
+    "user-left",  # Channel, Nickname
+    "user-quit",  # Nickname, Message
+    "user-kicked",  # Channel, Nickname, Kicker, Message
+    "nicknames-list",  # Channel, list of (nickname, usertype)
+    "nicknames-added",  # Channel, list of (nickname, usertype)
+    "me-command",  # Channel, Nickname, Message
+    "status-message",  # Message
+    "topic-changed",  # Channel, Topic
+    "mode-changed",  # Channel, UserType, Nickname
+    "send-queue-changed",  # Lines waiting, Seconds to send them
+    "history",  # Channel, list of (time, nickname, message, action)
+]
 
 
 def get_random_nickname():
@@ -46,51 +73,133 @@ def get_random_nickname():
     return "Guest_" + "0" * (4 - len(number)) + number
 
 
-class Client(irc.IRCClient, GObject.GObject):
+class NicknamesRequest(object):
+    # A WHO or NAMES reply being received
+
+    WHO = "WHO"
+    NAMES = "NAMES"
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.nicknames = []  # (nickname, usertype)
+        self.shown = False
+
+
+class HistoryBatch(object):
+    # Missed messages of a channel being received, see Client.fetch_history
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.messages = []  # (time, nickname, message, action)
+
+
+class Client(irc.IRCClient):
 
     nickname = get_random_nickname()
     first_nickname = nickname
 
-    __gsignals__ = {
-        "signed-on": (GObject.SIGNAL_RUN_FIRST, None, []),
-        "joined": (GObject.SIGNAL_RUN_FIRST, None, [str]),  # Channel
-        "system-message": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Channel, Message
-        "user-message": (GObject.SIGNAL_RUN_FIRST, None, [str, str, str]),  # Channel, Nickname, Message
-        "nickname-changed": (GObject.SIGNAL_RUN_FIRST, None, [str]),  # Nickname
-        "user-nickname-changed": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Old nickname, New nickname
-        "user-joined": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Channel, Nickname
-        "user-left": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Channel, Nickname
-        "user-quit": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Nickname, Message
-        "user-kicked": (GObject.SIGNAL_RUN_FIRST, None, [str, str, str, str]),  # Channel, Nickname, Kicker, Message
-        "nicknames-list": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Channel, Nicknames list (splited by " ")
-        "me-command": (GObject.SIGNAL_RUN_FIRST, None, [str, str, str]), # Channel, Nickname, Message
-        "status-message": (GObject.SIGNAL_RUN_FIRST, None, [str]),  # Message
-        "topic-changed": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Channel, Topic
-        "mode-changed": (GObject.SIGNAL_RUN_FIRST, None, [str, str, str])  # Channel, UserType, Nickname
-    }
-
-    def start_gobject(self):
-        GObject.GObject.__init__(self)
-
-        self.__who_reply = []
-        self.__who_channel = None
+    # Pasting many lines doesn't get us disconnected for flooding
+    floodBudget = FLOOD_BUDGET
+    floodPenalty = FLOOD_PENALTY
+
+    capabilities = CAPABILITIES
+
+    def __init__(self):
+        self.__requests = { }  # (kind, irc_lower(channel)): NicknamesRequest
+        self.__usertypes = None  # Channel prefix symbol: (priority, usertype)
+        self.__stale = set()  # irc_lower(channel) without a nicknames list yet
+        self.__resync_id = None
+        self.__history = { }  # Batch reference: HistoryBatch
+
+    def emit(self, event, *args):
+        # The events go straight to the factory handlers, see EVENTS
+        self.factory.emit(event, *args)
 
     def signedOn(self):
+        self.factory.resetDelay()
         self.emit("signed-on")
         self.emit("status-message", _("== Signed on!"))
-        for c in self.factory.channels:
-            self.join(c)
+
+        # The server sends NAMES after every JOIN, channels without the
+        # list after a while are asked again
+        channels = [self.get_channel_name(channel) for channel in self.factory.channels]
+        self.__stale = set(irc_lower(channel) for channel in channels)
+        self.join_channels(channels)
+        self.__resync_id = (self.factory.clock or reactor).callLater(NAMES_RESYNC_DELAY, self.resync_names)
+
+    def connectionLost(self, reason):
+        if self.__resync_id is not None and self.__resync_id.active():
+            self.__resync_id.cancel()
+
+        self.__resync_id = None
+        irc.IRCClient.connectionLost(self, reason)
+
+    def get_channel_name(self, channel):
+        # Like IRCClient.join, queries are joined as a channel too
+        if channel[0] not in irc.CHANNEL_PREFIXES:
+            channel = "#" + channel
+
+        return channel
+
+    def sendQueueChanged(self):
+        self.emit("send-queue-changed", self.sendQueueDepth(), self.sendQueueDrainTime())
+
+    def join_channels(self, channels):
+        # Several channels on each JOIN line, as many as the server allows
+        targets = (self.supported.getFeature("TARGMAX") or { }).get("JOIN") or len(channels)
+        line = []
+
+        for channel in channels:
+            channel = self.get_channel_name(channel)
+            if line != [] and (len(line) >= targets or
+                               len(",".join(line + [channel])) > JOIN_LINE_LENGTH):
+                self.sendLine("JOIN %s" % ",".join(line))
+                line = []
+
+            line.append(channel)
+
+        if line != []:
+            self.sendLine("JOIN %s" % ",".join(line))
+
+    def resync_names(self):
+        self.__resync_id = None
+
+        for channel in self.factory.channels:
+            channel = self.get_channel_name(channel)
+            if irc_lower(channel) in self.__stale:
+                self.ask_for_names(channel)
 
     def joined(self, channel):
         self.emit("joined", channel)
         self.emit("status-message", _("== Joined: ") + channel)
-        self.who(channel)
+        # The server sends the NAMES list of the channel on its own
+
+        self.fetch_history(channel)
+
+    def fetch_history(self, channel):
+        # After reconnecting, what was said since the last message we saw
+        # comes in a single batch instead of being lost
+        if "draft/chathistory" not in self.enabledCapabilities or \
+           self.factory.last_time is None:
+            return
+
+        self.chathistory(channel, "timestamp=" + irc.formatServerTime(self.factory.last_time), HISTORY_LINES)
+
+    def batchStarted(self, reference, batch_type, params):
+        if batch_type == "chathistory":
+            self.__history[reference] = HistoryBatch(params[0])
+
+    def batchEnded(self, reference, batch_type, params):
+        history = self.__history.pop(reference, None)
+        if history is not None and history.messages != []:
+            self.emit("history", history.channel, history.messages)
 
     def privmsg(self, user, channel, msg):
         self.emit("user-message", channel, user.split("!")[0], msg)
 
     def nickChanged(self, nickname):
         self.nickname = nickname
+        self.factory.nickname = nickname  # Used again when reconnecting
         self.emit("nickname-changed", nickname)
 
     def irc_NICK(self, prefix, params):
@@ -134,39 +243,146 @@ class Client(irc.IRCClient, GObject.GObject):
         return self.nickname
 
     def who(self, channel):
-        self.__who_reply = []
-        self.__who_channel = channel
+        self.start_request(NicknamesRequest.WHO, channel)
         self.sendLine("WHO %s" % channel)
 
-    def irc_RPL_WHOREPLY(self, server, data):
-        usertype = UserType.NORMAL
-        if data[6] == "H":
-            usertype = UserType.NORMAL
+    def ask_for_names(self, channel):
+        self.start_request(NicknamesRequest.NAMES, channel)
+        self.sendLine("NAMES %s" % channel)
+
+    def start_request(self, kind, channel):
+        request = NicknamesRequest(channel)
+        self.__requests[(kind, irc_lower(channel))] = request
+
+        return request
+
+    def add_to_request(self, kind, channel, nicknames):
+        request = self.__requests.get((kind, irc_lower(channel)))
+        if request is None:  # Not asked by us, like NAMES after JOIN
+            request = self.start_request(kind, channel)
+
+        request.nicknames.extend(nicknames)
+
+        # Big channels are shown while the rest of the list arrives
+        if len(request.nicknames) >= WHO_CHUNK_SIZE:
+            self.emit_request(request)
+
+    def end_request(self, kind, channel):
+        self.__stale.discard(irc_lower(channel))
+        request = self.__requests.pop((kind, irc_lower(channel)), None)
+        if request is None:  # Empty reply
+            request = NicknamesRequest(channel)
+
+        self.emit_request(request)
+
+    def emit_request(self, request):
+        if not request.shown:
+            self.emit("nicknames-list", request.channel, request.nicknames)
+            request.shown = True
+
+        elif request.nicknames != []:
+            self.emit("nicknames-added", request.channel, request.nicknames)
+
+        request.nicknames = []
+
+    def connectionMade(self):
+        irc.IRCClient.connectionMade(self)
+
+        # What the server supported last time, until it tells us again
+        self.supported.parse(self.factory.isupport.values())
+
+    def isupport(self, options):
+        self.__usertypes = None  # PREFIX may have changed
 
-        elif data[6] == "H+":
-            usertype = UserType.MODERATOR
+        for option in options:
+            self.factory.isupport[option.split("=")[0]] = option
 
-        elif data[6] == "H@":
-            usertype = UserType.ADMIN
+    def get_prefix_symbols(self):
+        # Returns {channel prefix symbol: (priority, usertype)}
+        if self.__usertypes is None:
+            prefixes = self.supported.getFeature("PREFIX") or { }
+            operator = prefixes.get("o", ("@", 0))[1]
 
-        self.__who_reply.append(data[5] + "@" + usertype)
- 
-    def irc_RPL_ENDOFWHO(self, *nargs):
-        nicknames = ""
-        for nick in self.__who_reply:
-            nicknames += nick + " "
+            self.__usertypes = { }
+            for symbol, priority in prefixes.values():
+                usertype = UserType.ADMIN if priority <= operator else UserType.MODERATOR
+                self.__usertypes[symbol] = (priority, usertype)
 
-        nicknames = nicknames[:-1]
+        return self.__usertypes
 
-        self.emit("nicknames-list", self.__who_channel, nicknames)
- 
-        self.__who_reply = []
-        self.__who_channel = None
+    def get_usertype(self, symbols):
+        # symbols: channel prefixes of an user, like "@" or "@+" (multi-prefix)
+        usertypes = self.get_prefix_symbols()
+        best = None
+
+        for symbol in symbols:
+            if symbol in usertypes and (best is None or usertypes[symbol] < best):
+                best = usertypes[symbol]
+
+        return UserType.NORMAL if best is None else best[1]
+
+    def irc_RPL_WHOREPLY(self, prefix, params):
+        # params: me, channel, user, host, server, nickname, flags, hops and name
+        self.add_to_request(NicknamesRequest.WHO, params[1],
+                            [(params[5], self.get_usertype(params[6]))])
+
+    def irc_RPL_ENDOFWHO(self, prefix, params):
+        self.end_request(NicknamesRequest.WHO, params[1])
+
+    def irc_RPL_NAMREPLY(self, prefix, params):
+        # params: me, channel type, channel, prefixed nicknames
+        symbols = self.get_prefix_symbols()
+        nicknames = []
+
+        for nickname in params[3].split():
+            idx = 0
+            while idx < len(nickname) and nickname[idx] in symbols:
+                idx += 1
+
+            nicknames.append((nickname[idx:], self.get_usertype(nickname[:idx])))
+
+        self.add_to_request(NicknamesRequest.NAMES, params[2], nicknames)
+
+    def irc_RPL_ENDOFNAMES(self, prefix, params):
+        self.end_request(NicknamesRequest.NAMES, params[1])
+
+    def handleCommand(self, command, prefix, params):
+        # Lines of a history batch are collected, not shown as they arrive
+        history = self.get_history_batch()
+        if history is None:
+            irc.IRCClient.handleCommand(self, command, prefix, params)
+
+        elif command in ("PRIVMSG", "NOTICE") and len(params) > 1:
+            self.add_to_history(history, prefix, params[1])
+
+    def add_to_history(self, history, prefix, text):
+        nickname = prefix.split("!")[0]
+        when = self.update_last_time()
+        d = irc.ctcpExtract(text)
+
+        # Only /me actions can be shown, other CTCP requests are dropped
+        actions = [data for tag, data in d["extended"] if tag == "ACTION"]
+        if actions != []:
+            history.messages.append((when, nickname, actions[0], True))
+
+        elif d["extended"] == []:
+            history.messages.append((when, nickname, text, False))
+
+    def update_last_time(self):
+        # Returns the server time of the message being received
+        when = self.serverTime()
+        if when is not None and (self.factory.last_time is None or when > self.factory.last_time):
+            self.factory.last_time = when
+
+        return when
 
     def irc_PRIVMSG(self, prefix, params):
         channel = params[0]
         nickname = prefix.split("!")[0]
         d = irc.ctcpExtract(params[1])
+
+        self.update_last_time()
+
         if d["extended"] != []:
             message = d["extended"][0][1]
             self.emit("me-command", channel, nickname, message)
@@ -174,6 +390,13 @@ class Client(irc.IRCClient, GObject.GObject):
         else:
             irc.IRCClient.irc_PRIVMSG(self, prefix, params)
 
+    def get_history_batch(self):
+        # The HistoryBatch of the message being received, if any
+        if self.currentMessage is None:
+            return None
+
+        return self.__history.get(self.currentMessage.tags.get("batch"))
+
     def irc_unknown(self, prefix, command, params):
         pass
 
@@ -251,54 +474,43 @@ class Client(irc.IRCClient, GObject.GObject):
         self.emit("mode-changed", channel, usertype, args[0])
 
 
-class ClientFactory(protocol.ClientFactory, GObject.GObject):
+class ClientFactory(protocol.ReconnectingClientFactory):
 
-    protocol = Client
+    # Reconnects with a growing delay (and some jitter, so everybody doesn't
+    # come back at the same time). After RECONNECT_MAX_RETRIES failures the
+    # server is left alone for RECONNECT_COOLDOWN, then a single attempt is
+    # made before waiting again.
 
-    __gsignals__ = {
-        "signed-on": (GObject.SIGNAL_RUN_FIRST, None, []),
-        "joined": (GObject.SIGNAL_RUN_FIRST, None, [str]),  # Channel
-        "system-message": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Channel, Message
-        "user-message": (GObject.SIGNAL_RUN_FIRST, None, [str, str, str]),  # Channel, Nickname, Message
-        "nickname-changed": (GObject.SIGNAL_RUN_FIRST, None, [str]),  # Nickname
-        "user-nickname-changed": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Old nickname, New nickname
-        "user-joined": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Channel, Nickname
-        "user-left": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Channel, Nickname
-        "user-quit": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Nickname, Message
-        "user-kicked": (GObject.SIGNAL_RUN_FIRST, None, [str, str, str, str]),  # Channel, Nickname, Kicker, Message
-        "nicknames-list": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Channel, Nicknames list (splited by " ")
-        "me-command": (GObject.SIGNAL_RUN_FIRST, None, [str, str, str]), # Channel, Nickname, Message
-        "status-message": (GObject.SIGNAL_RUN_FIRST, None, [str]),  # Message
-        "topic-changed": (GObject.SIGNAL_RUN_FIRST, None, [str, str]),  # Channel, Topic
-        "mode-changed": (GObject.SIGNAL_RUN_FIRST, None, [str, str, str])  # Channel, UserType, Nickname
-    }
-
-    def __init__(self, channels):
-        GObject.GObject.__init__(self)
+    protocol = Client
+    maxDelay = RECONNECT_MAX_DELAY
+    maxRetries = RECONNECT_MAX_RETRIES
 
+    def __init__(self, network, channels, nickname=None):
+        self.events = EventBus(self, EVENTS)
+        self.network = network
         self.channels = channels
+        self.nickname = nickname or get_random_nickname()
+        self.isupport = OrderedDict()  # Name: ISUPPORT option as sent
+        self.last_time = None  # Server time of the last message, see Client.fetch_history
+        self.port = None
         self.client = None
+        self.connector = None
+        self.cooldown_id = None
+
+    def connect(self, event, callback, *args):
+        return self.events.connect(event, callback, *args)
+
+    def disconnect(self, handler_id):
+        self.events.disconnect(handler_id)
+
+    def emit(self, event, *args):
+        self.events.emit(event, *args)
 
     def buildProtocol(self, addr):
         self.client = Client()
         self.client.factory = self
-        self.client.start_gobject()
-
-        self.client.connect("signed-on", self._client_signed_on)
-        self.client.connect("joined", self._client_joined)
-        self.client.connect("system-message", self._client_system_message)
-        self.client.connect("user-message", self._client_user_message)
-        self.client.connect("nickname-changed", self._client_nickname_changed)
-        self.client.connect("user-nickname-changed", self._client_user_nickname_changed)
-        self.client.connect("user-joined", self._client_user_joined)
-        self.client.connect("user-left", self._client_left)
-        self.client.connect("user-quit", self._client_quit)
-        self.client.connect("user-kicked", self._client_kicked)
-        self.client.connect("nicknames-list", self._client_nicknames_list)
-        self.client.connect("me-command", self._client_me_command)
-        self.client.connect("status-message", self._client_status_message)
-        self.client.connect("topic-changed", self._client_topic_changed)
-        self.client.connect("mode-changed", self._client_mode_changed)
+        self.client.nickname = self.nickname
+        self.client.first_nickname = self.nickname
 
         return self.client
 
@@ -318,59 +530,56 @@ class ClientFactory(protocol.ClientFactory, GObject.GObject):
                 self.client.close_channel(channel)
 
     def clientConnectionLost(self, connector, reason):
-        self.emit("system-message", ALL_CHANNELS, _("Connection lost: {reason}").format(reason=reason))
-        connector.connect()
+        if not self.continueTrying:  # The user closed the network
+            return
 
-    def clientConnectionFailed(self, connector, reason):
-        self.emit("system-message", ALL_CHANNELS, _("Connection failed: {reason}").format(reason=reason))
+        # Only on the status tab, not on every channel
+        self.emit("status-message", _("== Connection lost: {reason}").format(reason=reason.getErrorMessage()))
+        protocol.ReconnectingClientFactory.clientConnectionLost(self, connector, reason)
 
-    def start_connection(self, host, port):
-        self.emit("system-message", ALL_CHANNELS, _("Connecting to {host}:{port}").format(host=host, port=port))
-        reactor.connectTCP(host, port, self)
-        reactor.run()
-
-    def _client_signed_on(self, client):
-        self.emit("signed-on")
-
-    def _client_joined(self, client, channel):
-        self.emit("joined", channel)
+    def clientConnectionFailed(self, connector, reason):
+        if not self.continueTrying:
+            return
 
-    def _client_system_message(self, client, channel, message):
-        self.emit("system-message", channel, message)
+        self.emit("status-message", _("== Connection failed: {reason}").format(reason=reason.getErrorMessage()))
+        protocol.ReconnectingClientFactory.clientConnectionFailed(self, connector, reason)
 
-    def _client_user_message(self, client, channel, nickname, message):
-        self.emit("user-message", channel, nickname, message)
+    def retry(self, connector=None):
+        protocol.ReconnectingClientFactory.retry(self, connector)
 
-    def _client_nickname_changed(self, client, nick):
-        # TODO: send "user-nickname-changed" too
-        self.emit("nickname-changed", nick)
+        if self._callID is not None:
+            self.emit("status-message", _("== Reconnecting in {delay} seconds").format(delay=int(self.delay)))
 
-    def _client_user_nickname_changed(self, client, old_nick, new_nick):
-        self.emit("user-nickname-changed", old_nick, new_nick)
+        elif self.continueTrying and self.cooldown_id is None:  # Too many retries
+            self.emit("status-message", _("== {network} doesn't answer, trying again in {minutes} minutes").format(network=self.network, minutes=RECONNECT_COOLDOWN // 60))
+            self.cooldown_id = (self.clock or reactor).callLater(RECONNECT_COOLDOWN, self._cooldown_cb)
 
-    def _client_user_joined(self, client, channel, nickname):
-        self.emit("user-joined", channel, nickname)
-
-    def _client_left(self, client, channel, nickname):
-        self.emit("user-left", channel, nickname)
+    def _cooldown_cb(self):
+        self.cooldown_id = None
 
-    def _client_quit(self, client, nickname, message):
-        self.emit("user-quit", nickname, message)
+        # A single attempt, if it fails the server is left alone again
+        self.retries = self.maxRetries
+        self.emit("status-message", _("== Connecting to {network}").format(network=self.network))
+        self.connector.connect()
 
-    def _client_kicked(self, client, channel, nickname, kicker, message):
-        self.emit("user-kicked", channel, nickname, kicker, message)
+    def start_connection(self, host, port):
+        self.emit("system-message", ALL_CHANNELS, _("Connecting to {host}:{port}").format(host=host, port=port))
+        self.port = port
+        self.connector = reactor.connectTCP(host, port, self)
 
-    def _client_nicknames_list(self, client, channel, nicknames):
-        self.emit("nicknames-list", channel, nicknames)
+        # Every network uses the same reactor
+        if not reactor.running:
+            reactor.run()
 
-    def _client_me_command(self, client, channel, nickname, message):
-        self.emit("me-command", channel, nickname, message)
+    def stop_connection(self):
+        self.stopTrying()
 
-    def _client_status_message(self, client, message):
-        self.emit("status-message", message)
+        if self.cooldown_id is not None:
+            self.cooldown_id.cancel()
+            self.cooldown_id = None
 
-    def _client_topic_changed(self, client, channel, topic):
-        self.emit("topic-changed", channel, topic)
+        if self.client is not None and self.client.transport is not None:
+            self.client.quit()
 
-    def _client_mode_changed(self, client, channel, usertype, nickname):
-        self.emit("mode-changed", channel, usertype, nickname)
+        if self.connector is not None:
+            self.connector.disconnect()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from bisect import bisect_left
+from heapq import nlargest
+
+from consts import COMPLETION_LIMIT
+from utils import irc_lower
+
+
+class NickCompleter(object):
+
+    # The nicknames of a channel sorted by their casemapped form, so the
+    # ones starting with a prefix are together and found with bisect. The
+    # candidates are given by who spoke last.
+
+    def __init__(self):
+        self.keys = []  # Sorted (irc_lower(nickname), nickname)
+        self.recency = { }  # irc_lower(nickname): number of the last message
+        self.messages = 0
+
+    def set_nicknames(self, nicknames):
+        self.keys = sorted((irc_lower(nickname), nickname) for nickname in nicknames)
+        self.recency = dict((key, self.recency[key]) for key, nickname in self.keys
+                            if key in self.recency)
+
+    def add_nickname(self, nickname):
+        key = (irc_lower(nickname), nickname)
+        idx = bisect_left(self.keys, key)
+        if idx == len(self.keys) or self.keys[idx] != key:
+            self.keys.insert(idx, key)
+
+    def add_nicknames(self, nicknames):
+        if len(nicknames) * 4 < len(self.keys):
+            for nickname in nicknames:
+                self.add_nickname(nickname)
+
+        else:
+            # Sorting everything again is cheaper than many inserts
+            self.keys = sorted(set(self.keys) | set((irc_lower(nickname), nickname) for nickname in nicknames))
+
+    def remove_nickname(self, nickname):
+        key = (irc_lower(nickname), nickname)
+        idx = bisect_left(self.keys, key)
+        if idx < len(self.keys) and self.keys[idx] == key:
+            del self.keys[idx]
+            self.recency.pop(key[0], None)
+
+    def rename_nickname(self, old_nick, new_nick):
+        recency = self.recency.get(irc_lower(old_nick))
+        self.remove_nickname(old_nick)
+        self.add_nickname(new_nick)
+
+        if recency is not None:
+            self.recency[irc_lower(new_nick)] = recency
+
+    def spoke(self, nickname):
+        self.messages += 1
+        self.recency[irc_lower(nickname)] = self.messages
+
+    def complete(self, prefix):
+        # Returns the nicknames starting with prefix, who spoke last first
+        if prefix == "":
+            return self.complete_recent()
+
+        prefix = irc_lower(prefix)
+        candidates = []
+
+        idx = bisect_left(self.keys, (prefix,))
+        while idx < len(self.keys) and self.keys[idx][0].startswith(prefix):
+            candidates.append(self.keys[idx])
+            idx += 1
+
+        candidates.sort(key=lambda key: -self.recency.get(key[0], 0))
+        return [nickname for key, nickname in candidates]
+
+    def complete_recent(self):
+        # Everyone would match, only who spoke last is worth offering
+        nicknames = []
+        for key in nlargest(COMPLETION_LIMIT, self.recency, key=self.recency.get):
+            idx = bisect_left(self.keys, (key,))
+            if idx < len(self.keys) and self.keys[idx][0] == key:
+                nicknames.append(self.keys[idx][1])
+
+        return nicknames
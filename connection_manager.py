@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from collections import OrderedDict
+
+
+class ConnectionManager(object):
+
+    # The networks the user is connected to. Each network has its own
+    # ClientFactory, all of them on the same reactor.
+
+    def __init__(self):
+        self.factories = OrderedDict()  # network: ClientFactory
+        self.handlers = []  # (event, callback, args), connected to every factory
+
+    def __contains__(self, network):
+        return network in self.factories
+
+    def __len__(self):
+        return len(self.factories)
+
+    def connect(self, event, callback, *args):
+        # The handlers get the factory first, factory.network tells the network
+        self.handlers.append((event, callback, args))
+
+        for factory in self.factories.values():
+            factory.connect(event, callback, *args)
+
+    def add_network(self, network, nickname, channels=None):
+        # Importing client installs the reactor and loads twisted's IRC, the
+        # login screen doesn't need any of that
+        from client import ClientFactory
+
+        factory = ClientFactory(network, channels or [], nickname)
+        for event, callback, args in self.handlers:
+            factory.connect(event, callback, *args)
+
+        self.factories[network] = factory
+
+        return factory
+
+    def start_connection(self, network, port):
+        self.factories[network].start_connection(network, port)
+
+    def remove_network(self, network):
+        if network in self.factories:
+            self.factories.pop(network).stop_connection()
+
+    def get_factory(self, network):
+        return self.factories[network]
+
+    def get_client(self, network):
+        return self.factories[network].client
@@ -19,13 +19,13 @@
 # Boston, MA 02111-1307, USA.
 
 import os
+import tempfile
 from gettext import gettext as _
 
 import gi
 gi.require_version("Gdk", "3.0")
 
 from gi.repository import Gdk
-from gi.repository import GdkPixbuf
 
 SUGAR = None
 try:
@@ -44,6 +44,15 @@ else:
 LOCAL_PATH = os.path.dirname(os.path.realpath(__file__))
 ICONS_DIR = os.path.join(LOCAL_PATH, "icons")
 
+TMP_DIR = tempfile.gettempdir()
+if "SUGAR_ACTIVITY_ROOT" in os.environ:
+    # /tmp can be a ramdisk, Sugar gives us a place on disk
+    TMP_DIR = os.path.join(os.environ["SUGAR_ACTIVITY_ROOT"], "tmp")
+
+LOGS_DIR = os.path.join(os.path.expanduser("~"), ".polari", "logs")
+if "SUGAR_ACTIVITY_ROOT" in os.environ:
+    LOGS_DIR = os.path.join(os.environ["SUGAR_ACTIVITY_ROOT"], "data", "logs")
+
 NEW_CHANNEL_SCREEN_FONT = "20"
 
 NICKNAME_USED = _(' is already in use.')
@@ -61,11 +70,42 @@ DEFAULT_SERVER = "irc.freenode.net"
 DEFAULT_PORT = "6667"
 DEFAULT_CHANNEL = "#sugar"
 
-ADMIN_PIXBUF = GdkPixbuf.Pixbuf.new_from_file(os.path.join(ICONS_DIR, "admin.png"))
-MODERATOR_PIXBUF = GdkPixbuf.Pixbuf.new_from_file(os.path.join(ICONS_DIR, "moderator.png"))
-NORMAL_PIXBUF = GdkPixbuf.Pixbuf.new_from_file(os.path.join(ICONS_DIR, "normal.png"))
+# Loaded the first time a nicknames list is drawn, see nicknames_listbox
+ADMIN_ICON = os.path.join(ICONS_DIR, "admin.png")
+MODERATOR_ICON = os.path.join(ICONS_DIR, "moderator.png")
+NORMAL_ICON = os.path.join(ICONS_DIR, "normal.png")
 
 AFK_COUNT = 900000  # 15 minutes on miliseconds
+AFK_TICK = 30000  # Miliseconds between AFK checks
+
+SCROLLBACK_LINES = 1000  # Lines kept on each channel view
+SCROLLBACK_TRIM = 200  # Lines moved to (and back from) the archive at once
+
+RENDER_INTERVAL = 40  # Miliseconds, messages received meanwhile are drawn together
+HIDDEN_FLUSH_LINES = 200  # Messages waiting on a hidden channel before they are drawn anyway
+CHANNEL_WIDGETS_TIMEOUT = 300  # Seconds a hidden channel keeps its widgets
+
+COMPLETION_LIMIT = 20  # Nicknames offered by Tab without a prefix, who spoke last
+
+WHO_CHUNK_SIZE = 500  # WHO replies shown before the whole list arrives
+
+RECONNECT_MAX_DELAY = 300  # Seconds, the backoff doesn't wait longer than this
+RECONNECT_MAX_RETRIES = 8  # Failed attempts before giving the server a rest
+RECONNECT_COOLDOWN = 1800  # Seconds before trying again a server that gave up
+JOIN_LINE_LENGTH = 400  # Characters of channel names on each JOIN line
+NAMES_RESYNC_DELAY = 15  # Seconds to wait for the NAMES replies after joining
+
+FLOOD_BUDGET = 10  # Seconds of penalty servers allow before throttling us
+FLOOD_PENALTY = 2  # Seconds of penalty of each line
+
+SESSION_LINES = 200  # Lines of each channel saved on the Journal
+
+CAPABILITIES = ["multi-prefix", "server-time", "batch", "message-tags",
+                "draft/chathistory"]  # IRCv3 capabilities asked to the servers
+HISTORY_LINES = 200  # Missed messages asked for each channel after reconnecting
+
+LOG_BATCH_SIZE = 500  # Messages written to the logs on each transaction
+LOG_SEARCH_LIMIT = 100  # Default number of results of a logs search
 
 
 class Screen:
@@ -118,6 +158,12 @@ class UserState:
     AFK = "AFK"
 
 
+class LogKind:
+    MESSAGE = "MESSAGE"
+    ACTION = "ACTION"
+    SYSTEM = "SYSTEM"
+
+
 class UserType:
     ADMIN = "ADMIN"
     MODERATOR = "MODERATOR"
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import traceback
+
+
+class EventBus(object):
+
+    # Signals for objects that aren't widgets. Emitting an event just calls
+    # the handlers, without the GObject marshalling of every argument.
+    # Handlers get the owner first, like GObject handlers get the emitter.
+
+    def __init__(self, owner, events):
+        self.owner = owner
+        self.handlers = { }  # Event: list of (id, callback, extra args)
+        self.last_id = 0
+
+        for event in events:
+            self.handlers[event] = []
+
+    def connect(self, event, callback, *args):
+        if event not in self.handlers:
+            raise TypeError("%r: unknown event for %r" % (event, self.owner))
+
+        self.last_id += 1
+        self.handlers[event].append((self.last_id, callback, args))
+
+        return self.last_id
+
+    def disconnect(self, handler_id):
+        for event, handlers in self.handlers.items():
+            self.handlers[event] = [handler for handler in handlers if handler[0] != handler_id]
+
+    def emit(self, event, *args):
+        for handler_id, callback, extra in self.handlers[event]:
+            try:
+                callback(self.owner, *(args + extra))
+
+            except Exception:
+                # Like GObject, a broken handler doesn't stop the emitter
+                traceback.print_exc()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+import re
+
+import gi
+gi.require_version("Pango", "1.0")
+
+from gi.repository import Pango
+
+
+# mIRC colors, by number
+COLORS = ["#FFFFFF", "#000000", "#00007F", "#009300",
+          "#FF0000", "#7F0000", "#9C009C", "#FC7F00",
+          "#FFFF00", "#00FC00", "#009393", "#00FFFF",
+          "#0000FC", "#FF00FF", "#7F7F7F", "#D2D2D2"]
+
+BOLD = u"\x02"
+COLOR = u"\x03"
+MONOSPACE = u"\x11"
+REVERSE = u"\x16"
+ITALIC = u"\x1d"
+STRIKETHROUGH = u"\x1e"
+UNDERLINE = u"\x1f"
+RESET = u"\x0f"
+
+# Attribute of each toggle code, and its tag
+TOGGLES = {
+    BOLD: "fmt-bold",
+    MONOSPACE: "fmt-monospace",
+    ITALIC: "fmt-italic",
+    STRIKETHROUGH: "fmt-strikethrough",
+    UNDERLINE: "fmt-underline",
+}
+
+CODES_RE = re.compile(u"\x03(?:(\\d{1,2})(?:,(\\d{1,2}))?)?|[\x02\x0f\x11\x16\x1d\x1e\x1f]")
+
+
+def get_color_tag(kind, number):
+    # Only the 16 standard colors get a tag, so a buffer has 32 at most
+    if number is None:
+        return None
+
+    number = int(number)
+    if number >= len(COLORS):
+        return None
+
+    return "fmt-%s-%d" % (kind, number)
+
+
+def decode(text):
+    # Returns the text without the formatting codes and a list of (start,
+    # end, tag name) with its format, all in one pass. Reverse isn't shown.
+    parts = []
+    spans = []
+    opened = { }  # Attribute: (tag, start)
+    length = 0
+    last = 0
+
+    for match in CODES_RE.finditer(text):
+        if match.start() > last:
+            parts.append(text[last:match.start()])
+            length += match.start() - last
+
+        last = match.end()
+        code = match.group(0)[0]
+        changes = { }  # Attribute: new tag, None to close it
+
+        if code in TOGGLES:
+            changes[code] = None if code in opened else TOGGLES[code]
+
+        elif code == COLOR:
+            foreground, background = match.group(1, 2)
+            if foreground is None:  # Alone, resets the colors
+                changes["fg"] = None
+                changes["bg"] = None
+
+            else:
+                changes["fg"] = get_color_tag("fg", foreground)
+                if background is not None:
+                    changes["bg"] = get_color_tag("bg", background)
+
+        elif code == RESET:
+            for attribute in opened:
+                changes[attribute] = None
+
+        for attribute, tag in changes.items():
+            if attribute in opened:
+                old_tag, start = opened.pop(attribute)
+                if start < length:
+                    spans.append((start, length, old_tag))
+
+            if tag is not None:
+                opened[attribute] = (tag, length)
+
+    if last == 0:
+        return text, []
+
+    parts.append(text[last:])
+    length += len(text) - last
+
+    for tag, start in opened.values():
+        if start < length:
+            spans.append((start, length, tag))
+
+    return u"".join(parts), spans
+
+
+def strip(text):
+    return CODES_RE.sub(u"", text)
+
+
+def create_tag(buffer, name):
+    # The tags are created the first time a buffer needs them
+    if name.startswith("fmt-fg-"):
+        buffer.create_tag(name, foreground=COLORS[int(name[7:])])
+
+    elif name.startswith("fmt-bg-"):
+        buffer.create_tag(name, background=COLORS[int(name[7:])])
+
+    elif name == "fmt-bold":
+        buffer.create_tag(name, weight=Pango.Weight.BOLD)
+
+    elif name == "fmt-italic":
+        buffer.create_tag(name, style=Pango.Style.ITALIC)
+
+    elif name == "fmt-underline":
+        buffer.create_tag(name, underline=Pango.Underline.SINGLE)
+
+    elif name == "fmt-strikethrough":
+        buffer.create_tag(name, strikethrough=True)
+
+    elif name == "fmt-monospace":
+        buffer.create_tag(name, family="Monospace")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import re
+
+from utils import URL_PATTERN
+
+# RFC 1459 casemapping, see utils.irc_lower: []\^ are the uppercase of
+# {}|~, and each of them matches the other case too
+_CASEMAPPED = {
+    "[": "[\\[{]", "{": "[\\[{]",
+    "]": "[\\]}]", "}": "[\\]}]",
+    "\\": "[\\\\|]", "|": "[\\\\|]",
+    "^": "[\\^~]", "~": "[\\^~]",
+}
+
+
+def nickname_pattern(nickname):
+    return "".join(_CASEMAPPED.get(char) or re.escape(char) for char in nickname)
+
+
+class Highlighter(object):
+
+    def __init__(self):
+        self.nickname = None
+        self.keywords = []
+        self.regex = None
+
+        self.compile()
+
+    def set_nickname(self, nickname):
+        self.nickname = nickname
+        self.compile()
+
+    def set_keywords(self, keywords):
+        self.keywords = [keyword for keyword in keywords if keyword]
+        self.compile()
+
+    def compile(self):
+        # Everything is matched on a single pass, URLs go first so a nickname
+        # inside an URL doesn't break it
+        patterns = ["(?P<url>%s)" % URL_PATTERN]
+
+        words = [(keyword, re.escape(keyword)) for keyword in self.keywords]
+        if self.nickname:
+            words.append((self.nickname, nickname_pattern(self.nickname)))
+
+        if words != []:
+            # Longest first, so "nick_" wins over "nick"
+            words.sort(key=lambda word: len(word[0]), reverse=True)
+            words = "|".join(pattern for word, pattern in words)
+            patterns.append("(?<!\\w)(?P<mention>%s)(?!\\w)" % words)
+
+        self.regex = re.compile("|".join(patterns), re.IGNORECASE | re.UNICODE)
+
+    def get_tags(self, text, start=0, mentions=True):
+        # Returns a list of (start, end, tag name) and if someone mentioned us
+        tags = []
+        mentioned = False
+
+        for match in self.regex.finditer(text, start):
+            tag = match.lastgroup
+            if tag == "mention":
+                if not mentions:
+                    continue
+
+                mentioned = True
+
+            tags.append((match.start(), match.end(), tag))
+
+        return tags, mentioned
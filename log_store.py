@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+import os
+import re
+import time
+import Queue
+import sqlite3
+import threading
+import traceback
+
+from consts import LOGS_DIR, LOG_BATCH_SIZE, LOG_SEARCH_LIMIT
+from utils import irc_lower, to_unicode
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    time REAL,
+    channel TEXT,
+    nickname TEXT,
+    kind TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_channel_time ON messages (channel, time);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_text USING fts4(content="messages", message);
+"""
+
+
+class LogStore(object):
+
+    # Everything said on a network, on $LOGS_DIR/<network>.sqlite. Messages
+    # are only appended, by a thread that writes them in batches so GTK never
+    # waits for the disk. The messages text has a full text index, searches
+    # don't need to load anything on the widgets.
+
+    def __init__(self, network):
+        if not os.path.isdir(LOGS_DIR):
+            os.makedirs(LOGS_DIR)
+
+        self.network = network
+        self.path = os.path.join(LOGS_DIR, re.sub(r"[^\w.-]", "_", network) + ".sqlite")
+
+        # Used from the main loop, only for searches
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")  # Readers don't wait for the writer
+        self.db.executescript(SCHEMA)
+
+        # Channels used to be casemapped with ^ as the lowercase of ~
+        if self.db.execute("PRAGMA user_version").fetchone()[0] == 0:
+            with self.db:
+                self.db.execute("UPDATE messages SET channel = replace(channel, '^', '~') WHERE channel LIKE '%^%'")
+                self.db.execute("PRAGMA user_version = 1")
+
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target=self._write_loop, name="logs-" + network)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add_message(self, channel, nickname, kind, message, timestamp=None):
+        # kind: a consts.LogKind
+        if timestamp is None:
+            timestamp = time.time()
+
+        self.queue.put((timestamp,
+                        irc_lower(to_unicode(channel)),
+                        to_unicode(nickname) if nickname is not None else None,
+                        kind,
+                        to_unicode(message)))
+
+    def _write_loop(self):
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA synchronous=NORMAL")
+
+        closing = False
+        while not closing:
+            rows = [self.queue.get()]
+
+            # Everything that arrived meanwhile goes on the same transaction
+            while len(rows) < LOG_BATCH_SIZE:
+                try:
+                    rows.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            if None in rows:
+                closing = True
+                rows = [row for row in rows if row is not None]
+
+            try:
+                with db:
+                    for row in rows:
+                        cursor = db.execute("INSERT INTO messages (time, channel, nickname, kind, message) VALUES (?, ?, ?, ?, ?)", row)
+                        db.execute("INSERT INTO messages_text (docid, message) VALUES (?, ?)", (cursor.lastrowid, row[4]))
+
+            except sqlite3.Error:
+                traceback.print_exc()
+
+        db.close()
+
+    def search(self, text=None, channel=None, nickname=None, since=None, until=None, limit=LOG_SEARCH_LIMIT):
+        # Returns a list of (time, channel, nickname, kind, message), newest
+        # first. Messages still waiting for the writer aren't found.
+        query = "SELECT time, channel, nickname, kind, message FROM messages WHERE 1"
+        params = []
+
+        if text is not None:
+            # A phrase, so the user's text isn't read as FTS syntax
+            query += " AND id IN (SELECT docid FROM messages_text WHERE messages_text MATCH ?)"
+            params.append(u'"%s"' % to_unicode(text).replace(u'"', u'""'))
+
+            # The "+" keeps SQLite from walking the whole channel on the
+            # index instead of starting from the few matching messages
+            column = "+%s"
+
+        else:
+            column = "%s"
+
+        if channel is not None:
+            query += " AND %s = ?" % (column % "channel")
+            params.append(irc_lower(to_unicode(channel)))
+
+        if nickname is not None:
+            query += " AND nickname = ? COLLATE NOCASE"
+            params.append(to_unicode(nickname))
+
+        if since is not None:
+            query += " AND %s >= ?" % (column % "time")
+            params.append(since)
+
+        if until is not None:
+            query += " AND %s < ?" % (column % "time")
+            params.append(until)
+
+        query += " ORDER BY time DESC LIMIT ?"
+        params.append(limit)
+
+        return self.db.execute(query, params).fetchall()
+
+    def close(self):
+        # Waits until everything is written
+        self.queue.put(None)
+        self.thread.join()
+        self.db.close()
@@ -141,7 +141,6 @@ class NewChannelScreen(Gtk.EventBox):
     def send_data(self, widget):
         if self.get_possible():
             if not self.logged:
-                self.logged = True
                 self.emit("log-in",
                     self.nick.get_value(),
                     self.server.get_value(),
@@ -152,16 +151,23 @@ class NewChannelScreen(Gtk.EventBox):
                 self.emit("new-channel", self.channels.get_value())
 
     def set_logged(self, logged):
+        if logged == self.logged:
+            return
+
         self.logged = logged
         if not self.logged:
-            # Do something
-            pass
+            # Connecting to other network
+            for position, field in enumerate([self.nick, self.server, self.port]):
+                self.form.pack_start(field, False, False, 5)
+                self.form.reorder_child(field, position)
 
         else:
             self.form.remove(self.nick)
             self.form.remove(self.server)
             self.form.remove(self.port)
 
+        self.enter.set_sensitive(self.get_possible())
+
     def __cancel(self, widget):
         self.emit("cancel")
 
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+from utils import irc_lower
+
+
+class NickIndex(object):
+
+    # Channels where each nickname is, so QUIT, NICK and AFK changes only
+    # visit those channels. IRC nicknames are case insensitive, the index
+    # remembers how each channel wrote the nickname.
+
+    def __init__(self):
+        self.nicknames = { }  # irc_lower(nickname): {channel: nickname}
+
+    def add(self, channel, nickname):
+        self.nicknames.setdefault(irc_lower(nickname), { })[channel] = nickname
+
+    def remove(self, channel, nickname):
+        key = irc_lower(nickname)
+        channels = self.nicknames.get(key)
+        if channels is None:
+            return
+
+        channels.pop(channel, None)
+        if channels == { }:
+            self.nicknames.pop(key)
+
+    def add_channel(self, channel, nicknames):
+        for nickname in nicknames:
+            self.add(channel, nickname)
+
+    def remove_channel(self, channel, nicknames):
+        for nickname in nicknames:
+            self.remove(channel, nickname)
+
+    def get_channels(self, nickname):
+        # Returns {channel: nickname as written in that channel}
+        return dict(self.nicknames.get(irc_lower(nickname), { }))
+
+    def get_nickname(self, channel, nickname):
+        return self.nicknames.get(irc_lower(nickname), { }).get(channel, nickname)
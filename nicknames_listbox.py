@@ -18,8 +18,10 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
-from consts import Color, SUGAR, ADMIN_PIXBUF, MODERATOR_PIXBUF, \
-                   NORMAL_PIXBUF, UserType, UserState
+from bisect import bisect_left
+
+from consts import Color, SUGAR, ADMIN_ICON, MODERATOR_ICON, NORMAL_ICON, \
+                   UserType, UserState
 
 import gi
 gi.require_version("Gtk", "3.0")
@@ -28,6 +30,29 @@ from gi.repository import Gtk
 from gi.repository import Gdk
 from gi.repository import Pango
 from gi.repository import GObject
+from gi.repository import GdkPixbuf
+
+
+SECTIONS = [UserType.ADMIN, UserType.MODERATOR, UserType.NORMAL]
+
+ICONS = {
+    UserType.ADMIN: ADMIN_ICON,
+    UserType.MODERATOR: MODERATOR_ICON,
+    UserType.NORMAL: NORMAL_ICON,
+}
+
+PIXBUFS = { }  # Type: Pixbuf, shared by every list
+
+
+def get_pixbuf(usertype):
+    if usertype not in PIXBUFS:
+        PIXBUFS[usertype] = GdkPixbuf.Pixbuf.new_from_file(ICONS[usertype])
+
+    return PIXBUFS[usertype]
+
+
+def sort_key(nickname):
+    return (nickname.lower(), nickname)
 
 
 class NicknamesListBox(Gtk.ScrolledWindow):
@@ -39,10 +64,11 @@ class NicknamesListBox(Gtk.ScrolledWindow):
     def __init__(self):
         Gtk.ScrolledWindow.__init__(self)
 
-        self.nicknames = []
-        self.admins = []
-        self.moderators = []
-        self.normals = []
+        self.rows = { }  # Nickname: (type, TreeIter), ListStore iters persist
+        self.sections = { }  # Type: sorted list of sort_key(nickname)
+        for usertype in SECTIONS:
+            self.sections[usertype] = []
+
         self.model = Gtk.ListStore(str, str, str)  # Type, Nickname, State
         self.selected_nickname = None
 
@@ -73,102 +99,116 @@ class NicknamesListBox(Gtk.ScrolledWindow):
         self.menu.append(item)
 
     def __get_tree_pixbuf(self, col, cell, model, iter, user_data):
-        usertype = self.model.get_value(iter, 0)
-
-        if usertype == UserType.ADMIN:
-            cell.set_property("pixbuf", ADMIN_PIXBUF)
-
-        elif usertype == UserType.MODERATOR:
-            cell.set_property("pixbuf", MODERATOR_PIXBUF)
+        usertype = model.get_value(iter, 0)
 
-        elif usertype == UserType.NORMAL:
-            cell.set_property("pixbuf", NORMAL_PIXBUF)
+        if usertype in ICONS:
+            cell.set_property("pixbuf", get_pixbuf(usertype))
 
     def __get_tree_text(self, col, cell, model, iter, user_data):
-        cell.set_property("text", self.model.get_value(iter, 1))
+        cell.set_property("text", model.get_value(iter, 1))
 
     def set_list(self, nicknames):
         self.clear()
-        nicknames.sort()
+        self.add_nicknames(nicknames)
 
-        for nick in nicknames:
-            usertype = UserType.NORMAL
-            if "@" in nick:
-                nick, usertype = nick.split("@")
+    def add_nicknames(self, nicknames):
+        # nicknames: list of (nickname, type)
+        new = { }  # Nickname: type
+        for nick, usertype in nicknames:
+            if nick not in self.rows:
+                new[nick] = usertype
 
-            self.add_nickname(nick, usertype)
+        if new == { }:
+            return
 
-    def clear(self):
-        while len(self.nicknames) > 0:
-            for item in self.nicknames:
-                self.nicknames.remove(item)
+        # Detached, so the view doesn't update on every row
+        self.view.set_model(None)
 
-        self.model.clear()
+        if len(new) * 4 < len(self.rows):
+            for nick, usertype in new.items():
+                self.add_nickname(nick, usertype)
 
-    def add_nickname(self, nickname, usertype=None):
-        self.nicknames.append(nickname)
-        self.nicknames = sorted(self.nicknames, key=str.lower)
+        else:
+            # Cheaper to build a new model, appending already sorted rows
+            for nick, usertype in new.items():
+                self.sections[usertype].append(sort_key(nick))
 
-        usertype = UserType.NORMAL if usertype == None else usertype
-        idx = 0
+            model = Gtk.ListStore(str, str, str)
+            rows = { }
 
-        if usertype == UserType.ADMIN:
-            self.admins.append(nickname)
-            self.admins = sorted(self.admins, key=str.lower)
-            idx = self.admins.index(nickname)
+            for usertype in SECTIONS:
+                self.sections[usertype].sort()
 
-        elif usertype == UserType.MODERATOR:
-            self.moderators.append(nickname)
-            self.moderators = sorted(self.moderators, key=str.lower)
-            idx = len(self.admins) + self.moderators.index(nickname)
+                for key in self.sections[usertype]:
+                    nick = key[1]
+                    state = UserState.ACTIVE
+                    if nick in self.rows:
+                        state = self.model.get_value(self.rows[nick][1], 2)
 
-        elif usertype == UserType.NORMAL:
-            self.normals.append(nickname)
-            self.normals = sorted(self.normals, key=str.lower)
-            idx = len(self.admins) + len(self.moderators) + self.normals.index(nickname)
+                    rows[nick] = (usertype, model.append([usertype, nick, state]))
 
-        data = [usertype, nickname, UserState.ACTIVE]
-        self.model.insert(idx, data)
-        self.show_all()
+            self.model = model
+            self.rows = rows
 
-    def remove_nickname(self, nickname):
-        iter = self.model.get_iter_first()
-        if self.model.get_value(iter, 1) == nickname:
-            self.model.remove(iter)
+        self.view.set_model(self.model)
 
-        else:
-            while self.model.iter_next(iter):
-                iter = self.model.iter_next(iter)
-                if self.model.get_value(iter, 1) == nickname:
-                    self.model.remove(iter)
-                    break
+    def clear(self):
+        self.rows = { }
+        for usertype in SECTIONS:
+            self.sections[usertype] = []
+
+        # Replacing the model is faster than removing every row
+        self.model = Gtk.ListStore(str, str, str)
+        self.view.set_model(self.model)
+
+    def get_offset(self, usertype):
+        # Rows before the first one of this type
+        offset = 0
+        for section in SECTIONS:
+            if section == usertype:
+                break
+
+            offset += len(self.sections[section])
 
-        self.nicknames.remove(nickname)
-        if nickname in self.admins:
-            self.admins.remove(nickname)
+        return offset
+
+    def add_nickname(self, nickname, usertype=None, state=UserState.ACTIVE):
+        if nickname in self.rows:
+            return
+
+        usertype = UserType.NORMAL if usertype == None else usertype
+        key = sort_key(nickname)
+        section = self.sections[usertype]
+        idx = bisect_left(section, key)
+        section.insert(idx, key)
+
+        iter = self.model.insert(self.get_offset(usertype) + idx, [usertype, nickname, state])
+        self.rows[nickname] = (usertype, iter)
+
+    def remove_nickname(self, nickname):
+        if nickname not in self.rows:
+            return
 
-        elif nickname in self.moderators:
-            self.moderators.remove(nickname)
+        usertype, iter = self.rows.pop(nickname)
+        section = self.sections[usertype]
+        del section[bisect_left(section, sort_key(nickname))]
 
-        elif nickname in self.normals:
-            self.normals.remove(nickname)
+        self.model.remove(iter)
 
     def set_user_type(self, nickname, type):
-        if nickname not in self.nicknames:
+        if nickname not in self.rows or self.rows[nickname][0] == type:
             return
 
+        state = self.model.get_value(self.rows[nickname][1], 2)
         self.remove_nickname(nickname)
-        self.add_nickname(nickname, type)
+        self.add_nickname(nickname, type, state)
 
     def set_afk(self, nickname, afk):
-        if nickname not in self.nicknames:
+        if nickname not in self.rows:
             return
 
-        nicks = self.admins + self.moderators + self.normals
-        idx = nicks.index(nickname)
-        iter = self.model.get_iter(idx)
         state = UserState.ACTIVE if not afk else UserState.AFK
-        self.model.set_value(iter, 2, state)
+        self.model.set_value(self.rows[nickname][1], 2, state)
 
     def _button_press(self, widget, event):
         row = self.view.get_dest_row_at_pos(event.x, event.y)
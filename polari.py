@@ -20,8 +20,6 @@
 
 from gettext import gettext as _
 
-from consts import Screen
-
 import gi
 gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk
@@ -32,6 +30,7 @@ from sugar3.graphics.toolbarbox import ToolbarBox
 from sugar3.activity.widgets import ActivityToolbarButton
 
 from polari_canvas import PolariCanvas
+from session import read_session, write_session
 
 
 class PolariActivity(activity.Activity):
@@ -70,6 +69,11 @@ class PolariActivity(activity.Activity):
         button_add.connect("clicked", self._add_channel)
         toolbar.insert(button_add, -1)
 
+        button_network = ToolButton("network-wireless")
+        button_network.set_tooltip(_("Connect to a network"))
+        button_network.connect("clicked", self._add_network)
+        toolbar.insert(button_network, -1)
+
         toolbar.insert(make_separator(True), -1)
 
         stop_button = ToolButton("activity-stop")
@@ -84,6 +88,13 @@ class PolariActivity(activity.Activity):
         self.metadata["port"] = screen.port.get_value()
         self.metadata["channel"] = screen.channels.get_value()
 
+        write_session(file_path, self.polari.get_session())
+
+    def read_file(self, file_path):
+        session = read_session(file_path)
+        if session is not None:
+            self.polari.restore_session(session)
+
     def read_metadata(self):
         screen = self.polari.channel_screen
 
@@ -102,7 +113,11 @@ class PolariActivity(activity.Activity):
         except ReactorNotRunning:
             pass
 
+        self.polari.close_logs()
         self.close()
 
     def _add_channel(self, button):
-        self.polari.set_screen(Screen.NEW_CHANNEL)
+        self.polari.show_new_channel_screen()
+
+    def _add_network(self, button):
+        self.polari.show_new_channel_screen(True)
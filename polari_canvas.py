@@ -23,9 +23,11 @@ from gettext import gettext as _
 from new_channel_screen import NewChannelScreen
 from channels_listbox import ChannelsListBox
 from chat_box import ChatBox
-from consts import Screen, STATUS_CHANNEL, ALL_CHANNELS, CURRENT_CHANNEL, UserType
-from client import ClientFactory
+from consts import Screen, STATUS_CHANNEL, ALL_CHANNELS, CURRENT_CHANNEL, UserType, LogKind, \
+                   SESSION_LINES
+from connection_manager import ConnectionManager
 from afk_manager import AFKManager
+from log_store import LogStore
 
 import gi
 gi.require_version("Gtk", "3.0")
@@ -40,31 +42,47 @@ class PolariCanvas(Gtk.VBox):
         Gtk.VBox.__init__(self)
 
         self.screen = None
-
-        self.factory = ClientFactory([])
-        self.factory.connect("signed-on", self._signed_on)
-        self.factory.connect("joined", self._joined)
-        self.factory.connect("system-message", self._system_message)
-        self.factory.connect("user-message", self._user_message)
-        self.factory.connect("nickname-changed", self._nickname_changed)
-        self.factory.connect("user-nickname-changed", self._user_nickname_changed)
-        self.factory.connect("user-joined", self._user_joined)
-        self.factory.connect("user-left", self._user_left)
-        self.factory.connect("user-quit", self._user_quit)
-        self.factory.connect("nicknames-list", self._nicknames)
-        self.factory.connect("me-command", self._me_command)
-        self.factory.connect("status-message", self._status_message)
-        self.factory.connect("topic-changed", self._topic_changed)
-        self.factory.connect("mode-changed", self._mode_changed)
-
-        self.afk_manager = AFKManager()
-        self.afk_manager.connect("user-afk", self._user_afk)
-        self.afk_manager.connect("user-back", self._user_back)
+        self.log_stores = { }  # network: LogStore
+        self.afk_managers = { }  # network: AFKManager
+
+        # The handlers get the ClientFactory of the network first
+        self.connections = ConnectionManager()
+        self.connections.connect("signed-on", self._signed_on)
+        self.connections.connect("joined", self._joined)
+        self.connections.connect("system-message", self._system_message)
+        self.connections.connect("user-message", self._user_message)
+        self.connections.connect("nickname-changed", self._nickname_changed)
+        self.connections.connect("user-nickname-changed", self._user_nickname_changed)
+        self.connections.connect("user-joined", self._user_joined)
+        self.connections.connect("user-left", self._user_left)
+        self.connections.connect("user-quit", self._user_quit)
+        self.connections.connect("user-kicked", self._user_kicked)
+        self.connections.connect("nicknames-list", self._nicknames)
+        self.connections.connect("nicknames-added", self._nicknames_added)
+        self.connections.connect("me-command", self._me_command)
+        self.connections.connect("status-message", self._status_message)
+        self.connections.connect("topic-changed", self._topic_changed)
+        self.connections.connect("mode-changed", self._mode_changed)
+        self.connections.connect("send-queue-changed", self._send_queue_changed)
+        self.connections.connect("history", self._history)
 
         self.channel_screen = NewChannelScreen()
         self.channel_screen.connect("log-in", self._log_in)
         self.channel_screen.connect("new-channel", self._new_channel)
         self.channel_screen.connect("cancel", self._screen_changed, Screen.CHAT)
+
+        # The chat screen is built when the first network is added, so the
+        # login screen shows up sooner
+        self.chat_screen = None
+        self.channels_listbox = None
+        self.chat_box = None
+
+        self.set_screen(Screen.NEW_CHANNEL)
+
+    def build_chat_screen(self):
+        if self.chat_screen is not None:
+            return
+
         self.chat_screen = Gtk.HBox()
 
         self.channels_listbox = ChannelsListBox()
@@ -78,10 +96,9 @@ class PolariCanvas(Gtk.VBox):
         self.chat_box.connect("change-nickname", self._change_nickname)
         self.chat_box.connect("query", self._query)
         self.chat_box.connect("change-topic", self._change_topic)
+        self.chat_box.connect("new-message", self._new_message)
         self.chat_screen.pack_start(self.chat_box, True, True, 0)
 
-        self.set_screen(Screen.NEW_CHANNEL)
-
     def set_screen(self, screen):
         if screen == self.screen:
             return
@@ -89,59 +106,77 @@ class PolariCanvas(Gtk.VBox):
         self.screen = screen
 
         if self.screen == Screen.CHAT:
+            self.build_chat_screen()
+
             if self.channel_screen.get_parent() == self:
                 self.remove(self.channel_screen)
 
             self.pack_start(self.chat_screen, True, True, 0)
 
         elif self.screen == Screen.NEW_CHANNEL:
-            if self.chat_screen.get_parent() == self:
+            if self.chat_screen is not None and self.chat_screen.get_parent() == self:
                 self.remove(self.chat_screen)
 
             self.pack_start(self.channel_screen, True, True, 0)
 
         self.show_all()
 
-    def _send_message(self, widget, channel, message):
-        self.send_message(channel, message)
+    def show_new_channel_screen(self, new_network=False):
+        # Asks for a channel on the current network, or for a new network
+        self.channel_screen.set_logged(not new_network and len(self.connections) > 0)
+        self.set_screen(Screen.NEW_CHANNEL)
+
+    def get_current_network(self):
+        if self.chat_box.current_channel is not None:
+            return self.chat_box.current_channel[0]
+
+        return self.connections.factories.keys()[-1]
 
-    def send_message(self, channel, message):
-        self.factory.client.msg(channel, message)
+    def _send_message(self, widget, network, channel, message):
+        self.send_message(network, channel, message)
 
-    def _change_nickname(self, widget, new_nickname):
-        self.change_nickname(new_nickname)
+    def send_message(self, network, channel, message):
+        self.connections.get_client(network).msg(channel, message)
 
-    def change_nickname(self, new_nickname):
-        self.factory.client.set_nickname(new_nickname)
+    def _change_nickname(self, widget, network, new_nickname):
+        self.change_nickname(network, new_nickname)
 
-    def _query(self, widget, nickname):
-        self.query(nickname)
+    def change_nickname(self, network, new_nickname):
+        self.connections.get_client(network).set_nickname(new_nickname)
 
-    def query(self, nickname):
-        self.new_channel(nickname, add_hash=False)
+    def _query(self, widget, network, nickname):
+        self.query(network, nickname)
 
-    def _change_topic(self, widget, channel, topic):
-        self.change_topic(channel, topic)
+    def query(self, network, nickname):
+        self.new_channel(network, nickname, add_hash=False)
 
-    def change_topic(self, channel, topic):
-        self.factory.client.topic(channel, topic)
+    def _new_message(self, widget, network, channel, mentioned):
+        self.channels_listbox.add_unread(network, channel, mentioned)
+
+    def _change_topic(self, widget, network, channel, topic):
+        self.change_topic(network, channel, topic)
+
+    def change_topic(self, network, channel, topic):
+        self.connections.get_client(network).topic(channel, topic)
+
+    def run_command(self, widget, network, channel, command, parameters=""):
+        client = self.connections.get_client(network)
 
-    def run_command(self, widget, channel, command, parameters=""):
         if command == "/join":
             for channel in parameters.split(" "):
                 if channel.strip() != "":
-                    self.new_channel(channel)
+                    self.new_channel(network, channel)
 
         elif command == "/msg":
             if parameters.split(" ")[0].lower() != "nickserv":
                 nickname = parameters.split(" ")[0]
                 message = parameters[len(nickname) + 1:]
 
-                if nickname not in self.chat_box.channels:
-                    self.new_channel(nickname, add_hash=False)
+                if not self.chat_box.has_channel(network, nickname):
+                    self.new_channel(network, nickname, add_hash=False)
 
-                self.send_message(nickname, message)
-                self.chat_box.add_message_to_view(nickname, self.factory.client.get_nickname(), message, force=True)
+                self.send_message(network, nickname, message)
+                self.chat_box.add_message_to_view(network, nickname, client.get_nickname(), message, force=True)
 
             else:
                 nickserv = parameters.split(" ")[0]
@@ -149,78 +184,209 @@ class PolariCanvas(Gtk.VBox):
 
                 if action == "identify" and len(parameters.split(" ")) == 3:
                     password = parameters.split(" ")[2]
-                    self.send_message("NickServ", "identify %s" % password)
+                    self.send_message(network, "NickServ", "identify %s" % password)
 
                 elif action == "identify" and len(parameters.split(" ")) == 4:
                     nickname = parameters.split(" ")[2]
                     password = parameters.split(" ")[3]
-                    self.send_message("NickServ", "identify %s %s" % (nickname, password))
+                    self.send_message(network, "NickServ", "identify %s %s" % (nickname, password))
 
         elif command == "/query":
             nickname = parameters.split(" ")[0]
 
-            if nickname not in self.chat_box.channels:
-                self.new_channel(nickname, add_hash=False)
+            if not self.chat_box.has_channel(network, nickname):
+                self.new_channel(network, nickname, add_hash=False)
 
         elif command == "/nick":
-            self.change_nickname(parameters)
+            self.change_nickname(network, parameters)
 
         elif command == "/names":
-            self.factory.client.ask_for_names(channel)
+            client.ask_for_names(channel)
 
         elif command == "/me":
-            self.factory.client.me(channel, parameters)
-            self._me_command(None, channel, self.factory.client.get_nickname(), parameters)
+            client.me(channel, parameters)
+            self._me_command(self.connections.get_factory(network), channel, client.get_nickname(), parameters)
 
         elif command == "/topic":
-            self.change_topic(channel, parameters)
+            self.change_topic(network, channel, parameters)
 
         elif command == "/away":
-            self.factory.client.set_away(True, parameters)
+            client.set_away(True, parameters)
 
         elif command == "/back":
-            self.factory.client.set_away(False)
+            client.set_away(False)
+
+        elif command == "/server":
+            # /server host [port], with the same nickname
+            host = parameters.split(" ")[0]
+            port = parameters.split(" ")[1] if len(parameters.split(" ")) > 1 else ""
+
+            if host != "":
+                self.add_network(host, int(port) if port.isdigit() else 6667, client.get_nickname())
+
+        elif command == "/highlight":
+            keywords = parameters.split()
+            self.chat_box.set_highlight_keywords(keywords)
+
+            if keywords != []:
+                self.chat_box.add_system_message(network, channel, _("Highlighting: %s") % ", ".join(keywords))
+
+            else:
+                self.chat_box.add_system_message(network, channel, _("Highlighting only your nickname"))
 
     def _log_in(self, widget, nick, host, channel, port):
         self.set_screen(Screen.CHAT)
-        self.chat_box.set_nickname(nick)
         self.channel_screen.set_logged(True)
 
-        self.factory.protocol.nickname = nick
+        if host in self.connections:
+            self.chat_box.add_system_message(host, STATUS_CHANNEL, _("You're already connected to %s") % host)
+            if channel.strip() != "":
+                self.new_channel(host, channel)
+
+            return
+
+        self.add_network(host, port, nick, channel)
+
+    def add_network(self, network, port, nick, channel="", connect=True):
+        self.build_chat_screen()
+        self.chat_box.add_network(network, nick)
+        self.channels_listbox.add_network(network)
+        self.connections.add_network(network, nick)
+
+        self.log_stores[network] = LogStore(network)
+
+        afk_manager = AFKManager()
+        afk_manager.connect("user-afk", self._user_afk, network)
+        afk_manager.connect("user-back", self._user_back, network)
+        self.afk_managers[network] = afk_manager
+
         if channel.strip() != "":
-            self.new_channel(channel)
+            self.new_channel(network, channel)
+
+        if connect:
+            self.chat_box.add_system_message(network, STATUS_CHANNEL, _("Logging in, please wait"))
+            self.connections.start_connection(network, port)
+
+    def get_session(self):
+        # What the Journal keeps to show everything again before connecting
+        if self.chat_box is None:
+            return { "networks": [], "current": None, "keywords": [] }
+
+        networks = []
+        for network, factory in self.connections.factories.items():
+            channels = []
+            for channel in self.chat_box.get_channels(network):
+                snapshot = self.chat_box.get_channel_snapshot(network, channel, SESSION_LINES)
+                snapshot["unread"] = self.channels_listbox.get_unread(network, channel)
+                channels.append(snapshot)
+
+            networks.append({
+                "name": network,
+                "port": factory.port,
+                "nickname": self.chat_box.get_nickname(network) or factory.nickname,
+                "isupport": factory.isupport.values(),
+                "last-time": factory.last_time,
+                "channels": channels,
+            })
+
+        return {
+            "networks": networks,
+            "current": self.chat_box.current_channel,
+            "keywords": self.chat_box.keywords,
+        }
+
+    def restore_session(self, session):
+        # Everything is shown right now, the connections start when the
+        # main loop runs and the server sends the nicknames and topics again
+        if session["networks"] == []:
+            return
+
+        for network in session["networks"]:
+            name = network["name"]
+            self.add_network(name, network["port"], network["nickname"], connect=False)
+
+            factory = self.connections.get_factory(name)
+            for option in network["isupport"]:
+                factory.isupport[option.split("=")[0]] = option
+
+            # What was said while closed is asked when joining
+            factory.last_time = network.get("last-time")
+
+            for channel in network["channels"]:
+                self.chat_box.restore_channel_snapshot(name, channel)
 
-        self.chat_box.add_system_message(STATUS_CHANNEL, _("Logging in, please wait"))
-        self.factory.start_connection(host, port)
+                if channel["name"] != STATUS_CHANNEL:
+                    show = None if channel["name"].startswith("#") else channel["name"]
+                    self.channels_listbox.add_channel(name, channel["name"], show=show)
+                    factory.add_channel(channel["name"])
+
+        self.chat_box.set_highlight_keywords(session["keywords"])
+        self.set_screen(Screen.CHAT)
+        self.channel_screen.set_logged(True)
+
+        if session["current"] is not None and self.chat_box.has_channel(*session["current"]):
+            self.channels_listbox.select_item_from_string(*session["current"])
+
+        # After selecting, that resets the counters
+        for network in session["networks"]:
+            for channel in network["channels"]:
+                self.channels_listbox.set_unread(network["name"], channel["name"], *channel["unread"])
+
+        # One by one, the first one starts the reactor and doesn't return
+        # until it stops
+        for network in session["networks"]:
+            GObject.idle_add(self._reconnect_network, network["name"], network["port"])
+
+    def _reconnect_network(self, network, port):
+        if network in self.connections:
+            self.chat_box.add_system_message(network, STATUS_CHANNEL, _("Logging in, please wait"))
+            self.connections.start_connection(network, port)
+
+        return False
+
+    def remove_network(self, network):
+        self.connections.remove_network(network)
+        self.chat_box.remove_network(network)
+        self.channels_listbox.remove_network(network)
+
+        self.afk_managers.pop(network).stop()
+        self.log_stores.pop(network).close()
 
     def _new_channel(self, widget, channel):
         if channel.strip() != "":
-            self.new_channel(channel)
+            self.new_channel(self.get_current_network(), channel)
+
+    def _channel_removed(self, widget, network, channel):
+        if channel == STATUS_CHANNEL:
+            self.remove_network(network)
+
+        else:
+            self.connections.get_factory(network).remove_channel(channel)
+            self.chat_box.remove_channel(network, channel)
 
-    def _channel_removed(self, widget, channel):
-        self.factory.remove_channel(channel)
-        self.chat_box.remove_channel(channel)
+        if len(self.connections) == 0:
+            self.show_new_channel_screen(True)
 
-        if len(self.factory.channels) == 0:
-            self.set_screen(Screen.NEW_CHANNEL)
+        elif self.connections.get_factory(self.get_current_network()).channels == []:
+            self.show_new_channel_screen()
 
-    def new_channel(self, channel, add_hash=True, show=None):
+    def new_channel(self, network, channel, add_hash=True, show=None):
         self.set_screen(Screen.CHAT)
 
         if add_hash and not channel.startswith("#"):
             channel = "#" + channel
 
-        if channel in self.chat_box.channels:
-            self.chat_box.add_system_message(channel, _("You've already joined %s") % channel)
+        if self.chat_box.has_channel(network, channel):
+            self.chat_box.add_system_message(network, channel, _("You've already joined %s") % channel)
             return
 
-        self.chat_box.add_channel(channel)
-        self.channels_listbox.add_channel(channel, show=show)
-        self.factory.add_channel(channel)
-        self.chat_box.switch_channel(channel)
+        self.chat_box.add_channel(network, channel)
+        self.channels_listbox.add_channel(network, channel, show=show)
+        self.connections.get_factory(network).add_channel(channel)
+        self.chat_box.switch_channel(network, channel)
 
-    def _channel_selected(self, listbox, channel):
-        self.chat_box.switch_channel(channel)
+    def _channel_selected(self, listbox, network, channel):
+        self.chat_box.switch_channel(network, channel)
 
     def _screen_changed(self, widget, screen):
         self.set_screen(screen)
@@ -228,105 +394,164 @@ class PolariCanvas(Gtk.VBox):
     def _signed_on(self, factory):
         self.chat_box.entry.set_sensitive(True)
         self.chat_box.nicker.set_sensitive(True)
-        self.channels_listbox.change_spinner(STATUS_CHANNEL, False)
+        self.channels_listbox.change_spinner(factory.network, STATUS_CHANNEL, False)
 
     def _joined(self, factory, channel):
-        if channel not in self.chat_box.channels:
+        if not self.chat_box.has_channel(factory.network, channel):
             channel = channel[1:]  # Isn't a channel, is a user (removing #)
 
         else:
-            self.chat_box.add_system_message(channel, _("Joined to: %s") % channel)
+            self.chat_box.add_system_message(factory.network, channel, _("Joined to: %s") % channel)
 
-        self.channels_listbox.change_spinner(channel, False)
+        self.channels_listbox.change_spinner(factory.network, channel, False)
 
     def _system_message(self, factory, channel, message):
+        network = factory.network
+
         if channel == CURRENT_CHANNEL:
-            channel = self.chat_box.current_channel
+            channel = self.chat_box.get_current_channel(network)
 
         if channel == ALL_CHANNELS:
-            for channel in self.chat_box.channels:
-                self.chat_box.add_system_message(channel, message)
+            for channel in self.chat_box.get_channels(network):
+                self.chat_box.add_system_message(network, channel, message)
+                self.log_message(network, channel, None, LogKind.SYSTEM, message)
 
         else:
-            self.chat_box.add_system_message(channel, message)
+            self.chat_box.add_system_message(network, channel, message)
+            self.log_message(network, channel, None, LogKind.SYSTEM, message)
 
     def _user_message(self, factory, channel, nickname, message):
-        if channel == self.factory.client.get_nickname() and nickname not in self.chat_box.channels:
-            self.new_channel(nickname, add_hash=False, show=nickname)
+        network = factory.network
+        own_nickname = factory.client.get_nickname()
+
+        if channel == own_nickname and not self.chat_box.has_channel(network, nickname):
+            self.new_channel(network, nickname, add_hash=False, show=nickname)
 
-        if channel != self.factory.client.get_nickname():  # Channel message
-            self.chat_box.message_recived(channel, nickname, message)
+        if channel != own_nickname:  # Channel message
+            self.chat_box.message_recived(network, channel, nickname, message)
 
         else:  # Direct message
-            self.chat_box.message_recived(nickname, nickname, message)
+            channel = nickname
+            self.chat_box.message_recived(network, nickname, nickname, message)
 
-        self.afk_manager.start_counting(nickname, restart=True)
+        self.log_message(network, channel, nickname, LogKind.MESSAGE, message)
+        self.afk_managers[network].start_counting(nickname, restart=True)
 
     def _nickname_changed(self, factory, nickname):
-        self.chat_box.set_nickname(nickname)
+        self.chat_box.set_nickname(factory.network, nickname)
 
     def _user_nickname_changed(self, factory, old_nick, new_nick):
-        for channel in self.chat_box.channels:
-            nicknames = self.chat_box.nicks[channel]
-            if old_nick in nicknames:
-                self.chat_box.add_system_message(channel, _("{old_nick} has changed nick to {new_nick}").format(old_nick, new_nick))
-                self.chat_box.remove_nickname(channel, old_nick)
-                self.chat_box.add_nickname(channel, new_nick)
+        network = factory.network
+
+        for channel in self.chat_box.get_nickname_channels(network, old_nick):
+            self.chat_box.add_system_message(network, channel, _("{old_nick} has changed nick to {new_nick}").format(old_nick=old_nick, new_nick=new_nick))
+
+        self.chat_box.rename_nickname(network, old_nick, new_nick)
+        self.afk_managers[network].remove_nickname(old_nick)
+        self.afk_managers[network].start_counting(new_nick, restart=False)
 
-                if old_nick == self.chat_box.nick:
-                    self.chat_box.set_nickname(new_nick)
+        if old_nick == self.chat_box.get_nickname(network):
+            self.chat_box.set_nickname(network, new_nick)
 
     def _user_joined(self, factory, channel, nickname):
-        self.chat_box.add_system_message(channel, _("{nickname} joined.").format(nickname=nickname))
-        self.chat_box.add_nickname(channel, nickname)
-        self.afk_manager.start_counting(nickname, restart=False)
+        self.chat_box.add_system_message(factory.network, channel, _("{nickname} joined.").format(nickname=nickname))
+        self.chat_box.add_nickname(factory.network, channel, nickname)
+        self.afk_managers[factory.network].start_counting(nickname, restart=False)
 
     def _user_left(self, factory, channel, nickname):
-        self.chat_box.add_system_message(channel, _("{nickname} has left.").format(nickname=nickname))
-        self.chat_box.remove_nickname(channel, nickname)
-        self.afk_manager.remove_nickname(nickname)
+        self.chat_box.add_system_message(factory.network, channel, _("{nickname} has left.").format(nickname=nickname))
+        self.user_removed(factory.network, channel, nickname)
+
+    def _user_kicked(self, factory, channel, nickname, kicker, message):
+        self.chat_box.add_system_message(factory.network, channel, _("{kicker} has kicked {nickname}. {message}").format(kicker=kicker, nickname=nickname, message=message))
+        self.user_removed(factory.network, channel, nickname)
+
+    def user_removed(self, network, channel, nickname):
+        self.chat_box.remove_nickname(network, channel, nickname)
+
+        if self.chat_box.get_nickname_channels(network, nickname) == { }:
+            self.afk_managers[network].remove_nickname(nickname)
 
     def _user_quit(self, factory, nickname, message):
-        for channel in self.chat_box.channels:
-            nicknames = self.chat_box.nicks[channel]
-            if nickname in nicknames:
-                self.chat_box.add_system_message(channel, _("{nickname} has quit. {message}").format(nickname=nickname, message=message))
+        network = factory.network
 
-        self.chat_box.remove_nickname_from_all_channels(nickname)
-        self.afk_manager.remove_nickname(nickname)
+        for channel in self.chat_box.get_nickname_channels(network, nickname):
+            self.chat_box.add_system_message(network, channel, _("{nickname} has quit. {message}").format(nickname=nickname, message=message))
 
-    def _user_afk(self, manager, nickname):
-        self.chat_box.set_user_afk(nickname, True)
+        self.chat_box.remove_nickname_from_all_channels(network, nickname)
+        self.afk_managers[network].remove_nickname(nickname)
 
-    def _user_back(self, manager, nickname):
-        self.chat_box.set_user_afk(nickname, False)
+    def _user_afk(self, manager, nicknames, network):
+        self.chat_box.set_users_afk(network, nicknames, True)
+
+    def _user_back(self, manager, nicknames, network):
+        self.chat_box.set_users_afk(network, nicknames, False)
 
     def _nicknames(self, factory, channel, nicknames):
-        self.set_nicknames(channel, nicknames.split(" "))
+        self.set_nicknames(factory.network, channel, nicknames)
+
+    def _nicknames_added(self, factory, channel, nicknames):
+        self.add_nicknames(factory.network, channel, nicknames)
 
-    def set_nicknames(self, channel, nicknames):
-        self.chat_box.set_nicknames(channel, nicknames)
+    def set_nicknames(self, network, channel, nicknames):
+        self.chat_box.set_nicknames(network, channel, nicknames)
+        self.count_nicknames(network, nicknames)
 
-        for nickname in nicknames:
-            if "@" in nickname:
-                nickname, usertype = nickname.split("@")
+    def add_nicknames(self, network, channel, nicknames):
+        self.chat_box.add_nicknames(network, channel, nicknames)
+        self.count_nicknames(network, nicknames)
 
-            self.afk_manager.start_counting(nickname, restart=False)
+    def count_nicknames(self, network, nicknames):
+        afk_manager = self.afk_managers[network]
+        for nickname, usertype in nicknames:
+            afk_manager.start_counting(nickname, restart=False)
 
     def _me_command(self, factory, channel, nickname, message):
-        self.chat_box.add_system_message(channel, _(" * {nickname} {message}").format(nickname=nickname, message=message))
+        self.chat_box.add_system_message(factory.network, channel, _(" * {nickname} {message}").format(nickname=nickname, message=message))
+        self.log_message(factory.network, channel, nickname, LogKind.ACTION, message)
+
+    def _history(self, factory, channel, messages):
+        network = factory.network
+        if not self.chat_box.has_channel(network, channel):
+            return
+
+        self.chat_box.add_history(network, channel, messages)
+
+        for when, nickname, message, action in messages:
+            kind = LogKind.ACTION if action else LogKind.MESSAGE
+            self.log_message(network, channel, nickname, kind, message, when)
+
+    def log_message(self, network, channel, nickname, kind, message, timestamp=None):
+        if network in self.log_stores:
+            self.log_stores[network].add_message(channel, nickname, kind, message, timestamp)
+
+    def search_logs(self, network, text=None, channel=None, nickname=None, since=None, until=None):
+        # See LogStore.search
+        if network not in self.log_stores:
+            return []
+
+        return self.log_stores[network].search(text, channel, nickname, since, until)
+
+    def close_logs(self):
+        for log_store in self.log_stores.values():
+            log_store.close()
+
+        self.log_stores = { }
 
     def _status_message(self, factory, message):
-        self.chat_box.add_system_message(STATUS_CHANNEL, message)
+        self.chat_box.add_system_message(factory.network, STATUS_CHANNEL, message)
 
     def _topic_changed(self, factory, channel, topic):
-        self.chat_box.set_topic(channel, topic)
+        self.chat_box.set_topic(factory.network, channel, topic)
+
+    def _send_queue_changed(self, factory, lines, seconds):
+        self.chat_box.set_send_queue(factory.network, lines, seconds)
 
     def _mode_changed(self, factory, channel, usertype, nickname):
         if channel == CURRENT_CHANNEL:
-            channel = self.chat_box.current_channel
+            channel = self.chat_box.get_current_channel(factory.network)
 
-        self.chat_box.set_user_mode(channel, usertype, nickname)
+        self.chat_box.set_user_mode(factory.network, channel, usertype, nickname)
 
 
 if __name__ == "__main__":
@@ -335,14 +560,15 @@ if __name__ == "__main__":
         from twisted.internet.error import ReactorNotRunning
 
         Gtk.main_quit()
+        polari.close_logs()
 
         try:
             reactor.stop()
         except ReactorNotRunning:
             pass
 
-    def _clicked(button, polari):
-        polari.set_screen(Screen.NEW_CHANNEL)
+    def _clicked(button, polari, new_network):
+        polari.show_new_channel_screen(new_network)
 
     win = Gtk.Window()
     win.set_title(_("Polari for Sugar"))
@@ -352,7 +578,11 @@ if __name__ == "__main__":
     win.add(polari)
 
     button = Gtk.Button.new_with_label(_("Add channel"))
-    button.connect("clicked", _clicked, polari)
+    button.connect("clicked", _clicked, polari, False)
+    polari.pack_end(button, False, False, 0)
+
+    button = Gtk.Button.new_with_label(_("Add network"))
+    button.connect("clicked", _clicked, polari, True)
     polari.pack_end(button, False, False, 0)
 
     win.show_all()
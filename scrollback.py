@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import os
+import json
+import tempfile
+
+from consts import TMP_DIR
+
+
+class ScrollbackArchive(object):
+    # Lines (text, tags) trimmed from the top of a channel view, stored as
+    # JSON one per line. Works like a stack: trimmed lines are always newer
+    # than the archived ones, and the lines paged back into the view are the
+    # newest archived ones.
+
+    def __init__(self):
+        self.file = None
+        self.offsets = []  # Position of each line on the file
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def push(self, lines):
+        if self.file is None:
+            if not os.path.isdir(TMP_DIR):
+                os.makedirs(TMP_DIR)
+
+            self.file = tempfile.TemporaryFile(prefix="scrollback-", dir=TMP_DIR)
+
+        self.file.seek(0, os.SEEK_END)
+        position = self.file.tell()
+
+        data = [json.dumps(line) + "\n" for line in lines]  # Always ASCII
+        for line in data:
+            self.offsets.append(position)
+            position += len(line)
+
+        self.file.write("".join(data))
+
+    def pop(self, count):
+        # Returns the newest `count` lines, oldest first
+        count = min(count, len(self.offsets))
+        if count == 0:
+            return []
+
+        start = self.offsets[-count]
+        del self.offsets[-count:]
+
+        self.file.seek(start)
+        data = self.file.read()
+        self.file.seek(start)
+        self.file.truncate()
+
+        return [json.loads(line) for line in data.splitlines()]
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+        self.offsets = []
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2016, Cristian García <cristian99garcia@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+import json
+import zlib
+
+
+MAGIC = b"POLARI-SESSION-1\n"
+
+
+def write_session(path, session):
+    # session: a dict of JSON types, see PolariCanvas.get_session
+    data = json.dumps(session, separators=(",", ":"))
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        file.write(zlib.compress(data.encode("utf-8"), 6))
+
+
+def read_session(path):
+    # Returns the session, or None if the file isn't a session
+    try:
+        with open(path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                return None
+
+            return json.loads(zlib.decompress(file.read()).decode("utf-8"))
+
+    except (IOError, ValueError, zlib.error):
+        return None
@@ -24,7 +24,7 @@ import sys
 import subprocess
 import re
 
-IGNORE_DIRS = ['dist', '.git', 'screenshots']
+IGNORE_DIRS = ['dist', '.git', 'screenshots', 'benchmarks']
 IGNORE_FILES = ['.gitignore', 'MANIFEST', '*.pyc', '*~', '*.bak', 'pseudo.po']
 
 
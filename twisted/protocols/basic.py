@@ -521,9 +521,19 @@ class LineReceiver(protocol.Protocol, _PauseableMixin):
     @cvar MAX_LENGTH: The maximum length of a line to allow (If a
                       sent line is longer than this, the connection is dropped).
                       Default is 16384.
+
+    @ivar _buffer: Received data, from C{_bufferOffset} on it hasn't been
+        delivered yet.  Lines are found and sliced in place, and the
+        delivered bytes are only dropped once they are at least half of the
+        buffer, so each received byte is copied a constant number of times.
+    @type _buffer: C{bytearray} or L{None}
+
+    @ivar _bufferOffset: Where the undelivered data starts in C{_buffer}.
+    @type _bufferOffset: C{int}
     """
     line_mode = 1
-    _buffer = b''
+    _buffer = None
+    _bufferOffset = 0
     _busyReceiving = False
     delimiter = b'\r\n'
     MAX_LENGTH = 16384
@@ -535,51 +545,74 @@ class LineReceiver(protocol.Protocol, _PauseableMixin):
         @return: All of the cleared buffered data.
         @rtype: C{bytes}
         """
-        b, self._buffer = self._buffer, b""
+        if self._buffer is None:
+            return b""
+        b = bytes(self._buffer[self._bufferOffset:])
+        self._buffer = bytearray()
+        self._bufferOffset = 0
         return b
 
 
+    def _compactLineBuffer(self):
+        """
+        Drop the delivered bytes from the buffer, if they are at least half
+        of it.
+        """
+        buffer = self._buffer
+        if buffer is None or self._bufferOffset == 0:
+            return
+        if self._bufferOffset == len(buffer):
+            del buffer[:]
+            self._bufferOffset = 0
+        elif self._bufferOffset * 2 >= len(buffer):
+            del buffer[:self._bufferOffset]
+            self._bufferOffset = 0
+
+
     def dataReceived(self, data):
         """
         Protocol.dataReceived.
         Translates bytes into lines, and calls lineReceived (or
         rawDataReceived, depending on mode.)
         """
+        if self._buffer is None:
+            self._buffer = bytearray()
+        self._buffer += data
         if self._busyReceiving:
-            self._buffer += data
             return
 
         try:
             self._busyReceiving = True
-            self._buffer += data
-            while self._buffer and not self.paused:
+            # lineReceived and rawDataReceived may replace the buffer, with
+            # clearLineBuffer, so it's looked up again after each of them.
+            while (len(self._buffer) > self._bufferOffset and
+                   not self.paused):
+                buffer = self._buffer
+                start = self._bufferOffset
                 if self.line_mode:
-                    try:
-                        line, self._buffer = self._buffer.split(
-                            self.delimiter, 1)
-                    except ValueError:
-                        if len(self._buffer) > self.MAX_LENGTH:
-                            line, self._buffer = self._buffer, b''
-                            return self.lineLengthExceeded(line)
+                    end = buffer.find(self.delimiter, start)
+                    if end == -1:
+                        if len(buffer) - start > self.MAX_LENGTH:
+                            return self.lineLengthExceeded(
+                                self.clearLineBuffer())
                         return
-                    else:
-                        lineLength = len(line)
-                        if lineLength > self.MAX_LENGTH:
-                            exceeded = line + self.delimiter + self._buffer
-                            self._buffer = b''
-                            return self.lineLengthExceeded(exceeded)
-                        why = self.lineReceived(line)
-                        if (why or self.transport and
-                            self.transport.disconnecting):
-                            return why
+                    if end - start > self.MAX_LENGTH:
+                        return self.lineLengthExceeded(
+                            self.clearLineBuffer())
+                    self._bufferOffset = end + len(self.delimiter)
+                    why = self.lineReceived(bytes(buffer[start:end]))
+                    if (why or self.transport and
+                        self.transport.disconnecting):
+                        return why
                 else:
-                    data = self._buffer
-                    self._buffer = b''
+                    data = bytes(buffer[start:])
+                    self._bufferOffset = len(buffer)
                     why = self.rawDataReceived(data)
                     if why:
                         return why
         finally:
             self._busyReceiving = False
+            self._compactLineBuffer()
 
 
     def setLineMode(self, extra=b''):
@@ -336,6 +336,51 @@ a'''
         self.assertRaises(NotImplementedError, proto.lineReceived, 'foo')
 
 
+    def test_linesAreBytes(self):
+        """
+        L{LineReceiver.lineReceived} and L{LineReceiver.rawDataReceived} are
+        called with C{bytes}, not with slices of the receive buffer.
+        """
+        proto = FlippingLineTester()
+        proto.makeConnection(proto_helpers.StringTransport())
+        raw = []
+        proto.rawDataReceived = raw.append
+        proto.dataReceived(b'line\nraw data')
+        self.assertEqual([b'line'], proto.lines)
+        self.assertEqual([b'raw data'], raw)
+        self.assertIsInstance(proto.lines[0], bytes)
+        self.assertIsInstance(raw[0], bytes)
+
+
+    def test_deliveredDataDropped(self):
+        """
+        Once C{dataReceived} returns, the receive buffer only keeps the
+        bytes that weren't delivered yet.
+        """
+        proto = LineTester()
+        proto.makeConnection(proto_helpers.StringTransport())
+        proto.dataReceived(b'twiddle1\n' * 100 + b'partial')
+        self.assertEqual([b'twiddle1'] * 100, proto.received)
+        self.assertEqual(b'partial', bytes(proto._buffer))
+        proto.dataReceived(b' line\n')
+        self.assertEqual(b'partial line', proto.received[-1])
+        self.assertEqual(b'', bytes(proto._buffer))
+
+
+    def test_manyLinesWithinMaximumLength(self):
+        """
+        C{MAX_LENGTH} limits each line, so a chunk with many lines longer
+        than C{MAX_LENGTH} altogether is delivered line by line.
+        """
+        proto = LineTester()
+        proto.makeConnection(proto_helpers.StringTransport())
+        line = b'x' * (proto.MAX_LENGTH - 1)
+        proto.dataReceived((line + b'\n') * 10 + line)
+        self.assertEqual([line] * 10, proto.received)
+        proto.dataReceived(b'\n')
+        self.assertEqual([line] * 11, proto.received)
+
+
 
 class ExcessivelyLargeLineCatcher(basic.LineReceiver):
     """
@@ -34,11 +34,12 @@ Test coverage needs to be better.
 <http://www.irchelp.org/irchelp/rfc/ctcpspec.html>}
 """
 
-import errno, os, random, re, stat, struct, sys, time, traceback
+import calendar, errno, os, random, re, stat, struct, sys, time, traceback
 import operator
 import string, socket
 import textwrap
 import shlex
+from collections import deque
 from functools import reduce
 from os import path
 
@@ -59,6 +60,11 @@ MAX_COMMAND_LENGTH = 512
 
 CHANNEL_PREFIXES = '&#!+'
 
+# Priorities of the lines waiting on IRCClient's send queue, lower is sooner.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
 class IRCBadMessage(Exception):
     pass
 
@@ -102,6 +108,233 @@ def parsemsg(s):
 
 
 
+_tagUnescapes = {
+    ':': ';',
+    's': ' ',
+    'r': '\r',
+    'n': '\n',
+    '\\': '\\',
+    }
+
+_tagEscape_re = re.compile(r'\\(.?)', re.DOTALL)
+
+
+
+def _unescapeTagValue(value):
+    """
+    Unescape a tag value according to U{escaping rules in IRCv3
+    <https://ircv3.net/specs/core/message-tags-3.2.html>}, the reverse of
+    L{IRC._escapeTagValue}.
+
+    @param value: The escaped value.
+    @type value: L{str}
+
+    @return: The unescaped value.  Unknown escapes lose their backslash and
+        a trailing backslash is dropped.
+    @rtype: L{str}
+    """
+    return _tagEscape_re.sub(
+        lambda match: _tagUnescapes.get(match.group(1), match.group(1)),
+        value)
+
+
+
+def parseTags(s):
+    """
+    Breaks the tags of an IRCv3 message into a dict.
+
+    @param s: The tags, without the leading C{@}.
+    @type s: L{str}
+
+    @return: A dict of tag names to unescaped values.  Tags sent without a
+        value have C{""} as their value.
+    @rtype: L{dict}
+    """
+    tags = {}
+    for tag in s.split(';'):
+        name, sep, value = tag.partition('=')
+        if not name:
+            continue
+        if '\\' in value:
+            value = _unescapeTagValue(value)
+        tags[name] = value
+    return tags
+
+
+
+class IRCMessage(object):
+    """
+    A message received from an IRC server, see L{parseMessage}.
+
+    @ivar tags: The IRCv3 tags of the message, see L{parseTags}.
+    @type tags: L{dict}
+
+    @ivar prefix: The prefix of the message, or C{""}.
+    @type prefix: L{str}
+
+    @ivar command: The command or numeric, as sent by the server.
+    @type command: L{str}
+
+    @ivar params: The parameters of the message, the trailing one included.
+    @type params: L{list}
+    """
+    __slots__ = ('tags', 'prefix', 'command', 'params', '_source')
+
+    def __init__(self, command, params, prefix='', tags=None):
+        self.tags = {} if tags is None else tags
+        self.prefix = prefix
+        self.command = command
+        self.params = params
+
+
+    def _splitPrefix(self):
+        """
+        Split the prefix into nick, user and host, the first time one of
+        them is needed.
+
+        @rtype: L{tuple}
+        """
+        try:
+            return self._source
+        except AttributeError:
+            nick, sep, host = self.prefix.partition('@')
+            nick, sep, user = nick.partition('!')
+            self._source = (nick, user, host)
+            return self._source
+
+
+    @property
+    def nick(self):
+        """
+        The nick (or server name) of the prefix.
+        """
+        return self._splitPrefix()[0]
+
+
+    @property
+    def user(self):
+        """
+        The user of the prefix, or C{""}.
+        """
+        return self._splitPrefix()[1]
+
+
+    @property
+    def host(self):
+        """
+        The host of the prefix, or C{""}.
+        """
+        return self._splitPrefix()[2]
+
+
+    def __eq__(self, other):
+        if not isinstance(other, IRCMessage):
+            return NotImplemented
+        return ((self.tags, self.prefix, self.command, self.params) ==
+                (other.tags, other.prefix, other.command, other.params))
+
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+
+    __hash__ = None
+
+
+    def __repr__(self):
+        return '%s(%r, %r, prefix=%r, tags=%r)' % (
+            self.__class__.__name__, self.command, self.params, self.prefix,
+            self.tags)
+
+
+
+def parseMessage(s):
+    """
+    Breaks a message from an IRC server into its tags, prefix, command and
+    parameters.
+
+    Unlike L{parsemsg}, IRCv3 tags are understood.  The line is searched once
+    for the trailing parameter and split once, the prefix being the first
+    word of the split.  Low-level quoting is not undone here, see
+    L{lowDequote}.
+
+    @param s: The message to break.
+    @type s: L{str}
+
+    @raise IRCBadMessage: If the message has no command.
+
+    @rtype: L{IRCMessage}
+    """
+    tags = None
+    if s[:1] == '@':
+        # Tags have no spaces, but a prefix after them would look like the
+        # trailing parameter
+        tags, sep, s = s[1:].partition(' ')
+        tags = parseTags(tags)
+        s = s.lstrip(' ')
+
+    end = s.find(' :')
+    if end == -1:
+        params = s.split()
+    else:
+        params = s[:end].split()
+        params.append(s[end + 2:])
+
+    try:
+        if params[0][0] == ':':
+            prefix = params[0][1:]
+            command = params[1]
+            del params[:2]
+        else:
+            prefix = ''
+            command = params.pop(0)
+    except IndexError:
+        raise IRCBadMessage("No command: %r" % (s,))
+    return IRCMessage(command, params, prefix, tags)
+
+
+
+def parseServerTime(value):
+    """
+    Convert the C{time} tag of the IRCv3 I{server-time} extension to seconds
+    since the epoch.
+
+    @param value: A UTC time like C{"2026-01-01T00:00:00.000Z"}.
+    @type value: L{str}
+
+    @raise ValueError: If C{value} isn't such a time.
+
+    @rtype: L{float}
+    @see: U{https://ircv3.net/specs/extensions/server-time}
+    """
+    seconds, sep, fraction = value.rstrip('Z').partition('.')
+    moment = calendar.timegm(time.strptime(seconds, '%Y-%m-%dT%H:%M:%S'))
+    if fraction:
+        return moment + float('0.' + fraction)
+    return float(moment)
+
+
+
+def formatServerTime(seconds):
+    """
+    Format seconds since the epoch like the IRCv3 I{server-time} extension,
+    the reverse of L{parseServerTime}.
+
+    @type seconds: L{float}
+
+    @rtype: L{str}
+    """
+    milliseconds = int(round(seconds * 1000))
+    return '%s.%03dZ' % (
+        time.strftime('%Y-%m-%dT%H:%M:%S',
+                      time.gmtime(milliseconds // 1000)),
+        milliseconds % 1000)
+
+
+
 def split(str, length=80):
     """
     Split a string into multiple lines.
@@ -147,6 +380,56 @@ class UnhandledCommand(RuntimeError):
 
 
 
+def _getDispatchTable(cls, prefix, aliases=None):
+    """
+    Get the command handlers of a class, found once and kept on the class.
+
+    Handlers are the attributes named C{prefix + '_' + command}.  They are
+    looked up with C{getattr} on C{cls}, so the handlers of a subclass win
+    over the inherited ones.  Each class builds its own table the first time
+    it dispatches a command; handlers added to the class after that are not
+    in the table.
+
+    @param cls: The class of the dispatcher.
+
+    @type prefix: C{str}
+    @param prefix: The handler prefix, like C{'irc'}.
+
+    @type aliases: C{dict} mapping C{str} to C{str}
+    @param aliases: Other names of the commands, like numerics for their
+        symbolic names.  An alias gets the handler of its command, or no
+        handler if the command doesn't have one.
+
+    @rtype: C{dict} mapping C{str} to C{tuple}
+    @return: Command names and aliases, mapped to the handler attribute name
+        and the handler as found on C{cls}.
+    """
+    tables = cls.__dict__.get('_dispatchTables')
+    if tables is None:
+        tables = {}
+        setattr(cls, '_dispatchTables', tables)
+
+    table = tables.get(prefix)
+    if table is None:
+        start = prefix + '_'
+        table = {}
+        for name in dir(cls):
+            if name.startswith(start):
+                handler = getattr(cls, name, None)
+                if handler is not None:
+                    table[name[len(start):]] = (name, handler)
+
+        for alias, command in (aliases or {}).items():
+            if command in table:
+                table[alias] = table[command]
+            else:
+                table.pop(alias, None)
+
+        tables[prefix] = table
+    return table
+
+
+
 class _CommandDispatcherMixin(object):
     """
     Dispatch commands to handlers based on their name.
@@ -158,31 +441,63 @@ class _CommandDispatcherMixin(object):
     Attempting to mix this in more than once for a single class will cause
     strange behaviour, due to L{prefix} being overwritten.
 
+    The handlers of each class are found once, see L{_getDispatchTable}.
+    Handlers set on an instance before its first dispatch win over the ones
+    of the class; to set one after that, reset L{_dispatchHandlers} to
+    L{None}.
+
     @type prefix: C{str}
     @ivar prefix: Command handler prefix, used to locate handler attributes
+
+    @ivar _dispatchHandlers: The table of the class, without the commands
+        this instance has its own handlers for, or L{None} before the first
+        dispatch.
     """
     prefix = None
+    _dispatchHandlers = None
 
     def dispatch(self, commandName, *args):
         """
         Perform actual command dispatch.
         """
-        def _getMethodName(command):
-            return '%s_%s' % (self.prefix, command)
+        handlers = self._dispatchHandlers
+        if handlers is None:
+            handlers = self._bindDispatchHandlers()
+        handler = handlers.get(commandName)
+        if handler is not None:
+            return handler[1](self, *args)
 
-        def _getMethod(name):
-            return getattr(self, _getMethodName(name), None)
-
-        method = _getMethod(commandName)
+        method = getattr(self, '%s_%s' % (self.prefix, commandName), None)
         if method is not None:
             return method(*args)
 
-        method = _getMethod('unknown')
+        method = getattr(self, '%s_unknown' % (self.prefix,), None)
         if method is None:
-            raise UnhandledCommand("No handler for %r could be found" % (_getMethodName(commandName),))
+            raise UnhandledCommand("No handler for %r could be found" % (
+                '%s_%s' % (self.prefix, commandName),))
         return method(commandName, *args)
 
 
+    def _bindDispatchHandlers(self):
+        """
+        Get the handlers of the class of this dispatcher, leaving out the
+        commands it has its own handlers for, so that L{dispatch} finds
+        those with C{getattr}.
+
+        @rtype: C{dict}
+        @return: The table of L{_getDispatchTable}, or a copy of it.
+        """
+        table = _getDispatchTable(self.__class__, self.prefix)
+        overridden = [command for command, (name, handler) in table.items()
+                      if name in self.__dict__]
+        if overridden:
+            table = table.copy()
+            for command in overridden:
+                del table[command]
+        self._dispatchHandlers = table
+        return table
+
+
 
 
 
@@ -986,6 +1301,16 @@ class ServerSupportedFeatures(_CommandDispatcherMixin):
         return tuple(params[0])
 
 
+    def isupport_CHATHISTORY(self, params):
+        """
+        The most messages a I{CHATHISTORY} command may ask for, C{0} when
+        there is no limit.
+
+        @see: U{https://ircv3.net/specs/extensions/chathistory}
+        """
+        return _intOrDefault(params[0], 0)
+
+
     def isupport_EXCEPTS(self, params):
         """
         Mode character for "ban exceptions".
@@ -1138,9 +1463,28 @@ class IRCClient(basic.LineReceiver):
         client may be found.  If L{None}, no SOURCE reply will be sent.
 
     @ivar lineRate: Minimum delay between lines sent to the server.  If
-        L{None}, no delay will be imposed.
+        L{None}, no delay will be imposed.  Ignored if L{floodBudget} is set.
     @type lineRate: Number of Seconds.
 
+    @ivar floodBudget: Seconds of penalty the server lets a client accumulate
+        before throttling or disconnecting it.  When set, lines are sent
+        through a token bucket of this size, refilled one token per second,
+        in which every line costs L{floodPenalty} tokens.  Lines that don't
+        fit wait in a queue, by priority (see L{linePriorities}).  If
+        L{None}, L{lineRate} is used instead.
+    @type floodBudget: Number of Seconds.
+
+    @ivar floodPenalty: Seconds of penalty the server adds for every line.
+    @type floodPenalty: Number of Seconds.
+
+    @ivar linePriorities: Priority of the lines waiting to be sent, by
+        command.  Commands not listed get L{PRIORITY_NORMAL}.
+    @type linePriorities: C{dict} mapping C{str} to C{int}
+
+    @ivar clock: The clock used to schedule the queued lines, the reactor
+        if L{None}.
+    @type clock: L{IReactorTime}
+
     @ivar motd: Either L{None} or, between receipt of I{RPL_MOTDSTART} and
         I{RPL_ENDOFMOTD}, a L{list} of L{str}, each of which is the content
         of an I{RPL_MOTD} message.
@@ -1176,9 +1520,31 @@ class IRCClient(basic.LineReceiver):
     @ivar heartbeatInterval: Interval, in seconds, to send I{PING} messages to
         the server as a form of keepalive, defaults to 120 seconds. Use L{None}
         to disable the heartbeat.
+
+    @type currentMessage: L{IRCMessage}
+    @ivar currentMessage: The message being dispatched, so handlers can look
+        at its tags or at the pieces of its prefix, or L{None} outside of
+        L{lineReceived}.
+
+    @type capabilities: C{list} of C{str}
+    @ivar capabilities: IRCv3 capabilities to enable when the server offers
+        them, like C{"multi-prefix"}, C{"server-time"}, C{"batch"},
+        C{"message-tags"} or C{"draft/chathistory"}.  When there are any,
+        registration waits for their negotiation, see L{irc_CAP}.
+
+    @type serverCapabilities: C{dict}
+    @ivar serverCapabilities: The capabilities the server offers, mapped to
+        their values or C{""}.
+
+    @type enabledCapabilities: C{set}
+    @ivar enabledCapabilities: The capabilities the server acknowledged.
     """
     hostname = None
     motd = None
+    currentMessage = None
+    capabilities = ()
+    serverCapabilities = None
+    enabledCapabilities = None
     nickname = 'irc'
     password = None
     realname = None
@@ -1202,8 +1568,28 @@ class IRCClient(basic.LineReceiver):
     performLogin = 1
 
     lineRate = None
+    floodBudget = None
+    floodPenalty = 2.0
+    linePriorities = {
+        'PASS': PRIORITY_HIGH,
+        'USER': PRIORITY_HIGH,
+        'NICK': PRIORITY_HIGH,
+        'PING': PRIORITY_HIGH,
+        'PONG': PRIORITY_HIGH,
+        'QUIT': PRIORITY_HIGH,
+        'PRIVMSG': PRIORITY_LOW,
+        'NOTICE': PRIORITY_LOW,
+    }
+    clock = None
     _queue = None
     _queueEmptying = None
+    _tokens = 0
+    _tokensTime = 0
+    _commandHandlers = None
+    _symbolicCommands = False
+    _negotiating = False
+    _capabilityRequests = 0
+    _batches = None
 
     delimiter = b'\n' # b'\r\n' will also work (see dataReceived)
 
@@ -1225,25 +1611,119 @@ class IRCClient(basic.LineReceiver):
         return basic.LineReceiver.sendLine(self, quoteLine)
 
     def sendLine(self, line):
-        if self.lineRate is None:
+        if self._floodLimits() is None:
             self._reallySendLine(line)
         else:
-            self._queue.append(line)
+            self._queue[self._linePriority(line)].append(line)
             if not self._queueEmptying:
-                self._sendLine()
+                self._flushQueue()
+            if self._queueEmptying:
+                # The line has to wait.
+                self.sendQueueChanged()
+
+
+    def _floodLimits(self):
+        """
+        Get the size of the token bucket and the cost of every line.
+
+        @return: C{(budget, penalty)}, or L{None} if lines aren't limited.
+            A L{lineRate} is a bucket with room for a single line.
+        """
+        if self.floodBudget is not None:
+            return self.floodBudget, self.floodPenalty
+        if self.lineRate is not None:
+            return self.lineRate, self.lineRate
+        return None
+
+
+    def _linePriority(self, line):
+        """
+        Get the priority of a line, from its command.
+        """
+        if isinstance(line, bytes) and bytes is not str:
+            line = line.decode('utf-8', 'replace')
+        for word in line.split(None, 3)[:3]:
+            if word[:1] not in ('@', ':'):
+                return self.linePriorities.get(word.upper(), PRIORITY_NORMAL)
+        return PRIORITY_NORMAL
+
+
+    def _refillTokens(self):
+        """
+        Add the tokens earned since the last refill, up to the budget.
+        """
+        budget, penalty = self._floodLimits()
+        now = (self.clock or reactor).seconds()
+        self._tokens = min(budget, self._tokens + now - self._tokensTime)
+        self._tokensTime = now
+
+
+    def _flushQueue(self):
+        """
+        Send the queued lines the token bucket allows, the most urgent
+        first, and schedule the rest.
+        """
+        budget, penalty = self._floodLimits()
+        self._refillTokens()
+        for queue in self._queue:
+            while queue and self._tokens >= penalty:
+                self._reallySendLine(queue.popleft())
+                self._tokens -= penalty
+        if self.sendQueueDepth():
+            self._queueEmptying = (self.clock or reactor).callLater(
+                penalty - self._tokens, self._sendLine)
+
 
     def _sendLine(self):
-        if self._queue:
-            self._reallySendLine(self._queue.pop(0))
-            self._queueEmptying = reactor.callLater(self.lineRate,
-                                                    self._sendLine)
-        else:
-            self._queueEmptying = None
+        self._queueEmptying = None
+        self._flushQueue()
+        self.sendQueueChanged()
+
+
+    def sendQueueDepth(self):
+        """
+        Get the number of lines waiting to be sent.
+
+        @rtype: C{int}
+        """
+        if not self._queue:
+            return 0
+        return sum(len(queue) for queue in self._queue)
+
+
+    def sendQueueDrainTime(self):
+        """
+        Get how long it will take to send every line waiting on the queue.
+
+        @return: Seconds.
+        @rtype: C{float}
+        """
+        depth = self.sendQueueDepth()
+        if not depth:
+            return 0.0
+        budget, penalty = self._floodLimits()
+        self._refillTokens()
+        return max(0.0, depth * penalty - self._tokens)
+
+
+    def sendQueueChanged(self):
+        """
+        Called when lines are queued by the flood control, sent from the
+        queue, or dropped with it when the connection is lost.  Use
+        L{sendQueueDepth} and L{sendQueueDrainTime} to show the progress.
+        """
 
 
     def connectionLost(self, reason):
         basic.LineReceiver.connectionLost(self, reason)
         self.stopHeartbeat()
+        if self._queueEmptying is not None:
+            self._queueEmptying.cancel()
+            self._queueEmptying = None
+        if self.sendQueueDepth():
+            for queue in self._queue:
+                queue.clear()
+            self.sendQueueChanged()
 
 
     def _createHeartbeat(self):
@@ -1353,6 +1833,43 @@ class IRCClient(basic.LineReceiver):
         in the form "NAME=VALUE".
         """
 
+    def capabilitiesChanged(self, added, removed):
+        """
+        Called when IRCv3 capabilities are enabled or disabled, see
+        L{enabledCapabilities}.
+
+        @type added: C{list} of C{str}
+        @param added: The capabilities the server acknowledged.
+
+        @type removed: C{list} of C{str}
+        @param removed: The capabilities that were disabled, or that the
+        server no longer offers.
+        """
+
+    def batchStarted(self, reference, batchType, params):
+        """
+        Called when the server starts a batch of messages.  The messages of
+        the batch have its reference on their C{batch} tag, see
+        L{currentMessage}.
+
+        @type reference: C{str}
+        @param reference: The reference of the batch.
+
+        @type batchType: C{str}
+        @param batchType: The kind of batch, like C{"chathistory"} or
+        C{"netsplit"}.
+
+        @type params: C{list} of C{str}
+        @param params: The parameters of the batch, like the target of a
+        C{"chathistory"} batch.
+        """
+
+    def batchEnded(self, reference, batchType, params):
+        """
+        Called when all the messages of a batch have been received, with the
+        same arguments as L{batchStarted}.
+        """
+
     def luserChannels(self, channels):
         """
         Called with the number of channels existent on the server.
@@ -1791,6 +2308,38 @@ class IRCClient(basic.LineReceiver):
             self.sendLine('WHOIS %s %s' % (server, nickname))
 
 
+    def chathistory(self, target, reference='*', limit=100,
+                    subcommand='LATEST'):
+        """
+        Ask for the messages of a channel or query, with the
+        I{draft/chathistory} capability.  They come in a C{"chathistory"}
+        batch, see L{batchStarted}.
+
+        @type target: C{str}
+        @param target: The channel or nickname.
+
+        @type reference: C{str}
+        @param reference: C{"*"} for the latest messages, or the message to
+            start from as C{"timestamp=..."} (see L{formatServerTime}) or
+            C{"msgid=..."}.  With C{"LATEST"}, only messages after it are
+            sent.
+
+        @type limit: C{int}
+        @param limit: The most messages to receive, no more than the
+            I{CHATHISTORY} ISUPPORT feature allows.
+
+        @type subcommand: C{str}
+        @param subcommand: C{"LATEST"}, C{"BEFORE"} or C{"AFTER"}.
+
+        @see: U{https://ircv3.net/specs/extensions/chathistory}
+        """
+        maximum = self.supported.getFeature('CHATHISTORY')
+        if maximum:
+            limit = min(limit, maximum)
+        self.sendLine('CHATHISTORY %s %s %s %d' % (subcommand, target,
+                                                   reference, limit))
+
+
     def register(self, nickname, hostname='foo', servername='bar'):
         """
         Login to the server.
@@ -1802,6 +2351,8 @@ class IRCClient(basic.LineReceiver):
         @type servername: C{str}
         @param servername: If specified, the servername to logon as.
         """
+        if self.capabilities:
+            self.negotiateCapabilities()
         if self.password is not None:
             self.sendLine("PASS %s" % self.password)
         self.setNick(nickname)
@@ -1810,6 +2361,30 @@ class IRCClient(basic.LineReceiver):
         self.sendLine("USER %s %s %s :%s" % (self.username, hostname, servername, self.realname))
 
 
+    def negotiateCapabilities(self):
+        """
+        Ask the server for the capabilities it offers, the ones in
+        L{capabilities} are requested when it answers.  Registration doesn't
+        finish until the negotiation ends.
+
+        @see: U{https://ircv3.net/specs/extensions/capability-negotiation}
+        """
+        self._negotiating = True
+        self.sendLine("CAP LS 302")
+
+
+    def requestCapabilities(self, capabilities):
+        """
+        Ask the server to enable IRCv3 capabilities.  The answer comes to
+        L{capabilitiesChanged}.
+
+        @type capabilities: C{list} of C{str}
+        @param capabilities: The capabilities to enable.
+        """
+        self._capabilityRequests += 1
+        self.sendLine("CAP REQ :%s" % (" ".join(capabilities),))
+
+
     def setNick(self, nickname):
         """
         Set this client's nickname.
@@ -1959,11 +2534,100 @@ class IRCClient(basic.LineReceiver):
         """
         self.hostname = prefix
         self._registered = True
+        self._negotiating = False
         self.nickname = self._attemptedNick
         self.signedOn()
         self.startHeartbeat()
 
 
+    def irc_CAP(self, prefix, params):
+        """
+        Called when the server answers a I{CAP} command, or when it offers
+        new capabilities or stops offering some.
+
+        @see: U{https://ircv3.net/specs/extensions/capability-negotiation}
+        """
+        subcommand = params[1].upper()
+        capabilities = params[-1].split()
+
+        if subcommand in ('LS', 'NEW'):
+            for capability in capabilities:
+                name, sep, value = capability.partition('=')
+                self.serverCapabilities[name] = value
+            # A "*" before the list means more lines are coming
+            if subcommand == 'NEW' or len(params) < 4 or params[2] != '*':
+                self._requestOfferedCapabilities()
+
+        elif subcommand == 'ACK':
+            added = [name for name in capabilities if name[:1] != '-']
+            removed = [name[1:] for name in capabilities if name[:1] == '-']
+            self.enabledCapabilities.update(added)
+            self.enabledCapabilities.difference_update(removed)
+            self.capabilitiesChanged(added, removed)
+            self._capabilityRequestAnswered()
+
+        elif subcommand == 'NAK':
+            log.msg("Capabilities refused: %s" % (params[-1],))
+            self._capabilityRequestAnswered()
+
+        elif subcommand == 'DEL':
+            removed = [name for name in capabilities
+                       if name in self.enabledCapabilities]
+            for name in capabilities:
+                self.serverCapabilities.pop(name, None)
+            self.enabledCapabilities.difference_update(removed)
+            if removed:
+                self.capabilitiesChanged([], removed)
+
+
+    def _requestOfferedCapabilities(self):
+        """
+        Request the capabilities in L{capabilities} that the server offers
+        and aren't enabled, or end the negotiation if there are none.
+        """
+        wanted = [name for name in self.capabilities
+                  if name in self.serverCapabilities and
+                  name not in self.enabledCapabilities]
+        if wanted:
+            self.requestCapabilities(wanted)
+        else:
+            self._endNegotiation()
+
+
+    def _capabilityRequestAnswered(self):
+        """
+        Count an answer to L{requestCapabilities}, the negotiation ends
+        after the last one.
+        """
+        self._capabilityRequests = max(0, self._capabilityRequests - 1)
+        self._endNegotiation()
+
+
+    def _endNegotiation(self):
+        """
+        Let the registration finish, if the capability negotiation started
+        by L{negotiateCapabilities} has no requests waiting for an answer.
+        """
+        if self._negotiating and not self._capabilityRequests:
+            self._negotiating = False
+            self.sendLine("CAP END")
+
+
+    def irc_BATCH(self, prefix, params):
+        """
+        Called when the server starts or ends a batch of messages.
+
+        @see: U{https://ircv3.net/specs/extensions/batch}
+        """
+        reference = params[0][1:]
+        if params[0][:1] == '+':
+            self._batches[reference] = (params[1], params[2:])
+            self.batchStarted(reference, params[1], params[2:])
+        elif params[0][:1] == '-' and reference in self._batches:
+            batchType, batchParams = self._batches.pop(reference)
+            self.batchEnded(reference, batchType, batchParams)
+
+
     def irc_JOIN(self, prefix, params):
         """
         Called when a user joins a channel.
@@ -2620,7 +3284,16 @@ class IRCClient(basic.LineReceiver):
 
     def connectionMade(self):
         self.supported = ServerSupportedFeatures()
-        self._queue = []
+        self.serverCapabilities = {}
+        self.enabledCapabilities = set()
+        self._batches = {}
+        self._negotiating = False
+        self._capabilityRequests = 0
+        self._queue = [deque(), deque(), deque()]
+        limits = self._floodLimits()
+        if limits is not None:
+            self._tokens = limits[0]
+            self._tokensTime = (self.clock or reactor).seconds()
         if self.performLogin:
             self.register(self.nickname)
 
@@ -2636,14 +3309,42 @@ class IRCClient(basic.LineReceiver):
             # decode bytes from transport to unicode
             line = line.decode("utf-8")
 
-        line = lowDequote(line)
+        # Low-level quoting is rare, skip the substitution without it
+        if M_QUOTE in line:
+            line = lowDequote(line)
         try:
-            prefix, command, params = parsemsg(line)
-            if command in numeric_to_symbolic:
-                command = numeric_to_symbolic[command]
-            self.handleCommand(command, prefix, params)
+            message = parseMessage(line)
         except IRCBadMessage:
             self.badMessage(line, *sys.exc_info())
+            return
+
+        if self._commandHandlers is None:
+            self._bindCommandHandlers()
+        command = message.command
+        if self._symbolicCommands:
+            command = numeric_to_symbolic.get(command, command)
+        self.currentMessage = message
+        try:
+            self.handleCommand(command, message.prefix, message.params)
+        finally:
+            self.currentMessage = None
+
+
+    def serverTime(self):
+        """
+        The time the server gave to the message being dispatched, with the
+        I{server-time} capability.
+
+        @rtype: C{float}
+        @return: Seconds since the epoch, or L{None} if the message has no
+            valid C{time} tag.
+        """
+        if self.currentMessage is None:
+            return None
+        try:
+            return parseServerTime(self.currentMessage.tags['time'])
+        except (KeyError, ValueError):
+            return None
 
 
     def getUserModeParams(self):
@@ -2683,7 +3384,16 @@ class IRCClient(basic.LineReceiver):
         Determine the function to call for the given command and call it with
         the given arguments.
 
+        The handlers are bound when the first command is received, from
+        the table of the class where numerics are included, see
+        L{_getDispatchTable}.  Handlers set on the instance before that win
+        over the ones of the class; to set one after that, reset
+        L{_commandHandlers} to L{None}.
+
         @param command: The IRC command to determine the function for.
+            Numerics are accepted as they are (C{'001'}) or by their name
+            (C{'RPL_WELCOME'}).  L{lineReceived} gives them by their name,
+            if they have one, only when this method is overridden.
         @type command: L{bytes}
 
         @param prefix: The prefix of the IRC message (as returned by
@@ -2693,20 +3403,55 @@ class IRCClient(basic.LineReceiver):
         @param params: A list of parameters to call the function with.
         @type params: L{list}
         """
-        method = getattr(self, "irc_%s" % command, None)
+        handlers = self._commandHandlers
+        if handlers is None:
+            handlers = self._bindCommandHandlers()
+        handler = handlers.get(command)
         try:
+            if handler is not None:
+                handler(prefix, params)
+                return
+
+            name = numeric_to_symbolic.get(command, command)
+            method = getattr(self, "irc_%s" % name, None)
             if method is not None:
                 method(prefix, params)
-            else:
-                self.irc_unknown(prefix, command, params)
+                return
+
+            if len(command) == 3 and command.isdigit():
+                # There are few numerics, remember the ones without a
+                # handler instead of looking them up again
+                handlers[command] = (
+                    lambda prefix, params: self.irc_unknown(
+                        prefix, name, params))
+            self.irc_unknown(prefix, name, params)
         except:
             log.deferr()
 
 
+    def _bindCommandHandlers(self):
+        """
+        Bind the handlers of the class of this client to it, or the ones
+        set on the instance, and find out if L{handleCommand} is overridden.
+
+        @return: A C{dict} mapping commands, numerics included, to their
+            handlers.
+        """
+        table = _getDispatchTable(self.__class__, 'irc', numeric_to_symbolic)
+        self._commandHandlers = dict(
+            (command, getattr(self, name))
+            for command, (name, handler) in table.items())
+        self._symbolicCommands = (
+            getattr(self.handleCommand, '__func__', None) is not
+            IRCClient.__dict__['handleCommand'])
+        return self._commandHandlers
+
+
     def __getstate__(self):
         dct = self.__dict__.copy()
         dct['dcc_sessions'] = None
         dct['_pings'] = None
+        dct['_commandHandlers'] = None
         return dct
 
 
@@ -539,6 +539,99 @@ class QuotingTests(IRCTestCase):
 
 
 
+class ParseMessageTests(IRCTestCase):
+    """
+    Tests for L{irc.parseMessage} and L{irc.parseTags}.
+    """
+    def test_sameAsParsemsg(self):
+        """
+        Without tags, L{irc.parseMessage} breaks messages the same way as
+        L{irc.parsemsg}.
+        """
+        for line in [':nick!user@host PRIVMSG #chan :hello there',
+                     ':server 353 me = #chan :@op +voice nick',
+                     'PING :server',
+                     ':server MODE #chan +o nick',
+                     'PRIVMSG #chan ::) trailing  spaces ',
+                     ':server 005 me   A=1 B :are supported',
+                     'QUIT :']:
+            message = irc.parseMessage(line)
+            self.assertEqual(
+                (message.prefix, message.command, message.params),
+                irc.parsemsg(line))
+            self.assertEqual(message.tags, {})
+
+
+    def test_tags(self):
+        """
+        Tags are broken into a dict, with C{""} for tags without a value.
+        """
+        message = irc.parseMessage(
+            '@time=2026-01-01T00:00:00.000Z;account=nick;+draft/flag '
+            ':nick!user@host PRIVMSG #chan :hi')
+        self.assertEqual(
+            message,
+            irc.IRCMessage('PRIVMSG', ['#chan', 'hi'], 'nick!user@host',
+                           {'time': '2026-01-01T00:00:00.000Z',
+                            'account': 'nick', '+draft/flag': ''}))
+
+
+    def test_tagsWithoutPrefix(self):
+        """
+        Tags can be followed by the command.
+        """
+        message = irc.parseMessage('@batch=ab PING :server')
+        self.assertEqual(
+            message, irc.IRCMessage('PING', ['server'], '', {'batch': 'ab'}))
+
+
+    def test_spacesAfterTags(self):
+        """
+        Extra spaces between the tags and the prefix are skipped.
+        """
+        message = irc.parseMessage('@a=b  :n!u@h PRIVMSG #c :x')
+        self.assertEqual(
+            message, irc.IRCMessage('PRIVMSG', ['#c', 'x'], 'n!u@h', {'a': 'b'}))
+
+
+    def test_tagValueUnescaping(self):
+        """
+        Tag values are unescaped, the reverse of L{irc.IRC.sendCommand}.
+        """
+        self.assertEqual(
+            irc.parseTags('a=test\\r\\n\\s\\\\\\:\\:;b=x\\y;c=end\\'),
+            {'a': 'test\r\n \\;;', 'b': 'xy', 'c': 'end'})
+
+
+    def test_prefix(self):
+        """
+        The prefix is split into nick, user and host.
+        """
+        message = irc.parseMessage(':nick!user@host PRIVMSG #chan :hi')
+        self.assertEqual((message.nick, message.user, message.host),
+                         ('nick', 'user', 'host'))
+        message = irc.parseMessage(':irc.example.com NOTICE * :hi')
+        self.assertEqual((message.nick, message.user, message.host),
+                         ('irc.example.com', '', ''))
+
+
+    def test_slots(self):
+        """
+        L{irc.IRCMessage} has no instance dict.
+        """
+        message = irc.parseMessage('PING :server')
+        self.assertRaises(AttributeError, setattr, message, 'other', 1)
+
+
+    def test_noCommand(self):
+        """
+        L{irc.IRCBadMessage} is raised for lines without a command.
+        """
+        for line in ['', '   ', ':prefix', ':prefix ', '@a=b', '@a=b :prefix']:
+            self.assertRaises(irc.IRCBadMessage, irc.parseMessage, line)
+
+
+
 class Dispatcher(irc._CommandDispatcherMixin):
     """
     A dispatcher that exposes one known command and handles unknown commands.
@@ -595,6 +688,43 @@ class DispatcherTests(IRCTestCase):
         self.assertRaises(irc.UnhandledCommand, disp.dispatch, 'bar')
 
 
+    def test_dispatchInstanceHandler(self):
+        """
+        A handler set on the instance wins over the handler of the class.
+        """
+        disp = Dispatcher()
+        disp.disp_working = lambda a, b: (b, a)
+        self.assertEqual(disp.dispatch('working', 1, 2), (2, 1))
+
+
+    def test_dispatchInstanceHandlerAfterDispatch(self):
+        """
+        A handler set on the instance after the first dispatch is used once
+        L{irc._CommandDispatcherMixin._dispatchHandlers} is reset.
+        """
+        disp = Dispatcher()
+        disp.dispatch('working', 1, 2)
+        disp.disp_working = lambda a, b: (b, a)
+        self.assertEqual(disp.dispatch('working', 1, 2), (1, 2))
+        disp._dispatchHandlers = None
+        self.assertEqual(disp.dispatch('working', 1, 2), (2, 1))
+
+
+    def test_dispatchSubclassHandler(self):
+        """
+        Each class dispatches to its own handlers, including the ones it
+        overrides, after its base class already dispatched commands.
+        """
+        class SubDispatcher(Dispatcher):
+            def disp_working(self, a, b):
+                return 'sub', a, b
+
+        self.assertEqual(Dispatcher().dispatch('working', 1, 2), (1, 2))
+        self.assertEqual(
+            SubDispatcher().dispatch('working', 1, 2), ('sub', 1, 2))
+        self.assertEqual(Dispatcher().dispatch('working', 1, 2), (1, 2))
+
+
 
 class ServerSupportedFeatureTests(IRCTestCase):
     """
@@ -948,6 +1078,15 @@ class ServerSupportedFeatureTests(IRCTestCase):
             ('#', '&', '%'))
 
 
+    def test_support_CHATHISTORY(self):
+        """
+        The CHATHISTORY support parameter is parsed into the most messages
+        a I{CHATHISTORY} command may ask for, C{0} meaning no limit.
+        """
+        self.assertEqual(self._parseFeature('CHATHISTORY', '50'), 50)
+        self.assertEqual(self._parseFeature('CHATHISTORY', None), 0)
+
+
     def test_support_KICKLEN(self):
         """
         The KICKLEN support parameter is parsed into an integer value
@@ -2422,6 +2561,586 @@ class ClientTests(IRCTestCase):
 
 
 
+class SendQueueTests(IRCTestCase):
+    """
+    Tests for the flood control of L{IRCClient}: L{IRCClient.floodBudget},
+    L{IRCClient.lineRate} and the send queue.
+    """
+    def setUp(self):
+        self.clock = task.Clock()
+        self.transport = StringTransport()
+        self.client = IRCClientWithoutLogin()
+        self.client.clock = self.clock
+        self.client.floodBudget = 6
+        self.client.floodPenalty = 2
+        self.changes = []
+        self.client.sendQueueChanged = lambda: self.changes.append(
+            (self.client.sendQueueDepth(), self.client.sendQueueDrainTime()))
+        self.client.makeConnection(self.transport)
+        self.addCleanup(self.client.connectionLost, None)
+
+
+    def sentLines(self):
+        """
+        Get the lines written so far and clear the transport.
+        """
+        lines = self.transport.value().decode('utf-8').split('\r\n')[:-1]
+        self.transport.clear()
+        return lines
+
+
+    def test_unlimited(self):
+        """
+        Without L{IRCClient.floodBudget} and L{IRCClient.lineRate} lines are
+        written right away.
+        """
+        self.client.floodBudget = None
+        for i in range(10):
+            self.client.msg('#chan', str(i))
+        self.assertEqual(len(self.sentLines()), 10)
+        self.assertEqual(self.client.sendQueueDepth(), 0)
+        self.assertEqual(self.changes, [])
+
+
+    def test_budget(self):
+        """
+        Lines are written right away while the budget allows it, the rest
+        wait until the bucket has enough tokens.
+        """
+        for i in range(5):
+            self.client.msg('#chan', str(i))
+        self.assertEqual(self.sentLines(),
+                         ['PRIVMSG #chan :0', 'PRIVMSG #chan :1',
+                          'PRIVMSG #chan :2'])
+        self.assertEqual(self.client.sendQueueDepth(), 2)
+        self.assertEqual(self.client.sendQueueDrainTime(), 4)
+
+        self.clock.advance(1)
+        self.assertEqual(self.sentLines(), [])
+        self.assertEqual(self.client.sendQueueDrainTime(), 3)
+        self.clock.advance(1)
+        self.assertEqual(self.sentLines(), ['PRIVMSG #chan :3'])
+        self.clock.advance(2)
+        self.assertEqual(self.sentLines(), ['PRIVMSG #chan :4'])
+        self.assertEqual(self.client.sendQueueDepth(), 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+    def test_refill(self):
+        """
+        The bucket refills while nothing is sent, but not beyond the budget.
+        """
+        for i in range(3):
+            self.client.msg('#chan', str(i))
+        self.clock.advance(100)
+        for i in range(4):
+            self.client.msg('#chan', str(i))
+        self.assertEqual(len(self.sentLines()), 6)
+        self.assertEqual(self.client.sendQueueDepth(), 1)
+
+
+    def test_priorities(self):
+        """
+        I{PONG}, I{NICK} and I{QUIT} go before the queued I{PRIVMSG}s, and
+        other commands between them.
+        """
+        for i in range(5):
+            self.client.msg('#chan', str(i))
+        self.sentLines()
+        self.client.join('#other')
+        self.client.irc_PING('server', ['server'])
+        self.client.setNick('nick')
+        self.clock.advance(6)
+        self.assertEqual(self.sentLines(),
+                         ['PONG server', 'NICK nick', 'JOIN #other'])
+        self.clock.advance(4)
+        self.assertEqual(self.sentLines(),
+                         ['PRIVMSG #chan :3', 'PRIVMSG #chan :4'])
+
+
+    def test_linePriority(self):
+        """
+        The priority comes from the command, after the tags and the prefix.
+        """
+        self.assertEqual(self.client._linePriority('PONG x'),
+                         irc.PRIORITY_HIGH)
+        self.assertEqual(self.client._linePriority(':me PRIVMSG #a :b'),
+                         irc.PRIORITY_LOW)
+        self.assertEqual(self.client._linePriority('@a=b :me quit :bye'),
+                         irc.PRIORITY_HIGH)
+        self.assertEqual(self.client._linePriority('MODE #a +o b'),
+                         irc.PRIORITY_NORMAL)
+        self.assertEqual(self.client._linePriority(b'PRIVMSG #a :b'),
+                         irc.PRIORITY_LOW)
+
+
+    def test_sendQueueChanged(self):
+        """
+        L{IRCClient.sendQueueChanged} is called when a line has to wait and
+        when queued lines are sent.
+        """
+        for i in range(4):
+            self.client.msg('#chan', str(i))
+        self.assertEqual(self.changes, [(1, 2)])
+        self.clock.advance(2)
+        self.assertEqual(self.changes, [(1, 2), (0, 0)])
+
+
+    def test_lineRate(self):
+        """
+        With L{IRCClient.lineRate} the first line is written right away and
+        each of the others C{lineRate} seconds after the previous one.
+        """
+        self.client.floodBudget = None
+        self.client.lineRate = 3
+        for i in range(3):
+            self.client.msg('#chan', str(i))
+        self.assertEqual(len(self.sentLines()), 1)
+        self.clock.advance(3)
+        self.assertEqual(len(self.sentLines()), 1)
+        self.clock.advance(2)
+        self.assertEqual(len(self.sentLines()), 0)
+        self.clock.advance(1)
+        self.assertEqual(len(self.sentLines()), 1)
+
+
+    def test_connectionLost(self):
+        """
+        The queued lines are dropped when the connection is lost.
+        """
+        for i in range(5):
+            self.client.msg('#chan', str(i))
+        self.assertEqual(len(self.sentLines()), 3)
+        self.client.connectionLost(None)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.assertEqual(self.client.sendQueueDepth(), 0)
+        self.assertEqual(self.changes[-1], (0, 0))
+        self.clock.advance(10)
+        self.assertEqual(self.sentLines(), [])
+
+
+
+class DispatchingClient(IRCClientWithoutLogin):
+    """
+    A client that records the commands that got to its handlers.
+    """
+    def __init__(self):
+        self.handled = []
+
+
+    def irc_PRIVMSG(self, prefix, params):
+        self.handled.append(('PRIVMSG', prefix, params))
+
+
+    def irc_RPL_WELCOME(self, prefix, params):
+        self.handled.append(('RPL_WELCOME', prefix, params))
+
+
+    def irc_unknown(self, prefix, command, params):
+        self.handled.append(('unknown', command, params))
+
+
+
+class CommandDispatchTableTests(IRCTestCase):
+    """
+    Tests for the command dispatch of L{IRCClient.handleCommand}.
+    """
+    def setUp(self):
+        self.client = DispatchingClient()
+        self.client.makeConnection(StringTransport())
+
+
+    def test_subclassHandler(self):
+        """
+        Commands go to the handlers a subclass overrides.
+        """
+        self.client.dataReceived(':nick!user@host PRIVMSG #chan :hello\r\n')
+        self.assertEqual(
+            self.client.handled,
+            [('PRIVMSG', 'nick!user@host', ['#chan', 'hello'])])
+
+
+    def test_numeric(self):
+        """
+        Numerics go to the handler of their symbolic name, the same as the
+        symbolic name itself.
+        """
+        self.client.dataReceived(':server 001 nick :Welcome\r\n')
+        self.client.handleCommand('RPL_WELCOME', 'server', ['nick', 'Hi'])
+        self.assertEqual(
+            self.client.handled,
+            [('RPL_WELCOME', 'server', ['nick', 'Welcome']),
+             ('RPL_WELCOME', 'server', ['nick', 'Hi'])])
+
+
+    def test_unknownNumeric(self):
+        """
+        L{IRCClient.irc_unknown} gets the symbolic name of a known numeric
+        without handler, and the numeric itself otherwise.
+        """
+        self.client.dataReceived(':server 200 nick :Link\r\n')
+        self.client.dataReceived(':server 999 nick :Unknown\r\n')
+        self.assertEqual(
+            self.client.handled,
+            [('unknown', 'RPL_TRACELINK', ['nick', 'Link']),
+             ('unknown', '999', ['nick', 'Unknown'])])
+
+
+    def test_instanceHandler(self):
+        """
+        A handler set on the instance wins over the handler of the class,
+        also when the class didn't have one.
+        """
+        received = []
+        self.client.irc_PRIVMSG = lambda prefix, params: received.append(
+            params)
+        self.client.irc_RPL_TRACELINK = lambda prefix, params: received.append(
+            params)
+        self.client.dataReceived(':nick!user@host PRIVMSG #chan :hello\r\n')
+        self.client.dataReceived(':server 200 nick :Link\r\n')
+        self.assertEqual(received, [['#chan', 'hello'], ['nick', 'Link']])
+        self.assertEqual(self.client.handled, [])
+
+
+    def test_instanceHandlerAfterDispatch(self):
+        """
+        A handler set on the instance after commands have been dispatched
+        wins over the handler of the class once
+        L{IRCClient._commandHandlers} is reset.
+        """
+        self.client.dataReceived(':nick!user@host PRIVMSG #chan :first\r\n')
+        received = []
+        self.client.irc_PRIVMSG = lambda prefix, params: received.append(
+            params)
+        self.client._commandHandlers = None
+        self.client.dataReceived(':nick!user@host PRIVMSG #chan :second\r\n')
+        self.assertEqual(received, [['#chan', 'second']])
+        self.assertEqual(
+            self.client.handled,
+            [('PRIVMSG', 'nick!user@host', ['#chan', 'first'])])
+
+
+    def test_handleCommandGetsSymbolicNames(self):
+        """
+        L{IRCClient.lineReceived} gives numerics to
+        L{IRCClient.handleCommand} by their symbolic name, if they have one.
+        """
+        commands = []
+        self.client.handleCommand = (
+            lambda command, prefix, params: commands.append(command))
+        self.client.dataReceived(':server 001 nick :Welcome\r\n')
+        self.client.dataReceived(':server 999 nick :Unknown\r\n')
+        self.assertEqual(commands, ['RPL_WELCOME', '999'])
+
+
+    def test_numericsWithoutOverride(self):
+        """
+        Without an overridden L{IRCClient.handleCommand}, numerics are
+        dispatched as they are to the handler of their symbolic name, and
+        get to L{IRCClient.irc_unknown} by it every time.
+        """
+        unknown = []
+        self.client.irc_unknown = (
+            lambda prefix, command, params: unknown.append(command))
+        self.client.dataReceived(':server 001 nick :Welcome\r\n')
+        self.client.dataReceived(':server 200 nick :Link\r\n')
+        self.client.dataReceived(':server 200 nick :Link\r\n')
+        self.assertFalse(self.client._symbolicCommands)
+        self.assertEqual(
+            self.client.handled,
+            [('RPL_WELCOME', 'server', ['nick', 'Welcome'])])
+        self.assertEqual(unknown, ['RPL_TRACELINK', 'RPL_TRACELINK'])
+
+
+    def test_tablePerClass(self):
+        """
+        Each class keeps its own table, a subclass doesn't use the table of
+        its base class.
+        """
+        base = IRCClientWithoutLogin()
+        base.makeConnection(StringTransport())
+        base.dataReceived(':nick!user@host PRIVMSG #chan :hello\r\n')
+        self.client.dataReceived(':nick!user@host PRIVMSG #chan :hello\r\n')
+
+        self.assertIn('_dispatchTables', IRCClientWithoutLogin.__dict__)
+        self.assertIn('_dispatchTables', DispatchingClient.__dict__)
+        self.assertEqual(
+            DispatchingClient._dispatchTables['irc']['PRIVMSG'][0],
+            'irc_PRIVMSG')
+        self.assertEqual(len(self.client.handled), 1)
+
+
+
+class ClientMessageTests(IRCTestCase):
+    """
+    Tests for the messages L{IRCClient.lineReceived} gives to its handlers.
+    """
+    def setUp(self):
+        self.client = DispatchingClient()
+        self.client.makeConnection(StringTransport())
+
+
+    def test_currentMessage(self):
+        """
+        L{IRCClient.currentMessage} is the message being dispatched, tags
+        included, and L{None} afterwards.
+        """
+        seen = []
+        self.client.irc_PRIVMSG = lambda prefix, params: seen.append(
+            self.client.currentMessage)
+        self.client.dataReceived(
+            '@time=2026-01-01T00:00:00.000Z :nick!user@host PRIVMSG #c :hi\r\n')
+        self.assertEqual(
+            seen,
+            [irc.IRCMessage('PRIVMSG', ['#c', 'hi'], 'nick!user@host',
+                            {'time': '2026-01-01T00:00:00.000Z'})])
+        self.assertIsNone(self.client.currentMessage)
+
+
+    def test_lowDequote(self):
+        """
+        Low-level quoting is undone before the message is parsed.
+        """
+        self.client.dataReceived(
+            ':nick!user@host PRIVMSG #c :a' + irc.M_QUOTE + 'nb\r\n')
+        self.assertEqual(
+            self.client.handled,
+            [('PRIVMSG', 'nick!user@host', ['#c', 'a\nb'])])
+
+
+    def test_badMessage(self):
+        """
+        Lines without a command go to L{IRCClient.badMessage}.
+        """
+        bad = []
+        self.client.badMessage = lambda line, *excInfo: bad.append(line)
+        self.client.dataReceived(':prefix\r\n')
+        self.assertEqual(bad, [':prefix'])
+        self.assertEqual(self.client.handled, [])
+
+
+
+class CapabilityClient(IRCClient):
+    """
+    A client that negotiates IRCv3 capabilities and records what it is told
+    about them and about batches.
+    """
+    nickname = 'nick'
+    capabilities = ['multi-prefix', 'server-time', 'batch']
+    heartbeatInterval = None
+
+    def __init__(self):
+        self.events = []
+
+
+    def capabilitiesChanged(self, added, removed):
+        self.events.append(('changed', added, removed))
+
+
+    def batchStarted(self, reference, batchType, params):
+        self.events.append(('started', reference, batchType, params))
+
+
+    def batchEnded(self, reference, batchType, params):
+        self.events.append(('ended', reference, batchType, params))
+
+
+    def privmsg(self, user, channel, message):
+        self.events.append(
+            ('privmsg', message, self.currentMessage.tags.get('batch'),
+             self.serverTime()))
+
+
+
+class CapabilityNegotiationTests(IRCTestCase):
+    """
+    Tests for the IRCv3 capability negotiation of L{IRCClient}.
+    """
+    def setUp(self):
+        self.transport = StringTransport()
+        self.client = CapabilityClient()
+        self.client.makeConnection(self.transport)
+
+
+    def sentLines(self):
+        """
+        Return the lines sent since the last call, and forget them.
+        """
+        lines = self.transport.value()
+        if bytes != str and isinstance(lines, bytes):
+            lines = lines.decode("utf-8")
+        self.transport.clear()
+        return lines.split('\r\n')[:-1]
+
+
+    def test_negotiationBeforeRegistration(self):
+        """
+        The capabilities are asked for before registering.
+        """
+        self.assertEqual(
+            self.sentLines(),
+            ['CAP LS 302', 'NICK nick', 'USER nick foo bar :None'])
+
+
+    def test_noCapabilities(self):
+        """
+        Without L{IRCClient.capabilities} nothing is negotiated.
+        """
+        transport = StringTransport()
+        client = IRCClient()
+        client.makeConnection(transport)
+        self.assertNotIn(b'CAP', transport.value())
+
+
+    def test_requestOffered(self):
+        """
+        The wanted capabilities that the server offers are requested, the
+        offered ones are kept with their values.
+        """
+        self.sentLines()
+        self.client.dataReceived(
+            ':server CAP * LS :multi-prefix sasl=PLAIN,EXTERNAL batch\r\n')
+        self.assertEqual(self.sentLines(), ['CAP REQ :multi-prefix batch'])
+        self.assertEqual(
+            self.client.serverCapabilities,
+            {'multi-prefix': '', 'sasl': 'PLAIN,EXTERNAL', 'batch': ''})
+
+
+    def test_listInSeveralLines(self):
+        """
+        Nothing is requested until the last line of the list arrives.
+        """
+        self.sentLines()
+        self.client.dataReceived(':server CAP * LS * :multi-prefix\r\n')
+        self.assertEqual(self.sentLines(), [])
+        self.client.dataReceived(':server CAP * LS :server-time\r\n')
+        self.assertEqual(
+            self.sentLines(), ['CAP REQ :multi-prefix server-time'])
+
+
+    def test_acknowledged(self):
+        """
+        Acknowledged capabilities are enabled and the negotiation ends.
+        """
+        self.client.dataReceived(':server CAP * LS :batch server-time\r\n')
+        self.sentLines()
+        self.client.dataReceived(
+            ':server CAP nick ACK :server-time batch\r\n')
+        self.assertEqual(self.sentLines(), ['CAP END'])
+        self.assertEqual(self.client.enabledCapabilities,
+                         set(['server-time', 'batch']))
+        self.assertEqual(self.client.events,
+                         [('changed', ['server-time', 'batch'], [])])
+
+
+    def test_refused(self):
+        """
+        The negotiation ends when the request is refused.
+        """
+        self.client.dataReceived(':server CAP * LS :batch\r\n')
+        self.sentLines()
+        self.client.dataReceived(':server CAP nick NAK :batch\r\n')
+        self.assertEqual(self.sentLines(), ['CAP END'])
+        self.assertEqual(self.client.enabledCapabilities, set())
+
+
+    def test_nothingWanted(self):
+        """
+        The negotiation ends at once when nothing wanted is offered.
+        """
+        self.sentLines()
+        self.client.dataReceived(':server CAP * LS :sasl\r\n')
+        self.assertEqual(self.sentLines(), ['CAP END'])
+
+
+    def test_newAndRemoved(self):
+        """
+        After registration, new capabilities are requested without ending
+        the negotiation again, and removed ones are disabled.
+        """
+        self.client.dataReceived(':server CAP * LS :server-time\r\n')
+        self.client.dataReceived(':server CAP nick ACK :server-time\r\n')
+        self.client.dataReceived(':server 001 nick :Welcome\r\n')
+        self.sentLines()
+
+        self.client.dataReceived(':server CAP nick NEW :batch\r\n')
+        self.client.dataReceived(':server CAP nick ACK :batch\r\n')
+        self.client.dataReceived(':server CAP nick DEL :server-time\r\n')
+        self.assertEqual(self.sentLines(), ['CAP REQ :batch'])
+        self.assertEqual(self.client.enabledCapabilities, set(['batch']))
+        self.assertEqual(self.client.events[1:],
+                         [('changed', ['batch'], []),
+                          ('changed', [], ['server-time'])])
+
+
+    def test_batch(self):
+        """
+        The messages of a batch are dispatched between L{batchStarted} and
+        L{batchEnded}, with their batch and time tags.
+        """
+        self.client.dataReceived(
+            ':server BATCH +abc chathistory #chan\r\n'
+            '@batch=abc;time=2026-01-01T00:00:01.500Z '
+            ':other!user@host PRIVMSG #chan :missed\r\n'
+            ':server BATCH -abc\r\n'
+            ':server BATCH -unknown\r\n')
+        self.assertEqual(
+            self.client.events,
+            [('started', 'abc', 'chathistory', ['#chan']),
+             ('privmsg', 'missed', 'abc', 1767225601.5),
+             ('ended', 'abc', 'chathistory', ['#chan'])])
+
+
+    def test_chathistory(self):
+        """
+        L{IRCClient.chathistory} asks for no more messages than the server
+        allows.
+        """
+        self.sentLines()
+        self.client.chathistory('#chan', 'timestamp=2026-01-01T00:00:00.000Z')
+        self.client.supported.parse(['CHATHISTORY=50'])
+        self.client.chathistory('#chan', limit=200, subcommand='BEFORE')
+        self.assertEqual(
+            self.sentLines(),
+            ['CHATHISTORY LATEST #chan timestamp=2026-01-01T00:00:00.000Z 100',
+             'CHATHISTORY BEFORE #chan * 50'])
+
+
+
+class ServerTimeTests(IRCTestCase):
+    """
+    Tests for L{irc.parseServerTime} and L{irc.formatServerTime}.
+    """
+    def test_parse(self):
+        """
+        Times are converted to seconds since the epoch, in UTC.
+        """
+        self.assertEqual(irc.parseServerTime('2026-01-01T00:00:01.500Z'),
+                         1767225601.5)
+        self.assertEqual(irc.parseServerTime('1970-01-01T00:01:00Z'), 60.0)
+
+
+    def test_invalid(self):
+        """
+        L{ValueError} is raised for values that aren't times.
+        """
+        self.assertRaises(ValueError, irc.parseServerTime, 'yesterday')
+        self.assertRaises(ValueError, irc.parseServerTime,
+                          '2026-01-01T00:00:01.xZ')
+
+
+    def test_format(self):
+        """
+        L{irc.formatServerTime} is the reverse of L{irc.parseServerTime}.
+        """
+        self.assertEqual(irc.formatServerTime(1767225601.5),
+                         '2026-01-01T00:00:01.500Z')
+        self.assertEqual(
+            irc.parseServerTime(irc.formatServerTime(1767225601.25)),
+            1767225601.25)
+
+
+
 class CollectorClient(irc.IRCClient):
     """
     A client that saves in a list the names of the methods that got called.
@@ -19,9 +19,13 @@
 # Boston, MA 02111-1307, USA.
 
 import re
+import string
+
+URL_PATTERN = 'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
+
 
 def get_urls(text):
-    return re.findall('http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', text)
+    return re.findall(URL_PATTERN, text)
 
 
 def parse_irc(msg, server):
@@ -53,17 +57,28 @@ def parse_irc(msg, server):
     #       as far as we've tested, which seems to be the goal
 
 
-def beep():
-    print "\a"
+# RFC 1459 casemapping: []\^ are the uppercase of {}|~
+_UPPERCASE = string.ascii_uppercase + "[]\\^"
+_LOWERCASE = string.ascii_lowercase + "{}|~"
+_BYTES_LOWER = string.maketrans(_UPPERCASE, _LOWERCASE)
+_UNICODE_LOWER = dict((ord(upper), ord(lower)) for upper, lower in zip(_UPPERCASE, _LOWERCASE))
+
+
+def irc_lower(nickname):
+    if isinstance(nickname, bytes):
+        return nickname.translate(_BYTES_LOWER)
 
+    return nickname.translate(_UNICODE_LOWER)
 
-def remove_usertypes(nicknames):
-    newnicks = []
-    for x in range(0, len(nicknames)):
-        if "@" in nicknames[x]:
-            newnicks.append(nicknames[x].split("@")[0])
 
-        else:
-            newnicks.append(nicknames[x])
+def to_unicode(text):
+    # Gtk counts characters, not bytes
+    if isinstance(text, bytes):
+        return text.decode("utf-8", "replace")
+
+    return text
+
+
+def beep():
+    print "\a"
 
-    return newnicks